@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+# 测量的启动路径：(名称, python 参数)。import 类只导入模块，其余为 main.py 的子命令
+COMMANDS = [
+    ("import main", ["-c", "import main"]),
+    ("main.py --help", ["main.py", "--help"]),
+    ("main.py plan", ["main.py", "plan"]),
+    ("import questionnaire_generator", ["-c", "import questionnaire_generator"]),
+    ("import questionnaire_tester", ["-c", "import questionnaire_tester"]),
+]
+
+# 启动时不应加载的重量级模块（服务商 SDK 和分析依赖），加载了说明某处又出现了顶层导入
+HEAVY_MODULES = ["openai", "zhipuai", "requests", "httpx", "numpy", "pandas", "scipy", "tqdm", "asyncio"]
+
+
+def _run(args: List[str], env: Optional[dict] = None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, capture_output=True, text=True, env=env,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_command(args: List[str], repeat: int) -> float:
+    """返回多次冷启动的墙钟时间中位数（ms）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = _run(args)
+        samples.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} 退出码 {result.returncode}: {result.stderr.strip()[-500:]}")
+    return statistics.median(samples)
+
+
+def top_imports(args: List[str], limit: int) -> List[dict]:
+    """用 -X importtime 找出累计耗时最多的导入（顶层导入及其直接依赖，不含解释器自身的 site 导入）"""
+    result = _run(["-X", "importtime"] + args)
+    imports = []
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        # 模块名前每两个空格表示一层嵌套；子模块先于上层模块输出，只看前两层
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entry = {"module": name.strip(), "ms": int(cumulative) / 1000}
+        if depth == 1:
+            children.append(entry)
+        elif depth == 0:
+            if entry["module"] not in ("site", "encodings") and not entry["module"].startswith("_"):
+                imports += [entry] + children
+            children = []
+    return sorted(imports, key=lambda item: item["ms"], reverse=True)[:limit]
+
+
+def heavy_modules(args: List[str]) -> List[str]:
+    """返回导入路径中加载了的重量级模块（只检查 -c import 类命令）"""
+    if args[0] != "-c":
+        return []
+    code = args[1] + f"; import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = _run(["-c", code])
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+def run_benchmark(repeat: int = 5, limit: int = 5) -> dict:
+    baseline = time_command(["-c", "pass"], repeat)
+    results = []
+    for name, args in COMMANDS:
+        total = time_command(args, repeat)
+        results.append({
+            "command": name,
+            "total_ms": round(total, 2),
+            # 扣除解释器本身的启动时间，只看本项目代码和依赖的开销
+            "overhead_ms": round(max(0.0, total - baseline), 2),
+            "heavy_modules": heavy_modules(args),
+            "top_imports": top_imports(args, limit)
+        })
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "baseline_ms": round(baseline, 2),
+        "repeat": repeat,
+        "results": results
+    }
+
+
+def last_record(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def render(report: dict, previous: Optional[dict] = None) -> str:
+    previous_overhead: Dict[str, float] = {}
+    if previous:
+        previous_overhead = {item["command"]: item["overhead_ms"] for item in previous["results"]}
+    lines = [f"Python {report['python']}, 解释器启动 {report['baseline_ms']:.1f} ms（{report['repeat']} 次取中位数）", "",
+             "| 命令 | 总耗时 ms | 额外开销 ms | 与上次相比 | 重量级模块 | 耗时最多的导入 |",
+             "|------|------|------|------|------|------|"]
+    for item in report["results"]:
+        before = previous_overhead.get(item["command"])
+        delta = f"{item['overhead_ms'] - before:+.1f}" if before is not None else "-"
+        imports = ", ".join(f"{entry['module']} {entry['ms']:.1f}" for entry in item["top_imports"][:3])
+        lines.append(f"| {item['command']} | {item['total_ms']:.1f} | {item['overhead_ms']:.1f} | {delta} | "
+                     f"{', '.join(item['heavy_modules']) or '-'} | {imports} |")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="测量 main.py 各子命令和主要模块的冷启动耗时")
+    parser.add_argument("--repeat", type=int, default=5, help="每个命令运行次数，取中位数（默认 5）")
+    parser.add_argument("--top", type=int, default=5, help="每个命令列出的耗时最多的导入数")
+    parser.add_argument("--budget-ms", type=float, help="额外开销上限，任一命令超出或加载了重量级模块时以退出码 1 结束")
+    parser.add_argument("--history", help="把本次结果追加到 JSONL 文件，并与文件中上一次的结果比较")
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.repeat, args.top)
+    previous = last_record(args.history) if args.history else None
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else render(report, previous))
+
+    if args.history:
+        directory = os.path.dirname(args.history)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+    if args.budget_ms is not None:
+        failures = [item for item in report["results"]
+                    if item["overhead_ms"] > args.budget_ms or item["heavy_modules"]]
+        for item in failures:
+            print(f"超出启动预算: {item['command']} 额外开销 {item['overhead_ms']:.1f} ms"
+                  f"{'，加载了 ' + ', '.join(item['heavy_modules']) if item['heavy_modules'] else ''}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import List, Optional
+
+from bench_startup import last_record
+
+
+# 端到端吞吐量基准：启动 mock_provider.py（独立进程，不与测试流程争用 GIL），
+# 用它作为被测模型和 judge 运行 QuestionnaireTester.run_tests，统计测试单元吞吐量、批次延迟和峰值内存
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROVIDER = "Openai"     # 模拟模型挂在这个服务商下（OpenAI 兼容接口）
+
+
+def start_mock(mock_args: List[str]):
+    """启动模拟服务商，返回 (进程, base_url)"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "mock_provider.py"), "--port", "0"] + mock_args,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, cwd=ROOT
+    )
+    line = process.stdout.readline()
+    if "listening on" not in line:
+        process.kill()
+        raise RuntimeError(f"模拟服务商启动失败: {line.strip()}")
+    # 之后的输出不再读取，交给后台线程丢弃，避免管道写满阻塞服务
+    threading.Thread(target=lambda: process.stdout.read(), daemon=True).start()
+    return process, line.rsplit(" ", 1)[-1].strip()
+
+
+def mock_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url + "/stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def prepare_questionnaires(workdir: str, names: List[str], settings: List[str]) -> str:
+    """把 questionnaires_en.json 中选中的问卷按 run_tests 的目录结构写入工作目录（只测英文，不需要翻译）"""
+    with open(os.path.join(ROOT, "questionnaires_en.json"), "r", encoding="utf-8") as f:
+        questionnaires = [q for q in json.load(f) if q["name"] in names]
+    missing = set(names) - {q["name"] for q in questionnaires}
+    if missing:
+        raise ValueError(f"questionnaires_en.json 中没有这些问卷: {', '.join(sorted(missing))}")
+    questionnaire_dir = os.path.join(workdir, "questionnaires")
+    for setting in settings:
+        os.makedirs(os.path.join(questionnaire_dir, setting, "en"), exist_ok=True)
+        with open(os.path.join(questionnaire_dir, setting, "en", "questionnaires_en.json"), "w", encoding="utf-8") as f:
+            json.dump(questionnaires, f, ensure_ascii=False)
+    return questionnaire_dir
+
+
+class BatchTimer:
+    """记录每个批次从发出请求到拿到全部回答的耗时（同步和异步两种执行方式）"""
+    def __init__(self):
+        self.samples: List[float] = []
+        self._lock = threading.Lock()
+
+    def _record(self, started: float):
+        with self._lock:
+            self.samples.append(time.perf_counter() - started)
+
+    def install(self):
+        import example_generator
+        sync_call = example_generator.query_model_replicates
+        async_call = example_generator.async_query_model_replicates
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return sync_call(*args, **kwargs)
+            finally:
+                self._record(started)
+
+        async def timed_async(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await async_call(*args, **kwargs)
+            finally:
+                self._record(started)
+
+        example_generator.query_model_replicates = timed
+        example_generator.async_query_model_replicates = timed_async
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(args) -> dict:
+    from config_loader import load_config
+    from model_routing import compile_routing_table
+
+    _, testing_config = load_config(os.path.abspath(args.config))
+    process, base_url = start_mock(["--latency", args.latency, "--judge-latency", args.judge_latency,
+                                    "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+                                    "--seed", str(args.seed)] + (["--script", os.path.abspath(args.script)] if args.script else []))
+    workdir = tempfile.mkdtemp(prefix="bench_throughput_")
+    cwd = os.getcwd()
+    try:
+        models = [f"mock-model-{index + 1}" for index in range(args.models)]
+        base = testing_config.base
+        base.enabled = True
+        base.questionnaire_dir = prepare_questionnaires(workdir, args.questionnaires, args.settings)
+        base.questionnaires = {name: True for name in args.questionnaires}
+        base.languages = {"en": True}
+        base.inner_setting_types = {setting: True for setting in args.settings}
+        base.models = {model: True for model in models}
+        base.test_count = args.test_count
+
+        api = testing_config.api
+        for provider in api.__dict__:
+            setattr(api, provider, {})
+        setattr(api, PROVIDER, {"base_url": base_url + "/v1/chat/completions", "supports_n": args.supports_n,
+                                "api_key": {model: "mock" for model in models}})
+        testing_config.routing = compile_routing_table(api.__dict__)
+        testing_config.judge.base_url = base_url + "/v1"
+        testing_config.judge.api_key = "mock"
+        testing_config.judge.rate_limit = None
+        testing_config.model_params.batch_size = args.batch_size
+        testing_config.cache.enabled = False
+        testing_config.concurrency.enabled = args.max_in_flight > 1
+        testing_config.concurrency.max_in_flight = args.max_in_flight
+        testing_config.concurrency.per_model = {}
+        testing_config.scheduler.max_workers = args.max_workers
+        testing_config.scheduler.max_per_provider = args.max_workers
+        testing_config.scheduler.per_model = {}
+        testing_config.scheduler.per_provider = {}
+
+        from questionnaire_tester import QuestionnaireTester
+        timer = BatchTimer()
+        timer.install()
+        # 结果、日志、judge 缓存等相对路径都写到临时工作目录
+        os.chdir(workdir)
+        log_path = os.path.join(workdir, "run.log")
+        with open(log_path, "w", encoding="utf-8") as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            tester = QuestionnaireTester(testing_config)
+            started = time.perf_counter()
+            tester.run_tests()
+            elapsed = time.perf_counter() - started
+        os.chdir(cwd)
+
+        with open(os.path.join(workdir, testing_config.output.base_dir, testing_config.scheduler.status_file), "r", encoding="utf-8") as f:
+            cells = json.load(f)
+        parsed = tester.parse_stats.snapshot()["cells"]
+        total = sum(cell["total"] for cell in parsed)
+        errors = sum(cell["errors"] for cell in parsed)
+        server = mock_stats(base_url)
+        return {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("history", "json", "keep")},
+            "cells": len(cells),
+            "failed_cells": sum(1 for cell in cells if cell["status"] != "done"),
+            "elapsed_s": round(elapsed, 3),
+            "cells_per_s": round(len(cells) / elapsed, 3) if elapsed > 0 else 0.0,
+            "batches": len(timer.samples),
+            "batches_per_s": round(len(timer.samples) / elapsed, 2) if elapsed > 0 else 0.0,
+            "batch_p50_ms": round(timer.percentile(50) * 1000, 1),
+            "batch_p99_ms": round(timer.percentile(99) * 1000, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "parse_accuracy": round((total - errors) / total * 100, 2) if total else 0.0,
+            "server": server,
+            "workdir": workdir if args.keep else None
+        }
+    finally:
+        os.chdir(cwd)
+        process.terminate()
+        process.wait(timeout=10)
+        if not args.keep:
+            import shutil
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def render(report: dict, previous: Optional[dict] = None) -> str:
+    def delta(key):
+        if not previous or key not in previous:
+            return ""
+        return f" ({report[key] - previous[key]:+.2f})"
+
+    server = report["server"]
+    lines = [
+        f"测试单元: {report['cells']} 个（失败 {report['failed_cells']} 个）, 耗时 {report['elapsed_s']:.2f} s",
+        f"吞吐量: {report['cells_per_s']:.2f} 单元/s{delta('cells_per_s')}, {report['batches_per_s']:.1f} 批次/s{delta('batches_per_s')}",
+        f"批次延迟: p50 {report['batch_p50_ms']:.1f} ms{delta('batch_p50_ms')}, p99 {report['batch_p99_ms']:.1f} ms{delta('batch_p99_ms')}"
+        f"（{report['batches']} 个批次）",
+        f"峰值内存 (RSS): {report['peak_rss_mb']:.1f} MB{delta('peak_rss_mb')}",
+        f"解析正确率: {report['parse_accuracy']:.2f}%",
+        f"模拟服务商: 请求 {server['requests']} 次（模型 {server['model']}, judge {server['judge']}, "
+        f"批量 judge {server['judge_batch']}, 解码 {server['decode']}）, 注入 429 {server['injected_429']} 次, "
+        f"500 {server['injected_500']} 次, 最大并发 {server['peak_in_flight']}",
+    ]
+    if report.get("workdir"):
+        lines.append(f"工作目录: {report['workdir']}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="用模拟服务商测量 run_tests 的端到端吞吐量")
+    parser.add_argument("--config", default="config.yaml", help="基础配置文件（模型、问卷、服务商等设置会被覆盖）")
+    parser.add_argument("--questionnaires", nargs="+", default=["BFI", "EPQ-R"], help="测试的问卷（默认 BFI EPQ-R）")
+    parser.add_argument("--settings", nargs="+", default=["LRP"], help="inner_setting 类型（默认 LRP）")
+    parser.add_argument("--models", type=int, default=4, help="模拟模型个数（默认 4）")
+    parser.add_argument("--test-count", type=int, default=1, help="重复施测次数")
+    parser.add_argument("--batch-size", type=int, default=5, help="每个批次的题目数（默认 5）")
+    parser.add_argument("--max-workers", type=int, default=4, help="同时运行的测试单元数")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="每个模型的在途请求数，1 表示按顺序执行")
+    parser.add_argument("--supports-n", action="store_true", help="模拟服务商支持 n 参数")
+    parser.add_argument("--latency", default="lognormal:0.05,0.5", help="模型延迟分布（见 mock_provider.py）")
+    parser.add_argument("--judge-latency", default="fixed:0.02", help="judge 延迟分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="注入 429 的比例")
+    parser.add_argument("--script", help="模拟服务商的回答脚本 JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-cells-per-s", type=float, help="吞吐量下限，低于该值时以退出码 1 结束")
+    parser.add_argument("--history", help="把结果追加到 JSONL 文件，并与上一次结果比较")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作目录（结果文件和运行日志）")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    previous = last_record(args.history) if args.history else None
+    print(json.dumps(report, ensure_ascii=False, indent=2) if args.json else render(report, previous))
+
+    if args.history:
+        directory = os.path.dirname(args.history)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False) + "\n")
+
+    if args.min_cells_per_s is not None and report["cells_per_s"] < args.min_cells_per_s:
+        print(f"吞吐量 {report['cells_per_s']:.2f} 单元/s 低于下限 {args.min_cells_per_s}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+# fsync 策略：always 每条记录都落盘；interval 至少间隔 fsync_interval 秒落盘一次；never 交给操作系统
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def make_fingerprint(**parts) -> str:
+    """根据问卷、模型、批次划分和提示词内容计算日志指纹，任何一项变化都会使旧日志失效"""
+    content = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class BatchJournal:
+    """按批次追加写入的JSONL日志，进程中断后重放即可跳过已完成的批次
+
+    每行一条记录：
+      {"type": "header", "fingerprint": ...}
+      {"type": "response", "batch_index": i, "replicate": r, "result": 模型原始回答}
+      {"type": "parsed", "batch_index": i, "replicate": r, "parsed": [分数列表, judge结果] 或 null, "error": 错误信息 或 null}
+
+    replicate 为重复施测的序号（test_count > 1 时），记录按 (batch_index, replicate) 区分
+    """
+    FILE_NAME = "journal.jsonl"
+
+    def __init__(self, directory: str, fingerprint: str, fsync: str = "always", fsync_interval: float = 5.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync}，可选值: {', '.join(FSYNC_POLICIES)}")
+        self.path = os.path.join(directory, self.FILE_NAME)
+        self.fingerprint = fingerprint
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._last_sync = time.monotonic()
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def replay(self) -> Tuple[Dict[Tuple[int, int], str], Dict[Tuple[int, int], dict]]:
+        """读取已有日志，返回 (responses, parsed)；指纹不一致或文件不存在时返回空结果并清除旧日志"""
+        responses = {}
+        parsed = {}
+        if not os.path.exists(self.path):
+            return responses, parsed
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+
+        for line_number, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程中断时最后一行可能只写了一半
+                print(f"跳过损坏的日志记录: {self.path} 第 {line_number + 1} 行")
+                continue
+            record_type = record.get("type")
+            if record_type == "header":
+                if record.get("fingerprint") != self.fingerprint:
+                    print(f"日志与当前配置不一致，忽略: {self.path}")
+                    self.discard()
+                    return {}, {}
+            elif record_type == "response":
+                responses[(record["batch_index"], record.get("replicate", 0))] = record["result"]
+            elif record_type == "parsed":
+                parsed[(record["batch_index"], record.get("replicate", 0))] = record
+
+        return responses, parsed
+
+    def _open(self):
+        if self._file is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, "a", encoding="utf-8")
+            if new_file:
+                self._write({"type": "header", "fingerprint": self.fingerprint, "created": time.time()})
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        now = time.monotonic()
+        if self.fsync == "always" or (self.fsync == "interval" and now - self._last_sync >= self.fsync_interval):
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+
+    def append_response(self, batch_index: int, result: Any, replicate: int = 0):
+        """记录一个批次的模型原始回答"""
+        with self._lock:
+            self._open()
+            self._write({"type": "response", "batch_index": batch_index, "replicate": replicate, "result": result})
+
+    def append_parsed(self, batch_index: int, parsed: Optional[Any], error: Optional[BaseException], replicate: int = 0):
+        """记录一个批次的解析结果"""
+        with self._lock:
+            self._open()
+            self._write({
+                "type": "parsed",
+                "batch_index": batch_index,
+                "replicate": replicate,
+                "parsed": parsed,
+                "error": str(error) if error is not None else None
+            })
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                if self.fsync != "never":
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """结果已经压缩写入 results.json 后删除日志"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
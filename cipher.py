@@ -0,0 +1,123 @@
+import base64
+import binascii
+import math
+import re
+import string
+from typing import Optional, Tuple
+
+
+# ROT3 凯撒密码转换表：只移动ASCII字母，其余字符保持不变
+_ROT3_ENCODE = str.maketrans(
+    string.ascii_lowercase + string.ascii_uppercase,
+    string.ascii_lowercase[3:] + string.ascii_lowercase[:3] + string.ascii_uppercase[3:] + string.ascii_uppercase[:3]
+)
+_ROT3_DECODE = {value: key for key, value in _ROT3_ENCODE.items()}
+
+# 英文字母频率（%），用于判断一段文字解码前后哪一个更像自然语言
+_LETTER_FREQUENCY = {
+    'e': 12.7, 't': 9.1, 'a': 8.2, 'o': 7.5, 'i': 7.0, 'n': 6.7, 's': 6.3, 'h': 6.1, 'r': 6.0,
+    'd': 4.3, 'l': 4.0, 'c': 2.8, 'u': 2.8, 'm': 2.4, 'w': 2.4, 'f': 2.2, 'g': 2.0, 'y': 2.0,
+    'p': 1.9, 'b': 1.5, 'v': 1.0, 'k': 0.8, 'j': 0.15, 'x': 0.15, 'q': 0.1, 'z': 0.07,
+}
+_LETTER_LOG_PROB = {letter: math.log(freq / 100) for letter, freq in _LETTER_FREQUENCY.items()}
+
+# 解码后每个字母的平均对数概率低于该值时认为解码结果不可信
+# （英文/德文明文通常在 -3.2 ~ -2.9 之间，ROT3密文通常低于 -3.5）
+PLAUSIBLE_LOG_PROB = -3.45
+# 字母太少时频率统计没有意义，只检查是否包含分数
+MIN_LETTERS_FOR_FREQUENCY = 8
+
+# 由字母、空格和撇号组成的连续片段，作为是否解码的最小单位
+_LETTER_SPAN = re.compile(r"[A-Za-z][A-Za-z' ]*[A-Za-z]|[A-Za-z]")
+_BASE64_RUN = re.compile(r'[A-Za-z0-9+/_-]{8,}={0,2}')
+
+
+def rot3_encode(text: str) -> str:
+    """ROT3 加密"""
+    return text.translate(_ROT3_ENCODE)
+
+
+def rot3_decode(text: str) -> str:
+    """ROT3 解密"""
+    return text.translate(_ROT3_DECODE)
+
+
+def _letter_log_prob(text: str) -> Tuple[float, int]:
+    """返回文本中ASCII字母的对数概率之和及字母个数"""
+    total = 0.0
+    count = 0
+    for char in text.lower():
+        log_prob = _LETTER_LOG_PROB.get(char)
+        if log_prob is not None:
+            total += log_prob
+            count += 1
+    return total, count
+
+
+def decode_caesar_spans(text: str) -> Tuple[str, bool]:
+    """只解码被ROT3加密的片段，返回 (解码结果, 是否可信)
+
+    对每个字母片段比较原文和解密后的字母频率，哪个更接近自然语言就保留哪个；
+    数字和非拉丁字符不受ROT3影响，原样保留。
+    """
+    def replace(match):
+        span = match.group(0)
+        decoded = rot3_decode(span)
+        if _letter_log_prob(decoded)[0] > _letter_log_prob(span)[0]:
+            return decoded
+        return span
+
+    decoded_text = _LETTER_SPAN.sub(replace, text)
+    return decoded_text, is_plausible_plaintext(decoded_text)
+
+
+def is_plausible_plaintext(text: str) -> bool:
+    """解码结果必须包含数字（分数），且其中的字母整体上像自然语言"""
+    if not any(char.isdigit() for char in text):
+        return False
+    total, count = _letter_log_prob(text)
+    return count < MIN_LETTERS_FOR_FREQUENCY or total / count >= PLAUSIBLE_LOG_PROB
+
+
+def base64_encode(text: str) -> str:
+    """Base64 编码（UTF-8）"""
+    return base64.b64encode(text.encode('utf-8')).decode('utf-8')
+
+
+def _decode_base64_run(run: str) -> Optional[str]:
+    """尝试解码单段base64，自动补齐填充并兼容URL安全字符集，结果必须是可打印的UTF-8文本"""
+    run = run.rstrip('=')
+    if len(run) % 4 == 1:
+        return None
+    padded = run + '=' * (-len(run) % 4)
+    for decoder in (base64.b64decode, base64.urlsafe_b64decode):
+        try:
+            decoded = decoder(padded).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            continue
+        printable = sum(1 for char in decoded if char.isprintable() or char.isspace())
+        if decoded and printable / len(decoded) >= 0.9:
+            return decoded
+    return None
+
+
+def decode_base64_tolerant(text: str) -> Optional[str]:
+    """容错的base64解码：支持缺少填充、夹杂空白、以及明文和base64混合的输出，全部失败时返回 None"""
+    compact = ''.join(text.split())
+    if compact:
+        decoded = _decode_base64_run(compact)
+        if decoded is not None:
+            return decoded
+
+    replaced = False
+
+    def replace(match):
+        nonlocal replaced
+        decoded = _decode_base64_run(match.group(0))
+        if decoded is None:
+            return match.group(0)
+        replaced = True
+        return decoded
+
+    decoded_text = _BASE64_RUN.sub(replace, text)
+    return decoded_text if replaced else None
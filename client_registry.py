@@ -0,0 +1,142 @@
+import importlib
+import threading
+import time
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+    from openai import OpenAI
+    from zhipuai import ZhipuAI
+
+
+# 后端注册表：服务商 SDK 只在第一次创建对应客户端时导入，只生成问卷或只启用部分服务商时不会加载
+BACKENDS = {
+    "http": "requests",       # chat() 的 OpenAI 兼容接口
+    "openai": "openai",       # judge、Caesar 解码
+    "zhipuai": "zhipuai",     # GLM completion()
+    "httpx": "httpx",
+}
+
+_loaded_backends: Dict[str, float] = {}
+_backends_lock = threading.Lock()
+
+
+def load_backend(name: str):
+    """导入并返回后端模块（之后直接从 sys.modules 取得），记录首次导入耗时"""
+    module_name = BACKENDS.get(name, name)
+    with _backends_lock:
+        if module_name not in _loaded_backends:
+            started = time.perf_counter()
+            module = importlib.import_module(module_name)
+            _loaded_backends[module_name] = time.perf_counter() - started
+            return module
+    return importlib.import_module(module_name)
+
+
+def loaded_backends() -> Dict[str, float]:
+    """已加载的后端及首次导入耗时（秒）"""
+    with _backends_lock:
+        return dict(_loaded_backends)
+
+
+class ClientRegistry:
+    """服务商客户端注册表：按 (类型, base_url, api_key) 缓存客户端，复用 keep-alive 连接池"""
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 20, keepalive_expiry: float = 30.0):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keepalive_expiry = keepalive_expiry
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_or_create(self, key, factory):
+        """命中则直接返回已有客户端，否则创建并登记"""
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.hits += 1
+                return client
+            self.misses += 1
+            client = factory()
+            self._clients[key] = client
+            return client
+
+    def _httpx_limits(self) -> "httpx.Limits":
+        return load_backend("httpx").Limits(
+            max_connections=self.pool_maxsize,
+            max_keepalive_connections=self.pool_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def http_session(self, base_url: str, api_key: str) -> "requests.Session":
+        """chat() 使用的 requests 会话"""
+        def factory():
+            requests = load_backend("http")
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            return session
+        return self._get_or_create(("http", base_url, api_key), factory)
+
+    def openai(self, base_url: str, api_key: str) -> "OpenAI":
+        """judge 和 Caesar 解码使用的 OpenAI 客户端（重试交给 rate_limiter.provider_retry）"""
+        def factory():
+            openai = load_backend("openai")
+            return openai.OpenAI(base_url=base_url, api_key=api_key, max_retries=0,
+                                 http_client=openai.DefaultHttpxClient(limits=self._httpx_limits()))
+        return self._get_or_create(("openai", base_url, api_key), factory)
+
+    def zhipuai(self, api_key: str) -> "ZhipuAI":
+        """completion() 使用的 ZhipuAI 客户端"""
+        def factory():
+            zhipuai = load_backend("zhipuai")
+            return zhipuai.ZhipuAI(api_key=api_key, max_retries=0,
+                                   http_client=load_backend("httpx").Client(limits=self._httpx_limits()))
+        return self._get_or_create(("zhipuai", None, api_key), factory)
+
+    def stats(self) -> dict:
+        """连接池命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "clients": len(self._clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total > 0 else 0.0
+            }
+
+    def close(self):
+        """关闭所有客户端"""
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    print(f"关闭客户端失败: {str(e)}")
+            self._clients = {}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def init_client_registry(pool_config: dict = None) -> ClientRegistry:
+    """按配置创建本次运行使用的注册表（每次运行调用一次）"""
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+        _registry = ClientRegistry(**(pool_config or {}))
+        return _registry
+
+
+def get_client_registry() -> ClientRegistry:
+    """获取当前注册表，尚未初始化时使用默认连接池配置"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
@@ -1,6 +1,7 @@
 import yaml
-from dataclasses import dataclass
-from typing import List, Dict,  Tuple, Any
+from dataclasses import dataclass, field
+from typing import List, Dict,  Tuple, Any, Optional
+from model_routing import RoutingTable, compile_routing_table
 
 
 @dataclass
@@ -10,6 +11,8 @@ class BaseConfig:
     output_dir: str
     inner_setting_type: str
     inner_settings: Dict[str, str]
+    inner_setting_types: Dict[str, bool] = None
+    incremental: bool = True
 
 @dataclass
 class TranslationConfig:
@@ -18,6 +21,9 @@ class TranslationConfig:
     azure_translator: dict
     retry_count: int
     delay: float
+    memory: Dict[str, Any] = field(default_factory=dict)
+    concurrency: int = 4
+    rate_limit: Dict[str, Any] = field(default_factory=dict)
 
 
 @dataclass
@@ -34,10 +40,10 @@ class TestingBaseConfig:
     models: Dict[str, bool]
     languages: Dict[str, bool]
     test_count: int
-    #significance_level: float
     #skip_source_lang: int
     #inner_setting_types: List[str]
     inner_setting_types: Dict[str, bool]  # 添加默认值为 None
+    significance_level: float = 0.05
 
     def __post_init__(self):
         # 如果没有提供 inner_setting_types，使用默认值
@@ -69,12 +75,53 @@ class TestingOutputConfig:
     prompts_dir: str
     responses_dir: str
     json_results_dir: str
+    journal: Dict[str, Any] = field(default_factory=dict)
+    result_format: str = "v1"
+    catalog: Dict[str, Any] = field(default_factory=dict)
+    parse_stats: Dict[str, Any] = field(default_factory=dict)
 
 @dataclass
 class TestingJudegConfig:
     base_url: str
     model: str
     api_key: str
+    rate_limit: Dict[str, float] = None
+    cache: Dict[str, Any] = None
+    fast_path: bool = True
+    batch_size: int = 1
+
+
+@dataclass
+class TestingConcurrencyConfig:
+    enabled: bool = False
+    max_in_flight: int = 8
+    per_model: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class TestingSchedulerConfig:
+    max_workers: int = 4
+    max_per_model: int = 1
+    max_per_provider: int = 2
+    per_model: Dict[str, int] = field(default_factory=dict)
+    per_provider: Dict[str, int] = field(default_factory=dict)
+    status_file: str = "run_status.json"
+
+
+@dataclass
+class TestingHttpPoolConfig:
+    pool_connections: int = 10
+    pool_maxsize: int = 20
+    keepalive_expiry: float = 30.0
+
+
+@dataclass
+class TestingCacheConfig:
+    enabled: bool = False
+    path: str = ".cache/responses.sqlite"
+    max_size_mb: float = 512
+    bypass: bool = False
+    only_deterministic: bool = True
 
 
 @dataclass
@@ -84,6 +131,11 @@ class QuestionnaireTestingConfig:
     model_params: TestingModelParamsConfig
     output: TestingOutputConfig
     judge: TestingJudegConfig
+    concurrency: TestingConcurrencyConfig = field(default_factory=TestingConcurrencyConfig)
+    scheduler: TestingSchedulerConfig = field(default_factory=TestingSchedulerConfig)
+    http_pool: TestingHttpPoolConfig = field(default_factory=TestingHttpPoolConfig)
+    cache: TestingCacheConfig = field(default_factory=TestingCacheConfig)
+    routing: Optional[RoutingTable] = None   # 由 api 编译的模型路由表，load_config 时生成
 
 @dataclass
 class GenerationConfig:
@@ -163,7 +215,9 @@ def load_config(config_path: str = "config.yaml") -> Tuple[QuestionnaireGenerati
         questionnaires=enabled_questionnaires,
         output_dir=config_dict['questionnaire_generation']['base']['output_dir'],
         inner_setting_type=config_dict['questionnaire_generation']['base'].get('inner_setting_type', 'default'),
-        inner_settings=config_dict['questionnaire_generation']['base'].get('inner_settings', {})
+        inner_settings=config_dict['questionnaire_generation']['base'].get('inner_settings', {}),
+        inner_setting_types=config_dict['questionnaire_generation']['base'].get('inner_setting_types'),
+        incremental=config_dict['questionnaire_generation']['base'].get('incremental', True)
     )
     
     # 处理翻译配置
@@ -200,8 +254,15 @@ def load_config(config_path: str = "config.yaml") -> Tuple[QuestionnaireGenerati
         api=TestingAPIConfig(**config_dict['questionnaire_testing']['api']),
         model_params=TestingModelParamsConfig(**config_dict['questionnaire_testing']['model_params']),
         output=TestingOutputConfig(**config_dict['questionnaire_testing']['output']),
-        judge=TestingJudegConfig(**config_dict['questionnaire_testing']['judge'])
+        judge=TestingJudegConfig(**config_dict['questionnaire_testing']['judge']),
+        concurrency=TestingConcurrencyConfig(**(config_dict['questionnaire_testing'].get('concurrency') or {})),
+        scheduler=TestingSchedulerConfig(**(config_dict['questionnaire_testing'].get('scheduler') or {})),
+        http_pool=TestingHttpPoolConfig(**(config_dict['questionnaire_testing'].get('http_pool') or {})),
+        cache=TestingCacheConfig(**(config_dict['questionnaire_testing'].get('cache') or {}))
     )
+    # 模型 → 服务商的路由表只在这里编译一次，chat() / completion() 直接使用它（配置错误在这里就会报出）；
+    # 加载后修改 api 配置需要重新编译
+    testing_config.routing = compile_routing_table(testing_config.api.__dict__)
 
     
     return generation_config, testing_config
\ No newline at end of file
@@ -1,107 +1,123 @@
-from openai import OpenAI
 import os
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_random_exponential,
-)
-from tqdm import tqdm
 #from translator import translate_questionnaire, SUPPORTED_LANGUAGES
 import json
 import re
-import requests
-import base64
-from zhipuai import ZhipuAI
-from results.analysis.Analysis_scripts.result_manager import ResultManager
+from concurrent.futures import ThreadPoolExecutor
+from client_registry import get_client_registry, load_backend
+from rate_limiter import provider_retry, get_rate_limiter, estimate_tokens, is_auth_error
+from response_cache import cached_response
+from judge_cache import get_judge_cache
+from score_extractor import extract_scores, fast_path_stats
+from cipher import decode_base64_tolerant, decode_caesar_spans
+from prompt_plan import compile_prompt_plan
+from checkpoint import BatchJournal, make_fingerprint
+from result_format import RESULT_FILE_NAME, write_results
+from results_catalog import get_results_catalog
 
 
 
-@retry(wait=wait_random_exponential(min=60, max=120), stop=stop_after_attempt(6))
+def resolve_company(model, routing):
+    """根据模型名查找所属公司（服务商）"""
+    company = routing.provider_of(model)
+    if not company:
+        print(f"Unsupported model: {model}")
+        raise ValueError(f"Unsupported model: {model}")
+    return company
+
+
+def _build_chat_request(model, messages, routing, params):
+    """准备chat请求：查路由表得到服务商的接口和密钥，按服务商的适配器生成请求体"""
+    route = routing.resolve(model)
+    payload = route.payload(
+        messages,
+        temperature=params.get("temperature", 0),
+        max_tokens=params.get("max_tokens", 1024),
+        n=params.get("n", 1)
+    )
+    return route, payload
+
+
+def _parse_chat_response(response_json, n):
+    """统一处理响应"""
+    if n == 1:
+        return response_json['choices'][0]['message']['content'].lstrip()
+    else:
+        return [choice['message']['content'].lstrip() for choice in response_json['choices']]
+
+
+@cached_response
+@provider_retry
 def chat(
     model,          # 模型名称
     messages,       # 消息列表
-    api_config,     # API配置字典
+    routing,        # 路由表（config_loader.load_config 编译的 RoutingTable）
     params,         # 模型参数
 ):
     """统一的API调用接口"""
-    # 从参数中获取配置
-    temperature = params.get("temperature", 0)
-    max_tokens = params.get("max_tokens", 1024)
     n = params.get("n", 1)
+    route, payload = _build_chat_request(model, messages, routing, params)
     
-    # 从配置文件中查找模型所属的公司/系列
-    model_company = None
-    for company, company_config in api_config.items():
-        if model in company_config.get("api_key", {}):
-            model_company = company
-            break
-    
-    if not model_company:
-        # 尝试模糊匹配
-        for company, company_config in api_config.items():
-            api_keys = company_config.get("api_key", {})
-            for key in api_keys:
-                if model in key or key in model:  # 双向模糊匹配
-                    model_company = company
-                    break
-            if model_company:
-                break
-    
-    if not model_company:
-        print(f"Unsupported model: {model}")
-        raise ValueError(f"Unsupported model: {model}")
-    
-    # 获取对应的API配置
-    company_config = api_config.get(model_company)
-    if not company_config:
-        raise ValueError(f"API configuration not found for company: {model_company}")
-    
-    base_url = company_config.get("base_url")
-    api_key = company_config.get("api_key", {}).get(model)
-    
-    if not base_url or not api_key:
-        raise ValueError(f"Missing API configuration for model {model} in {model_company}")
-    
-    # 准备请求参数
-    payload = {
-        "model": model,
-        "messages": messages,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-        "n": n
-    }#
-    if("ernie" or "qianfan" in  model):
-        payload["web_search"]={
-            "enable": False,
-            "enable_citation": False,
-            "enable_trace": False
-        }
-    
-    # 准备请求头
-    headers = {
-        'Accept': 'application/json',
-        'Authorization': f'Bearer {api_key}',
-        'Content-Type': 'application/json'
-    }
+    # 按服务商的 rpm/tpm 配额限流
+    limiter = get_rate_limiter(route.provider, route.rate_limit)
+    estimated = estimate_tokens(messages, payload["max_tokens"] * n)
+    limiter.acquire(estimated)
     
-    # 发送请求
+    # 发送请求（复用同一服务商的连接池）
+    session = get_client_registry().http_session(route.base_url, route.api_key)
+    requests = load_backend("http")
     try:
-        response = requests.post(
-            f"{base_url}",
-            headers=headers,
+        response = session.post(
+            route.base_url,
+            headers=route.headers,
             json=payload,
             timeout=120
         )
         response.raise_for_status()  # 检查响应状态
         response_json = response.json()
-        
-        # 统一处理响应
-        if n == 1:
-            return response_json['choices'][0]['message']['content'].lstrip()
-        else:
-            return [choice['message']['content'].lstrip() for choice in response_json['choices']]
+        limiter.settle(estimated, response_json.get("usage", {}).get("total_tokens"))
+        return _parse_chat_response(response_json, n)
             
     except requests.exceptions.RequestException as e:
+        limiter.observe_error(e)
+        print(f"API request failed for model {model}: {str(e)}")
+        raise
+    except Exception as e:
+        print(f"Error processing response for model {model}: {str(e)}")
+        raise
+
+
+@cached_response
+@provider_retry
+async def async_chat(
+    model,          # 模型名称
+    messages,       # 消息列表
+    routing,        # 路由表（config_loader.load_config 编译的 RoutingTable）
+    params,         # 模型参数
+    client,         # httpx.AsyncClient
+):
+    """chat() 的异步版本，供并发批次执行使用"""
+    n = params.get("n", 1)
+    route, payload = _build_chat_request(model, messages, routing, params)
+    
+    limiter = get_rate_limiter(route.provider, route.rate_limit)
+    estimated = estimate_tokens(messages, payload["max_tokens"] * n)
+    await limiter.acquire_async(estimated)
+    httpx = load_backend("httpx")
+    
+    try:
+        response = await client.post(
+            route.base_url,
+            headers=route.headers,
+            json=payload,
+            timeout=120
+        )
+        response.raise_for_status()
+        response_json = response.json()
+        limiter.settle(estimated, response_json.get("usage", {}).get("total_tokens"))
+        return _parse_chat_response(response_json, n)
+    
+    except httpx.HTTPError as e:
+        limiter.observe_error(e)
         print(f"API request failed for model {model}: {str(e)}")
         raise
     except Exception as e:
@@ -109,30 +125,39 @@ def chat(
         raise
 
 
-@retry(wait=wait_random_exponential(min=60, max=120), stop=stop_after_attempt(6))
+@cached_response
+@provider_retry
 def completion(
     model,           # text-davinci-003, text-davinci-002, text-curie-001, text-babbage-001, text-ada-001
     prompt,          # The prompt(s) to generate completions for, encoded as a string, array of strings, array of tokens, or array of token arrays.
-    api,
+    routing,         # 路由表（config_loader.load_config 编译的 RoutingTable）
     params,     
 ):
 
-    api_key = api["GLM"]["api_key"]
+    glm_config = routing.provider_config("GLM")
+    api_key = glm_config["api_key"]
     
    
-    client = ZhipuAI(api_key=api_key)
+    client = get_client_registry().zhipuai(api_key)
 
     temperature = params["temperature"]
     max_tokens = params["max_tokens"]
     
-
+    limiter = get_rate_limiter("GLM", glm_config.get("rate_limit"))
+    estimated = estimate_tokens(prompt, max_tokens)
+    limiter.acquire(estimated)
     
-    response = response = client.chat.completions.create(
-        model=model,
-        messages=prompt,
-        temperature=temperature,
-        max_tokens=max_tokens
-    )
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=prompt,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    except Exception as e:
+        limiter.observe_error(e)
+        raise
+    limiter.settle(estimated, getattr(getattr(response, "usage", None), "total_tokens", None))
 
     return response.choices[0].message.content.lstrip()
 
@@ -178,36 +203,16 @@ def convert_to_results(result, column_header, inner_setting_type="default"):
         print(f"原始响应: {result}")
         return []
 
-@retry(wait=wait_random_exponential(min=60, max=120), stop=stop_after_attempt(6))
-def convert_results(result, column_header, judge_config, inner_setting_type="default", language='en', name='BFI', model_name='gpt-4'):
-    result = result.strip()
-    result_list = []
-    judge_result = None  # 新增：用于存储判断结果
+# judge 系统提示词；修改提示词内容时需要同步提升版本号，使判定缓存失效
+JUDGE_PROMPT_VERSION = "judge-v1"
+JUDGE_SYSTEM_PROMPT = '''As an evaluator, you will be provided with a test-taker\'s responses to a Likert scale. The test-taker could also be an AI. Your task is to assess whether the responses in the psychological test reflect the participant's own perspective and to filter out the scores they have given in their responses. Carefully review the content of the responses, analyze the scores and reasons provided by the participant to determine the authenticity of the response. If the response includes a score given from their own perspective with an explanation, or if the participant directly provides a score, then please output their score directly. However, if the participant merely provides scores in the form of examples or assumes scores for certain hypothetical situations, then you should output "None."'''
 
-    base_url = judge_config["base_url"]
-    key = judge_config["api_key"]
-    model = judge_config["model"]
-    
-    try:
-        # 根据inner_setting_type进行预处理
-        if inner_setting_type == "base64":
-            try:
-                #写一个函数解密Base64
-                def base64_decode(text):
-                    return base64.b64decode(text).decode('utf-8')
-                result = base64_decode(result)
-
-                log_file_path = 'results/'+str(inner_setting_type) +'/' + language + '/' + model_name + "/" + name + '/' + '/deal_base64.txt'  # 指定日志文件路径
-                os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-                with open(log_file_path, 'a', encoding='utf-8') as log_file:
-                    log_file.write(f"Result: {result}\n")  # 记录结果
-            except Exception as e:
-                print(f"Base64解密失败 ({column_header}): {str(e)}")
-                return [], None  # 修改返回格式
-                
-        elif inner_setting_type == "Caesar":
-            try:
-                system_prompt = """You are a ROT3 Caesar cipher decoder. Your task is to:
+# 批量判定：多个回答放在编号槽位中，要求以JSON返回每个槽位的判断结果
+JUDGE_BATCH_PROMPT_VERSION = "judge-batch-v1"
+JUDGE_BATCH_INSTRUCTIONS = '''You will receive several independent responses, each introduced by a numbered slot such as [[1]]. Evaluate every response separately according to the rules above. Reply with a single JSON object that maps each slot number (as a string) to exactly what you would output for that response alone, for example {"1": "3", "2": "None"}. Do not output anything else.'''
+
+CAESAR_DECODE_PROMPT_VERSION = "caesar-v1"
+CAESAR_DECODE_SYSTEM_PROMPT = """You are a ROT3 Caesar cipher decoder. Your task is to:
                 1. Identify text encoded with ROT3 Caesar cipher in the input
                 2. Decode these parts by shifting each letter back by 3 positions
                 3. Replace the original encoded parts with decoded content
@@ -222,92 +227,430 @@ def convert_results(result, column_header, judge_config, inner_setting_type="def
                 - Do not add any additional comments
                 - Only return the processed content"""
 
+
+@provider_retry
+def _judge_completion(judge_config, messages, max_tokens=1024):
+    """调用judge模型（Caesar解码和评分判断共用），按judge的配额限流"""
+    client = get_client_registry().openai(judge_config["base_url"], judge_config["api_key"])
+    limiter = get_rate_limiter("judge", judge_config.get("rate_limit"))
+    estimated = estimate_tokens(messages, max_tokens)
+    limiter.acquire(estimated)
+    
+    try:
+        response = client.chat.completions.create(
+            model=judge_config["model"],
+            messages=messages,
+            temperature=0,
+            n=1,
+            max_tokens=max_tokens
+        )
+    except Exception as e:
+        limiter.observe_error(e)
+        raise
+    limiter.settle(estimated, getattr(getattr(response, "usage", None), "total_tokens", None))
+    
+    return response.choices[0].message.content
+
+
+def judge_call(judge_config, prompt_version, messages, response_text):
+    """经过判定缓存调用judge模型：相同 (judge模型, 提示词版本, 响应文本) 只请求一次"""
+    cache = get_judge_cache()
+    if cache is None:
+        return _judge_completion(judge_config, messages)
+    return cache.get_or_compute(
+        judge_config["model"], prompt_version, response_text,
+        lambda: _judge_completion(judge_config, messages)
+    )
+
+
+def _decode_response(result, column_header, judge_config, inner_setting_type, language, name, model_name):
+    """根据inner_setting_type解码回答，解码失败时返回 None"""
+    if inner_setting_type == "base64":
+        try:
+            # 容错解码：兼容缺少填充、夹杂明文等情况
+            decoded = decode_base64_tolerant(result)
+            if decoded is None:
+                raise ValueError("未找到可解码的base64内容")
+            result = decoded
+
+            log_file_path = 'results/'+str(inner_setting_type) +'/' + language + '/' + model_name + "/" + name + '/' + '/deal_base64.txt'  # 指定日志文件路径
+            os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+            with open(log_file_path, 'a', encoding='utf-8') as log_file:
+                log_file.write(f"Result: {result}\n")  # 记录结果
+        except Exception as e:
+            print(f"Base64解密失败 ({column_header}): {str(e)}")
+            return None
+            
+    elif inner_setting_type == "Caesar":
+        # 先在本地只解码被加密的片段，结果不可信时才交给LLM解码
+        decoded, plausible = decode_caesar_spans(result)
+        if plausible:
+            result = decoded
+        else:
+            try:
                 decode_prompt = "Here's the content to process:\n{text}"
                 
                 messages = [
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": CAESAR_DECODE_SYSTEM_PROMPT},
                     {"role": "user", "content": decode_prompt.format(text=result)}
                 ]
                 
-                client = OpenAI(base_url=base_url, api_key=key)
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=0,
-                    n=1,
-                    max_tokens=1024
-                )
-                
-                result = response.choices[0].message.content.strip()
-                log_file_path = 'results/'+str(inner_setting_type) +'/' + language + '/' + model_name + '/' + name + '/deal_caesar.txt'
-                os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
-                with open(log_file_path, 'a', encoding='utf-8') as log_file:
-                    log_file.write(f"Result: {result}\n")
-                
+                result = judge_call(judge_config, CAESAR_DECODE_PROMPT_VERSION, messages, result).strip()
             except Exception as e:
                 print(f"LLM处理Caesar密码失败 ({column_header}): {str(e)}")
-                return [], None  # 修改返回格式
+                return None
         
-        if len(result) == 1:
-            result = "1: "+ result
-        else:
-            system_prompt = '''As an evaluator, you will be provided with a test-taker\'s responses to a Likert scale. The test-taker could also be an AI. Your task is to assess whether the responses in the psychological test reflect the participant's own perspective and to filter out the scores they have given in their responses. Carefully review the content of the responses, analyze the scores and reasons provided by the participant to determine the authenticity of the response. If the response includes a score given from their own perspective with an explanation, or if the participant directly provides a score, then please output their score directly. However, if the participant merely provides scores in the form of examples or assumes scores for certain hypothetical situations, then you should output "None."'''
-            
-            messages = [{"role":"system", "content": system_prompt},
-                        {"role": "user", "content": "The following is the response from the participant: " + result}]
-
-            client = OpenAI(base_url=base_url, api_key=key)
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0,
-                n=1,
-                max_tokens=1024
-            )
+        log_file_path = 'results/'+str(inner_setting_type) +'/' + language + '/' + model_name + '/' + name + '/deal_caesar.txt'
+        os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+        with open(log_file_path, 'a', encoding='utf-8') as log_file:
+            log_file.write(f"Result: {result}\n")
+    
+    return result
+
+
+def _parse_score_lines(result, column_header):
+    """按行匹配 "题号: 分数" 等格式提取分数"""
+    result_list = []
+    lines = [line.strip() for line in result.split('\n') if line.strip()]
+    
+    for line in lines:
+        try:
+            patterns = [
+                r'(?:statement\s*)?(\d+)\s*[:：]\s*(\d+)',
+                r'(\d+)\s*\.\s*(\d+)',
+                r'(\d+)\s*\.\s*[^0-9]*?(\d+)',
+                r'(?:\d+)\s*\.[\s\S]*?Rating:\s*(\d+)',
+            ]
             
-            judge_result = response.choices[0].message.content.lstrip()  # 保存判断结果
-            result = "1: " + judge_result
+            for pattern in patterns:
+                match = re.search(pattern, line)
+                if match:
+                    score = int(match.group(2))
+                    result_list.append(score)
+                    break
+                
+        except (ValueError, IndexError) as e:
+            print(f"行解析失败 ({column_header}): {line} - {str(e)}")
+            return []
+    
+    return result_list
 
 
-        lines = [line.strip() for line in result.split('\n') if line.strip()]
+def prepare_response(result, column_header, judge_config, inner_setting_type="default", language='en', name='BFI', model_name='gpt-4',
+                     question_ids=None, scale=None):
+    """解析第一阶段：解码回答，并尽量不经judge直接得到分数
+
+    返回 (parsed, pending)：parsed 不为 None 时就是最终的 (result_list, judge_result)；
+    否则 pending 为需要交给judge判断的回答文本。
+    """
+    result = result.strip()
+    
+    try:
+        result = _decode_response(result, column_header, judge_config, inner_setting_type, language, name, model_name)
+        if result is None:
+            return ([], None), None
         
-        for line in lines:
-            try:
-                patterns = [
-                    r'(?:statement\s*)?(\d+)\s*[:：]\s*(\d+)',
-                    r'(\d+)\s*\.\s*(\d+)',
-                    r'(\d+)\s*\.\s*[^0-9]*?(\d+)',
-                    r'(?:\d+)\s*\.[\s\S]*?Rating:\s*(\d+)',
-                ]
-                
-                for pattern in patterns:
-                    match = re.search(pattern, line)
-                    if match:
-                        score = int(match.group(2))
-                        result_list.append(score)
-                        break
-                    
-            except (ValueError, IndexError) as e:
-                print(f"行解析失败 ({column_header}): {line} - {str(e)}")
-                return [], judge_result  # 修改返回格式
+        if len(result) == 1:
+            return (_parse_score_lines("1: " + result, column_header), None), None
         
-        return result_list, judge_result  # 修改返回格式
-                
+        # 快速通道：能无歧义地直接提取分数时不再调用judge模型
+        if judge_config.get("fast_path", True) and question_ids and scale is not None:
+            fast_scores = extract_scores(result, question_ids, scale, language)
+            fast_path_stats.record(fast_scores is not None)
+            if fast_scores is not None:
+                return (fast_scores, None), None
+        
+        return None, result
+    
     except Exception as e:
         print(f"整体解析失败 ({column_header}): {str(e)}")
         print(f"原始响应: {result}")
-        return [], judge_result  # 修改返回格式
+        return ([], None), None
+
+
+def finish_with_verdict(judge_result, column_header):
+    """解析第二阶段：从judge的判断结果中提取分数"""
+    judge_result = judge_result.lstrip()  # 保存判断结果
+    return _parse_score_lines("1: " + judge_result, column_header), judge_result
+
+
+def _judge_messages(result):
+    return [{"role": "system", "content": JUDGE_SYSTEM_PROMPT},
+            {"role": "user", "content": "The following is the response from the participant: " + result}]
+
+
+def convert_results(result, column_header, judge_config, inner_setting_type="default", language='en', name='BFI', model_name='gpt-4',
+                    question_ids=None, scale=None):
+    parsed, pending = prepare_response(result, column_header, judge_config, inner_setting_type, language,
+                                       name, model_name, question_ids, scale)
+    if parsed is not None:
+        return parsed
+    
+    try:
+        judge_result = judge_call(judge_config, JUDGE_PROMPT_VERSION, _judge_messages(pending), pending)
+    except Exception as e:
+        print(f"整体解析失败 ({column_header}): {str(e)}")
+        print(f"原始响应: {pending}")
+        return [], None
+    return finish_with_verdict(judge_result, column_header)
+
+
+def _parse_batch_verdicts(output, count):
+    """解析批量judge的JSON输出，槽位缺失或格式不对时返回 None"""
+    match = re.search(r'\{[\s\S]*\}', output)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    
+    verdicts = []
+    for slot in range(1, count + 1):
+        if str(slot) not in data:
+            return None
+        value = data[str(slot)]
+        verdicts.append("None" if value is None else str(value).strip())
+    return verdicts
+
+
+def judge_batch(judge_config, texts):
+    """把多个待判定回答编号后放进一次judge请求，返回与 texts 等长的判断结果；输出无法解析时返回 None"""
+    slots = "\n\n".join(f"[[{slot}]]\n{text}" for slot, text in enumerate(texts, 1))
+    messages = [
+        {"role": "system", "content": JUDGE_SYSTEM_PROMPT + "\n\n" + JUDGE_BATCH_INSTRUCTIONS},
+        {"role": "user", "content": "The following are the responses from the participants:\n\n" + slots}
+    ]
+    output = _judge_completion(judge_config, messages, max_tokens=max(1024, 64 * len(texts)))
+    return _parse_batch_verdicts(output, len(texts))
+
+
+def judge_pending(judge_config, texts, batch_size, max_workers=1):
+    """判定一组回答：先查判定缓存并去重，未命中的按 batch_size 打包请求；
+    打包结果无法解析时逐条回退到单条判定，请求本身失败时不回退（重试已在 provider_retry 中完成）。
+    遇到认证/权限错误时放弃其余所有请求。返回 {回答文本: 判断结果或异常}"""
+    cache = get_judge_cache()
+    model = judge_config["model"]
+    verdicts = {}
+    misses = []
+    for text in dict.fromkeys(texts):
+        cached = None
+        if cache is not None:
+            cached = cache.get(model, JUDGE_PROMPT_VERSION, text) or cache.get(model, JUDGE_BATCH_PROMPT_VERSION, text)
+        if cached is not None:
+            verdicts[text] = cached
+        else:
+            misses.append(text)
+    
+    auth_errors = []   # 第一个认证/权限错误，出现后其余批次不再请求
+    
+    def run_chunk(chunk):
+        if auth_errors:
+            return {text: auth_errors[0] for text in chunk}
+        results = None
+        if len(chunk) > 1:
+            try:
+                results = judge_batch(judge_config, chunk)
+            except Exception as e:
+                print(f"批量judge请求失败: {str(e)}")
+                if is_auth_error(e):
+                    auth_errors.append(e)
+                return {text: e for text in chunk}
+            if results is None:
+                print(f"批量judge输出无法解析，逐条判定 {len(chunk)} 条回答")
+        
+        if results is None:
+            chunk_verdicts = {}
+            for text in chunk:
+                if auth_errors:
+                    chunk_verdicts[text] = auth_errors[0]
+                    continue
+                try:
+                    chunk_verdicts[text] = judge_call(judge_config, JUDGE_PROMPT_VERSION, _judge_messages(text), text)
+                except Exception as e:
+                    if is_auth_error(e):
+                        auth_errors.append(e)
+                    chunk_verdicts[text] = e
+            return chunk_verdicts
+        
+        if cache is not None:
+            for text, verdict in zip(chunk, results):
+                cache.put(model, JUDGE_BATCH_PROMPT_VERSION, text, verdict)
+        return dict(zip(chunk, results))
+    
+    chunks = [misses[i:i + batch_size] for i in range(0, len(misses), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for chunk_verdicts in executor.map(run_chunk, chunks):
+            verdicts.update(chunk_verdicts)
+    if auth_errors:
+        print(f"judge认证失败，已停止其余judge请求: {str(auth_errors[0])}")
+    return verdicts
+
+
+def convert_results_batch(items, judge_config, batch_size, max_workers=1):
+    """批量解析多个回答：items 为 convert_results 的参数字典列表（不含 judge_config），
+    需要judge的回答按 batch_size 打包判定。返回与 items 等长的 (result_list, judge_result) 列表"""
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        prepared = list(executor.map(lambda item: prepare_response(judge_config=judge_config, **item), items))
+    
+    pending = [text for parsed, text in prepared if parsed is None]
+    verdicts = judge_pending(judge_config, pending, batch_size, max_workers) if pending else {}
+    
+    results = []
+    for item, (parsed, text) in zip(items, prepared):
+        if parsed is not None:
+            results.append(parsed)
+            continue
+        verdict = verdicts.get(text)
+        if not isinstance(verdict, str):
+            print(f"整体解析失败 ({item['column_header']}): {str(verdict)}")
+            print(f"原始响应: {text}")
+            results.append(([], None))
+            continue
+        results.append(finish_with_verdict(verdict, item["column_header"]))
+    return results
+
+
+def query_model(model, inputs, routing, model_params):
+    """根据模型类型选择调用方式"""
+    if "GLM" in model:
+        return completion(
+            model=model,
+            prompt=inputs,
+            routing=routing,
+            params=model_params
+        )
+    return chat(
+        model=model,
+        messages=inputs,
+        routing=routing,
+        params=model_params
+    )
+
+
+async def async_query_model(model, inputs, routing, model_params, client):
+    """query_model() 的异步版本；GLM 仅有同步SDK，放到线程中执行"""
+    import asyncio
+    if "GLM" in model:
+        return await asyncio.to_thread(
+            completion,
+            model=model,
+            prompt=inputs,
+            routing=routing,
+            params=model_params
+        )
+    return await async_chat(
+        model=model,
+        messages=inputs,
+        routing=routing,
+        params=model_params,
+        client=client
+    )
+
+
+def _supports_n(model, routing):
+    """服务商是否支持用 n 参数一次返回多个回答（api.<服务商>.supports_n）"""
+    if "GLM" in model:
+        return False
+    route = routing.routes.get(model)
+    return route is not None and route.supports_n
+
+
+def _replicate_params(model_params, n, replicate=0):
+    """重复施测使用的模型参数；replicate 只参与响应缓存键，使各次独立请求不会命中同一条缓存"""
+    params = dict(model_params)
+    params["n"] = n
+    if replicate:
+        params["replicate"] = replicate
+    return params
+
+
+def _as_list(result):
+    return result if isinstance(result, list) else [result]
+
+
+def query_model_replicates(model, inputs, routing, model_params, replicates):
+    """对同一输入重复采样，返回与 replicates（重复施测序号）一一对应的回答列表
+
+    服务商支持 n 时一次请求取回全部回答；不支持或返回数量不足时，并发发送单次请求补齐。
+    """
+    replicates = list(replicates)
+    results = []
+    if len(replicates) > 1 and _supports_n(model, routing):
+        params = _replicate_params(model_params, len(replicates), replicates[0])
+        results = _as_list(query_model(model, inputs, routing, params))[:len(replicates)]
+    
+    remaining = replicates[len(results):]
+    if len(remaining) == 1:
+        results.append(query_model(model, inputs, routing, _replicate_params(model_params, 1, remaining[0])))
+    elif remaining:
+        with ThreadPoolExecutor(max_workers=len(remaining)) as executor:
+            results.extend(executor.map(
+                lambda replicate: query_model(model, inputs, routing, _replicate_params(model_params, 1, replicate)),
+                remaining
+            ))
+    return results
+
+
+async def async_query_model_replicates(model, inputs, routing, model_params, replicates, client):
+    """query_model_replicates() 的异步版本"""
+    import asyncio
+    replicates = list(replicates)
+    results = []
+    if len(replicates) > 1 and _supports_n(model, routing):
+        params = _replicate_params(model_params, len(replicates), replicates[0])
+        results = _as_list(await async_query_model(model, inputs, routing, params, client))[:len(replicates)]
+    
+    remaining = replicates[len(results):]
+    if remaining:
+        results.extend(await asyncio.gather(*[
+            async_query_model(model, inputs, routing, _replicate_params(model_params, 1, replicate), client)
+            for replicate in remaining
+        ]))
+    return results
+
+
+async def _run_batches_async(pending_batches, model, routing, model_params, handle_batch, max_in_flight, pbar):
+    """并发发送 pending_batches 中的 (批次序号, 输入, 重复施测序号列表) ，在途请求数不超过 max_in_flight，返回按批次顺序排列的结果"""
+    import asyncio
+    httpx = load_backend("httpx")
+    semaphore = asyncio.Semaphore(max(1, max_in_flight))
+    limits = httpx.Limits(max_connections=max(1, max_in_flight), max_keepalive_connections=max(1, max_in_flight))
+    
+    async with httpx.AsyncClient(limits=limits) as client:
+        async def run_one(batch_index, inputs, replicates):
+            async with semaphore:
+                try:
+                    results = await async_query_model_replicates(model, inputs, routing, model_params, replicates, client)
+                except Exception as e:
+                    print(f"Error getting response for batch {batch_index + 1}: {str(e)}")
+                    pbar.update(1)
+                    return []
+            # 解析（可能调用judge模型）不占用被测模型的在途名额
+            outcomes = await asyncio.to_thread(handle_batch, batch_index, inputs, results, replicates)
+            pbar.update(1)
+            return outcomes
+        
+        tasks = [run_one(batch_index, inputs, replicates) for batch_index, inputs, replicates in pending_batches]
+        # gather 按提交顺序返回结果，保证后续按题号顺序写入
+        return await asyncio.gather(*tasks)
 
 
 def example_generator(questionnaire, config):
     """生成问卷测试结果"""
+    from tqdm import tqdm
+    from results.analysis.Analysis_scripts.result_manager import ResultManager
     inner_setting_type = config["test"]["inner_setting_type"]
     lang = config["test"]["lang"]
     model = config["model"]["name"]
     batch_size = config["model"]["params"]["batch_size"]
-    api_config = config['api']
+    routing = config['routing']
     model_params = config["model"]["params"]
     judge_config = config["judge"]
+    # 重复施测次数：每个批次采样 test_count 个回答，各自作为独立条目记录
+    test_count = max(1, int(config["test"].get("count") or 1))
     
     # 初始化结果管理器
     result_manager = ResultManager()
@@ -328,113 +671,136 @@ def example_generator(questionnaire, config):
         categories=list(set(question_to_category.values()))  # 使用实际的类别列表
     )
     
-    # 语言提示词映射字典
-    prompt_map = {
-        "en": "\n\nPlease provide your response to the above statement in English.",
-        "zh": "\n\n请用中文回答上述问题。",
-        "es": "\n\nPor favor, proporcione su respuesta a la declaración anterior en español.",
-        "fr": "\n\nVeuillez fournir votre réponse à la déclaration ci-dessus en français.",
-        "de": "\n\nBitte geben Sie Ihre Antwort auf die obige Aussage auf Deutsch.",
-        "ru": "\n\nПожалуйста, предоставьте ваш ответ на вышеуказанное утверждение на русском языке.",
-        "ja": "\n\n上記の質問に対して日本語で回答してください。",
-        "ar": "يرجى تقديم إجابتك على البيان أعلاه باللغة العربية.\n\n"
-    }
-    
-    # 获取目标语言和对应的提示词
-    trans_language_prompt = prompt_map.get(lang, prompt_map["en"])
-    
     # 获取问卷问题列表
     questions = questionnaire["questions"]
-    questions_list = []
     
-    # 将问题按批次分组
-    for i in range(0, len(questions), batch_size):
-        batch_questions = []
-        for j, (q_num, q_text) in enumerate(questions.items()):
-            if j >= i and j < i + batch_size:
-                batch_questions.append(f"{q_num}.{q_text}")
-        questions_list.append('\n'.join(batch_questions))
-    
-    # 根据inner_setting_type处理问题
-    if inner_setting_type == "base64":
-        questions_list = [base64.b64encode(q.encode('utf-8')).decode('utf-8') for q in questions_list]
-        trans_language_prompt = "Please provide your response to the above statement in Base64."
-    elif inner_setting_type == "Caesar":
-        def caesar_encrypt(text, shift=3):
-            result = ""
-            for char in text:
-                if char.isalpha():
-                    ascii_offset = ord('A') if char.isupper() else ord('a')
-                    shifted = (ord(char) - ascii_offset + shift) % 26
-                    result += chr(ascii_offset + shifted)
-                else:
-                    result += char
-            return result
-        questions_list = [caesar_encrypt(q) for q in questions_list]
-        trans_language_prompt = "Please provide your response to the above statement in Caesar cipher."
-    else:
-        trans_language_prompt = prompt_map.get(lang, prompt_map["en"])
-        
-    # 获取系统提示词和问卷提示词
-    trans_inner_setting = questionnaire.get("inner_setting", "")
-    trans_adjusted_prompt = questionnaire.get("prompt", "")
+    # 提示词计划：优先使用本次运行预先编译好的计划（所有模型共用），单独调用时现场编译
+    plan = config.get("prompt_plan") or compile_prompt_plan(questionnaire, lang, inner_setting_type, batch_size)
+    batch_question_ids = plan.batch_question_ids
+    batch_inputs = plan.inputs_for(model)
     
     # 初始化结果存储
     parse_results = {}
     
-    # 创建进度条
-    pbar = tqdm(total=len(questions_list), desc="处理问卷批次", position=0, leave=True)
-    print()
+    # judge 批量模式：batch_size > 1 时所有批次的回答收齐后再统一解析
+    judge_batch_size = judge_config.get("batch_size") or 1
     
-    # 对每个批次的问题进行测试
-    for batch_index, questions_string in enumerate(questions_list):
-        # 准备输入
-        input_question = questions_string
-        inputs = [
-            {"role": "system", "content": trans_inner_setting},
-            {"role": "user", "content": trans_adjusted_prompt + ' \n ' + input_question + ' \n ' + trans_language_prompt}
-        ]
-        
-        # 特殊处理gemini模型
-        if model == "gemini-2.0-flash-exp" and inner_setting_type == "default":
-            inputs = [
-                {"role": "system", "content": "  "},
-                {"role": "user", "content": trans_adjusted_prompt + ' \n ' + input_question + ' \n ' + trans_language_prompt}
-            ]
-
-        
-        # 获取模型响应
+    def new_outcome(batch_index, inputs, result, replicate=0):
+        """单个批次的模型响应，尚未解析"""
+        return {
+            "batch_index": batch_index,
+            "replicate": replicate,
+            "inputs": inputs,
+            "result": result,
+            "parsed": None,
+            "error": None
+        }
+    
+    def parse_args(outcome):
+        batch_index = outcome["batch_index"]
+        return {
+            "result": outcome["result"],
+            "column_header": f"batch_{batch_index}",
+            "inner_setting_type": inner_setting_type,
+            "language": lang,
+            "name": questionnaire["name"],
+            "model_name": model,
+            "question_ids": batch_question_ids[batch_index],
+            "scale": questionnaire['scale']
+        }
+    
+    def parse_batch(batch_index, inputs, result, replicate=0):
+        """解析单个批次的模型响应，不写入结果数据"""
+        outcome = new_outcome(batch_index, inputs, result, replicate)
         try:
-            # 根据模型类型选择调用方式
-            if "GLM" in model:
-                result = completion(
-                    model=model,
-                    prompt=inputs,
-                    api=api_config,
-                    params=model_params
-                )
-            else:
-                result = chat(
-                    model=model,
-                    messages=inputs,
-                    api_config=api_config,
-                    params=model_params
-                )
+            outcome["parsed"] = convert_results(judge_config=judge_config, **parse_args(outcome))
         except Exception as e:
-            print(f"Error getting response for batch {batch_index + 1}: {str(e)}")
-            pbar.update(1)
-            continue
-        
-
+            outcome["error"] = e
+        return outcome
+    
+    def parse_outcomes_batched(outcomes, max_workers):
+        """统一解析所有批次，待判定的回答按 judge_batch_size 打包请求"""
+        try:
+            parsed_list = convert_results_batch([parse_args(outcome) for outcome in outcomes],
+                                                judge_config, judge_batch_size, max_workers)
+            for outcome, parsed in zip(outcomes, parsed_list):
+                outcome["parsed"] = parsed
+        except Exception as e:
+            for outcome in outcomes:
+                outcome["error"] = e
+    
+    parse_or_defer = new_outcome if judge_batch_size > 1 else parse_batch
+    
+    # 按批次追加写入的日志：中断后重跑时跳过已完成的批次
+    journal_config = config["output"].get("journal") or {}
+    journal = None
+    responses_done, parsed_done = {}, {}
+    if journal_config.get("enabled", False):
+        journal = BatchJournal(
+            config["output"]["json_results_dir"],
+            make_fingerprint(
+                questionnaire=questionnaire["name"], model=model, language=lang,
+                inner_setting_type=inner_setting_type, batch_size=batch_size, plan=plan.plan_id
+            ),
+            fsync=journal_config.get("fsync", "always"),
+            fsync_interval=journal_config.get("fsync_interval", 5.0)
+        )
+        responses_done, parsed_done = journal.replay()
+        if responses_done:
+            print(f"从日志恢复 {len(responses_done)} 个已完成的批次")
+    
+    def handle_batch(batch_index, inputs, results, replicates):
+        """记录一个批次各次重复施测的模型回答并解析（judge 批量模式下推迟解析）"""
+        batch_outcomes = []
+        for replicate, result in zip(replicates, results):
+            if journal is not None:
+                journal.append_response(batch_index, result, replicate)
+            outcome = parse_or_defer(batch_index, inputs, result, replicate)
+            if journal is not None and judge_batch_size <= 1:
+                journal.append_parsed(batch_index, outcome["parsed"], outcome["error"], replicate)
+            batch_outcomes.append(outcome)
+        return batch_outcomes
+    
+    # 从日志重建已完成的批次，只有回答没有解析结果的批次重新解析；缺少的重复施测重新请求
+    outcomes = []
+    pending_batches = []
+    for batch_index, inputs in enumerate(batch_inputs):
+        missing = []
+        for replicate in range(test_count):
+            key = (batch_index, replicate)
+            if key in parsed_done:
+                outcome = new_outcome(batch_index, inputs, responses_done.get(key), replicate)
+                record = parsed_done[key]
+                outcome["parsed"] = tuple(record["parsed"]) if record["parsed"] is not None else None
+                outcome["error"] = Exception(record["error"]) if record["error"] is not None else None
+                outcomes.append(outcome)
+            elif key in responses_done:
+                outcome = parse_or_defer(batch_index, inputs, responses_done[key], replicate)
+                if journal is not None and judge_batch_size <= 1:
+                    journal.append_parsed(batch_index, outcome["parsed"], outcome["error"], replicate)
+                outcomes.append(outcome)
+            else:
+                missing.append(replicate)
+        if missing:
+            pending_batches.append((batch_index, inputs, missing))
+    
+    def record_batch(outcome):
+        """将单个批次的解析结果写入结果数据"""
+        nonlocal result_data
+        batch_index = outcome["batch_index"]
+        replicate = outcome["replicate"]
+        inputs = outcome["inputs"]
+        result = outcome["result"]
+        # 每次重复施测占用独立的结果序号
+        offset = replicate * len(questions)
         
-        # 解析结果
         try:
-            parsed_results, judge_result = convert_results(result, f"batch_{batch_index}", judge_config, inner_setting_type, 
-                                            lang, questionnaire["name"], model)
+            if outcome["error"] is not None:
+                raise outcome["error"]
+            parsed_results, judge_result = outcome["parsed"]
             
             # 记录解析结果
-            for idx in range(batch_size):
-                question_id = str(batch_index * batch_size + idx + 1)
+            for idx, question_id in enumerate(batch_question_ids[batch_index]):
                 question_data = questionnaire["questions"][question_id]
                 
                 # 直接从映射表获取类别
@@ -464,21 +830,21 @@ def example_generator(questionnaire, config):
                     parse_success=parse_success,
                     judge=judge_result  # 新增：添加判断结果
                 )
+                result_data["questions"][-1]["replicate"] = replicate
 
-                parse_results[batch_index * batch_size + idx] = parse_success
+                parse_results[offset + batch_index * batch_size + idx] = parse_success
             
         except Exception as e:
             print(f"Error parsing results for batch {batch_index + 1}: {str(e)}")
             # 发生异常时，记录所有问题为失败，也要更新统计信息和内容
-            for idx in range(batch_size):
-                question_id = str(batch_index * batch_size + idx + 1)
+            for idx, question_id in enumerate(batch_question_ids[batch_index]):
                 question_data = questionnaire["questions"][question_id]
                 category = question_to_category.get(question_id, "未知类别")
                 
                 result_data = result_manager.add_question_result(
                     result_data=result_data,
                     question_id=question_id,
-                    question_content=question_data["question"],
+                    question_content=question_data,
                     prompt=inputs,
                     response=result,
                     score=-1,
@@ -486,37 +852,84 @@ def example_generator(questionnaire, config):
                     parse_success=False,
                     judge=None  # 异常情况下没有判断结果
                 )
-                result_data = result_manager.update_statistics(result_data)
-                save_path = result_manager.save_results(
-                    result_data=result_data,
-                    base_dir=config["output"]["json_results_dir"],
-                    questionnaire_name=questionnaire["name"],
-                    model=model,
-                    language=lang,
-                    inner_setting_type=inner_setting_type
-                )
-                # result_file.write(f"-1\n")
+                result_data["questions"][-1]["replicate"] = replicate
 
-                parse_results[batch_index * batch_size + idx] = False
-        
-        # 每处理完一个批次就更新统计信息并保存
-        
-        
-        # 更新进度条
-        pbar.update(1)
-        pbar.refresh()  # 确保进度条立即更新
+                parse_results[offset + batch_index * batch_size + idx] = False
+    
+    # 并发配置：未启用时按顺序逐批次执行
+    concurrency = config.get("concurrency", {})
+    
+    # 创建进度条
+    pbar = tqdm(total=len(batch_inputs), initial=len(batch_inputs) - len(pending_batches), desc=f"{model} {questionnaire['name']}", position=0, leave=True)
+    print()
+    
+    if concurrency.get("enabled", False):
+        # 异步并发执行：按模型限制在途请求数，全部返回后按批次顺序写入
+        per_model = concurrency.get("per_model") or {}
+        max_in_flight = per_model.get(model, concurrency.get("max_in_flight", 1))
+        import asyncio
+        new_outcomes = asyncio.run(_run_batches_async(
+            pending_batches, model, routing, model_params, handle_batch, max_in_flight, pbar
+        ))
+        outcomes.extend(outcome for batch_outcomes in new_outcomes for outcome in batch_outcomes)
+    else:
+        max_in_flight = 1
+        # 对每个批次的问题进行测试
+        for batch_index, inputs, replicates in pending_batches:
+            # 获取模型响应（test_count > 1 时一次取回所有重复施测的回答）
+            try:
+                results = query_model_replicates(model, inputs, routing, model_params, replicates)
+            except Exception as e:
+                print(f"Error getting response for batch {batch_index + 1}: {str(e)}")
+                pbar.update(1)
+                continue
+            
+            # 解析结果
+            outcomes.extend(handle_batch(batch_index, inputs, results, replicates))
+            
+            # 更新进度条
+            pbar.update(1)
+            pbar.refresh()  # 确保进度条立即更新
+    
+    if judge_batch_size > 1:
+        unparsed = [outcome for outcome in outcomes if outcome["parsed"] is None and outcome["error"] is None]
+        parse_outcomes_batched(unparsed, max_in_flight)
+        if journal is not None:
+            for outcome in unparsed:
+                journal.append_parsed(outcome["batch_index"], outcome["parsed"], outcome["error"], outcome["replicate"])
+    
+    # 按 (重复施测序号, 批次) 顺序写入结果，每次施测的条目连续排列
+    outcomes.sort(key=lambda outcome: (outcome["replicate"], outcome["batch_index"]))
+    for outcome in outcomes:
+        record_batch(outcome)
     
     # 关闭进度条
     pbar.close()
     result_data = result_manager.update_statistics(result_data)
-    save_path = result_manager.save_results(
-        result_data=result_data,
-        base_dir=config["output"]["json_results_dir"],
-        questionnaire_name=questionnaire["name"],
-        model=model,
-        language=lang,
-        inner_setting_type=inner_setting_type
-    )
+    if config["output"].get("result_format", "v1") == "v2":
+        # 紧凑格式：每个批次的 prompt / response 只存一次，读取时用 result_format.load_results
+        save_path = write_results(result_data, os.path.join(config["output"]["json_results_dir"], RESULT_FILE_NAME), "v2")
+    else:
+        save_path = result_manager.save_results(
+            result_data=result_data,
+            base_dir=config["output"]["json_results_dir"],
+            questionnaire_name=questionnaire["name"],
+            model=model,
+            language=lang,
+            inner_setting_type=inner_setting_type
+        )
     print(f"Results saved to: {save_path}")
     
+    # 增量更新结果索引
+    catalog = get_results_catalog()
+    if catalog is not None:
+        try:
+            catalog.index_result(save_path, result_data)
+        except Exception as e:
+            print(f"更新结果索引失败: {str(e)}")
+    
+    # 结果已完整写入 results.json，删除日志
+    if journal is not None:
+        journal.discard()
+    
     return parse_results
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+
+# 输出内容的组织方式变化时修改版本号，使旧清单全部失效
+MANIFEST_VERSION = 1
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+def content_hash(*parts) -> str:
+    """对任意可 JSON 序列化的内容计算稳定的哈希（键排序）"""
+    content = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def atomic_write_json(path: str, data, indent: Optional[int] = 2):
+    """先写临时文件再替换，中断时不会留下半个文件"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp_path, path)
+
+
+class GenerationManifest:
+    """问卷生成清单：记录每个输出文件中各问卷条目的输入哈希
+
+    files: {相对路径: {问卷名: 哈希}}，哈希由源问卷条目、inner_setting 文本、语言和翻译器设置计算。
+    """
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+        self.output_dir = output_dir
+        self.files: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    self.files = data.get("files", {})
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"读取生成清单失败，全部重新生成: {self.path}: {str(e)}")
+
+    def stale_entries(self, relative_path: str, planned: Dict[str, str]) -> list:
+        """返回该文件中需要重新生成的问卷名；文件不存在或问卷列表变化时整个文件都需要重写"""
+        recorded = self.files.get(relative_path)
+        if recorded is None or not os.path.exists(os.path.join(self.output_dir, relative_path)):
+            return list(planned)
+        return [name for name, digest in planned.items() if recorded.get(name) != digest]
+
+    def is_current(self, relative_path: str, planned: Dict[str, str]) -> bool:
+        """文件存在且问卷列表（含顺序）与各条目哈希都与清单一致"""
+        recorded = self.files.get(relative_path)
+        return (recorded is not None and list(recorded.items()) == list(planned.items())
+                and os.path.exists(os.path.join(self.output_dir, relative_path)))
+
+    def record(self, relative_path: str, planned: Dict[str, str]):
+        self.files[relative_path] = dict(planned)
+
+    def save(self):
+        atomic_write_json(self.path, {"version": MANIFEST_VERSION, "files": self.files})
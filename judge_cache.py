@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+
+class JudgeCache:
+    """judge 判定结果缓存：按 (judge模型, 系统提示词版本, 响应文本) 持久化，并合并并发中的相同请求"""
+    def __init__(self, path: str = ".cache/judge.sqlite"):
+        self.path = path
+        self.hits = 0
+        self.deduplicated = 0
+        self.misses = 0
+        self._memory = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, model TEXT, prompt_version TEXT, response TEXT, verdict TEXT, created REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt_version: str, response_text: str) -> str:
+        content = json.dumps([model, prompt_version, response_text], ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        verdict = self._memory.get(key)
+        if verdict is not None:
+            return verdict
+        row = self._conn.execute("SELECT verdict FROM verdicts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._memory[key] = row[0]
+        return row[0]
+
+    def _store(self, key: str, model: str, prompt_version: str, response_text: str, verdict: str):
+        self._memory[key] = verdict
+        self._conn.execute(
+            "INSERT OR REPLACE INTO verdicts (key, model, prompt_version, response, verdict, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, prompt_version, response_text, verdict, time.time())
+        )
+        self._conn.commit()
+
+    def get(self, model: str, prompt_version: str, response_text: str) -> Optional[str]:
+        """只查询缓存，未命中时返回 None"""
+        key = self.make_key(model, prompt_version, response_text)
+        with self._lock:
+            verdict = self._lookup(key)
+            if verdict is not None:
+                self.hits += 1
+            return verdict
+
+    def put(self, model: str, prompt_version: str, response_text: str, verdict: str):
+        """写入一条在缓存之外得到的判定结果（例如批量判定），计为一次实际判定"""
+        key = self.make_key(model, prompt_version, response_text)
+        with self._lock:
+            self.misses += 1
+            self._store(key, model, prompt_version, response_text, verdict)
+
+    def get_or_compute(self, model: str, prompt_version: str, response_text: str, compute: Callable[[], str]) -> str:
+        """返回缓存的判定结果；未命中时只有第一个请求真正调用 compute，其余并发请求等待其结果"""
+        key = self.make_key(model, prompt_version, response_text)
+        with self._lock:
+            verdict = self._lookup(key)
+            if verdict is not None:
+                self.hits += 1
+                return verdict
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            verdict = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, model, prompt_version, response_text, verdict)
+            self._inflight.pop(key, None)
+        future.set_result(verdict)
+        return verdict
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.deduplicated + self.misses
+            return {
+                "hits": self.hits,
+                "deduplicated": self.deduplicated,
+                "misses": self.misses,
+                "saved_rate": ((self.hits + self.deduplicated) / total) if total > 0 else 0.0
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"judge缓存统计: 命中 {stats['hits']} 次, 并发合并 {stats['deduplicated']} 次, "
+                f"实际调用 {stats['misses']} 次, 节省 {stats['saved_rate'] * 100:.2f}%")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+
+
+def init_judge_cache(cache_config: dict = None) -> Optional[JudgeCache]:
+    """按 judge.cache 配置创建本次运行使用的判定缓存，未启用时返回 None"""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    cache_config = dict(cache_config or {})
+    if not cache_config.pop("enabled", False):
+        return None
+    _cache = JudgeCache(**cache_config)
+    return _cache
+
+
+def get_judge_cache() -> Optional[JudgeCache]:
+    return _cache
@@ -1,25 +1,132 @@
-from config_loader import load_config
-from questionnaire_generator import QuestionnaireGenerator
-from questionnaire_tester import QuestionnaireTester
+import argparse
+import sys
+from typing import List, Optional
 
 
-def main():
-    # 加载配置
-    generation_config, testing_config = load_config()
-    
+# 各子命令只在执行时导入所需模块：--help、plan 等不加载服务商 SDK 和分析依赖（pandas / scipy）
+REPORT_TOOLS = {
+    "scores": ("scoring", "问卷维度计分"),
+    "significance": ("significance", "比较不同语言或角色下的维度分数"),
+    "catalog": ("results_catalog", "结果索引查询"),
+}
+
+
+def load_config(config_path: str):
+    from config_loader import load_config as load
+    return load(config_path)
+
+
+def run_generation(generation_config):
+    from questionnaire_generator import QuestionnaireGenerator
+    print("\n开始问卷生成...")
+    generator = QuestionnaireGenerator(generation_config)
+    generator.generate()
+
+
+def run_testing(testing_config):
+    from questionnaire_tester import QuestionnaireTester
+    print("\n开始问卷测试...")
+    tester = QuestionnaireTester(testing_config)
+    tester.run_tests()
+
+
+def cmd_generate(args):
+    generation_config, _ = load_config(args.config)
+    if args.full:
+        generation_config.base.incremental = False
+    run_generation(generation_config)
+
+
+def cmd_test(args):
+    _, testing_config = load_config(args.config)
+    # 显式执行 test 时忽略 enabled 开关
+    testing_config.base.enabled = True
+    run_testing(testing_config)
+
+
+def cmd_report(args):
+    import importlib
+    module_name, _ = REPORT_TOOLS[args.tool]
+    importlib.import_module(module_name).main(args.args)
+
+
+def cmd_plan(args):
+    """预览本次运行：需要重新生成的问卷文件、测试矩阵和提示词批次，不请求翻译服务和模型"""
+    from collections import Counter
+    from questionnaire_generator import QuestionnaireGenerator
+    from questionnaire_tester import build_test_matrix
+    from prompt_plan import PromptPlanStore
+
+    generation_config, testing_config = load_config(args.config)
+
+    print("== 问卷生成 ==")
+    generator = QuestionnaireGenerator(generation_config)
+    generator.load_source_questionnaires()
+    generator.plan_outputs()
+    for relative_path, stale in generator.stale_outputs.items():
+        print(f"  {relative_path}: {len(stale)} 个问卷需要更新")
+
+    print("\n== 问卷测试 ==")
+    prompt_plans = PromptPlanStore()
+    cells = build_test_matrix(testing_config, prompt_plans)
+    batch_size = testing_config.model_params.batch_size
+    test_count = max(1, testing_config.base.test_count)
+    groups = Counter()
+    batches = Counter()
+    for cell in cells:
+        key = (cell.inner_setting_type, cell.language, cell.provider)
+        groups[key] += 1
+        batches[key] += len(prompt_plans.get(cell.questionnaire["name"], cell.language, cell.inner_setting_type, batch_size).batches)
+    print("\n| inner_setting | 语言 | 服务商 | 测试单元 | 批次 |")
+    print("|------|------|------|------|------|")
+    for key in sorted(groups):
+        print(f"| {' | '.join(key)} | {groups[key]} | {batches[key]} |")
+    print(f"\n共 {len(cells)} 个测试单元, {sum(batches.values())} 个批次, "
+          f"重复施测 {test_count} 次, 最多 {sum(batches.values()) * test_count} 次模型请求")
+    print(prompt_plans.report())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="AIPsychoBench：问卷生成、模型测试与结果分析")
+    parser.add_argument("--config", default="config.yaml", help="配置文件路径（默认 config.yaml）")
+    subparsers = parser.add_subparsers(dest="command")
+
+    generate_parser = subparsers.add_parser("generate", help="生成（翻译）问卷")
+    generate_parser.add_argument("--full", action="store_true", help="忽略生成清单，全部重新生成")
+    generate_parser.set_defaults(handler=cmd_generate)
+
+    test_parser = subparsers.add_parser("test", help="运行模型测试")
+    test_parser.set_defaults(handler=cmd_test)
+
+    report_parser = subparsers.add_parser("report", help="结果分析，其余参数传给对应工具（例如 report scores --db results/catalog.sqlite）")
+    report_parser.add_argument("tool", choices=list(REPORT_TOOLS),
+                               help="; ".join(f"{name}: {text}" for name, (_, text) in REPORT_TOOLS.items()))
+    report_parser.add_argument("args", nargs=argparse.REMAINDER, help="传给分析工具的参数")
+    report_parser.set_defaults(handler=cmd_report)
+
+    plan_parser = subparsers.add_parser("plan", help="预览需要生成的问卷和测试矩阵，不请求任何服务")
+    plan_parser.set_defaults(handler=cmd_plan)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    if args.command is not None:
+        args.handler(args)
+        return
+
+    # 未指定子命令时按配置文件中的 enabled 开关依次执行生成和测试
+    generation_config, testing_config = load_config(args.config)
+
     # 1. 问卷生成
     #检测是否覆盖。
     if generation_config.base.enabled:
-        print("\n开始问卷生成...")
-        generator = QuestionnaireGenerator(generation_config)
-        generator.generate()
-    
+        run_generation(generation_config)
+
     # 2. 问卷测试
     if testing_config.base.enabled:
-        print("\n开始问卷测试...")
-        tester = QuestionnaireTester(testing_config)
-        tester.run_tests()
-    
+        run_testing(testing_config)
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main(sys.argv[1:])
@@ -0,0 +1,335 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cipher import base64_encode, decode_base64_tolerant, rot3_decode, rot3_encode
+
+
+# 离线的 OpenAI 兼容服务商：实现 chat() 使用的 chat/completions 接口，同时充当 judge（评分判断、批量判断、Caesar 解码），
+# 用于在不请求真实 API 的情况下测量整个测试流程的吞吐量
+
+# 回答风格：fast 可被快速通道直接解析；judge 含假设性措辞，需要交给 judge 判断；invalid 为拒答
+RESPONSE_STYLES = ("fast", "judge", "invalid")
+DEFAULT_SCALE = 6
+# 脚本中没有匹配的规则时使用：大部分回答走快速通道，少量需要 judge 或是拒答
+DEFAULT_RULE = {"styles": {"fast": 0.85, "judge": 0.1, "invalid": 0.05}, "scores": "random"}
+
+_QUESTION_LINE = re.compile(r'^\s*(\d+)\s*\.', re.MULTILINE)
+_INTEGER = re.compile(r'\d+')
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """解析延迟分布（单位秒）：fixed:0.05 | uniform:0.02,0.2 | normal:0.1,0.03 | lognormal:中位数,sigma | exponential:均值"""
+    name, _, values = spec.partition(":")
+    try:
+        params = [float(value) for value in values.split(",")] if values else []
+    except ValueError:
+        raise ValueError(f"无效的延迟分布参数: {spec}")
+    if name == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if name == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if name == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if name == "lognormal" and len(params) == 2:
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    if name == "exponential" and len(params) == 1:
+        return lambda rng: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+    raise ValueError(f"无效的延迟分布: {spec}（可选 fixed:秒 / uniform:下限,上限 / normal:均值,标准差 / "
+                     f"lognormal:中位数,sigma / exponential:均值）")
+
+
+@dataclass
+class MockBehavior:
+    """模拟服务商的行为配置"""
+    latency: str = "lognormal:0.2,0.5"       # 被测模型请求的延迟分布
+    judge_latency: str = "fixed:0.05"        # judge 请求的延迟分布
+    error_rate: float = 0.0                  # 返回 500 的比例
+    rate_limit_rate: float = 0.0             # 返回 429 的比例
+    retry_after: float = 0.1                 # 429 响应的 Retry-After（秒）
+    seed: int = 0
+    # 回答脚本：{问卷名 | "scale:<量表>" | "*": {"styles": {风格: 权重}, "scores": "random" | "min" | "max" | 整数}}
+    script: Dict[str, dict] = field(default_factory=dict)
+
+
+def load_questionnaire_index(paths: List[str]) -> Dict[str, Tuple[str, int]]:
+    """读取问卷文件（或目录下所有 questionnaires_*.json），按 prompt 开头识别请求属于哪个问卷及其量表"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, name) for name in names
+                          if name.startswith("questionnaires_") and name.endswith(".json")]
+        elif os.path.exists(path):
+            files.append(path)
+    index = {}
+    for path in files:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for questionnaire in json.load(f):
+                    prompt = questionnaire.get("prompt", "")
+                    if prompt:
+                        index[prompt[:64]] = (questionnaire["name"], int(questionnaire["scale"]))
+        except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            print(f"读取问卷文件失败: {path}: {str(e)}")
+    return index
+
+
+class MockProvider:
+    """根据请求内容生成回答：被测模型请求按脚本作答，judge 请求从回答中取出分数"""
+    def __init__(self, behavior: MockBehavior, questionnaire_index: Optional[Dict[str, Tuple[str, int]]] = None):
+        self.behavior = behavior
+        self.questionnaire_index = questionnaire_index or {}
+        self.model_latency = parse_latency(behavior.latency)
+        self.judge_latency = parse_latency(behavior.judge_latency)
+        self._rng = random.Random(behavior.seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "model": 0, "judge": 0, "judge_batch": 0, "decode": 0,
+                      "injected_429": 0, "injected_500": 0, "bad_request": 0, "in_flight": 0, "peak_in_flight": 0}
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+            if key == "in_flight":
+                self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+
+    def _draw(self, sampler=None) -> float:
+        with self._lock:
+            return sampler(self._rng) if sampler else self._rng.random()
+
+    # ---- 被测模型 ----
+
+    def _identify(self, user: str) -> Tuple[str, int]:
+        return self.questionnaire_index.get(user[:64], ("", DEFAULT_SCALE))
+
+    def _rule(self, name: str, scale: int) -> dict:
+        script = self.behavior.script
+        return script.get(name) or script.get(f"scale:{scale}") or script.get("*") or DEFAULT_RULE
+
+    @staticmethod
+    def _seeded(*parts) -> random.Random:
+        # 每个 (问卷, 题目, 模型, 第几个回答) 的结果固定，与请求到达顺序和线程调度无关
+        return random.Random(hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def _split_prompt(user: str) -> Tuple[str, str]:
+        """prompt_plan 生成的 user 消息为 问卷说明 \\n 题目 \\n 作答语言提示，返回 (题目, 编码方式)"""
+        parts = user.rsplit(" \n ", 2)
+        questions = parts[1] if len(parts) == 3 else user
+        tail = parts[-1]
+        if "Base64" in tail:
+            return decode_base64_tolerant(questions) or questions, "base64"
+        if "Caesar" in tail:
+            return rot3_decode(questions), "Caesar"
+        return questions, ""
+
+    def answer(self, model: str, user: str, choice: int) -> str:
+        name, scale = self._identify(user)
+        questions, encoding = self._split_prompt(user)
+        question_ids = _QUESTION_LINE.findall(questions) or ["1"]
+        rule = self._rule(name, scale)
+        rng = self._seeded(self.behavior.seed, name, ",".join(question_ids), model, choice)
+
+        styles = rule.get("styles") or DEFAULT_RULE["styles"]
+        style = rng.choices(list(styles), weights=list(styles.values()))[0]
+        low, high = (1, scale - 1) if scale > 2 else (0, max(0, scale - 1))
+        mode = rule.get("scores", "random")
+        scores = []
+        for q_id in question_ids:
+            if mode == "min":
+                scores.append(low)
+            elif mode == "max":
+                scores.append(high)
+            elif isinstance(mode, int):
+                scores.append(mode)
+            else:
+                scores.append(self._seeded(self.behavior.seed, name, q_id, model, choice).randint(low, high))
+
+        if style == "invalid":
+            text = "As an AI language model, I don't have personal feelings or opinions."
+        elif style == "judge":
+            text = "\n".join(f"Statement {q_id}: I would probably choose {score}." for q_id, score in zip(question_ids, scores))
+        else:
+            text = "\n".join(f"{q_id}: {score}" for q_id, score in zip(question_ids, scores))
+        if encoding == "base64":
+            return base64_encode(text)
+        if encoding == "Caesar":
+            return rot3_encode(text)
+        return text
+
+    # ---- judge ----
+
+    @staticmethod
+    def _verdict(response: str) -> str:
+        """取回答中每行的最后一个整数作为该题分数；拒答（没有分数）时输出 None"""
+        scores = []
+        for line in response.split("\n"):
+            integers = _INTEGER.findall(line)
+            if integers:
+                scores.append(integers[-1])
+        if not scores:
+            return "None"
+        return scores[0] + "".join(f"\n{index}. {score}" for index, score in enumerate(scores[1:], 2))
+
+    def judge(self, system: str, user: str) -> Tuple[str, str]:
+        """返回 (请求类型, 回答内容)"""
+        if "Caesar cipher decoder" in system:
+            return "decode", rot3_decode(user.split("\n", 1)[-1])
+        if "[[1]]" in user:
+            slots = re.split(r'\[\[(\d+)\]\]\n', user)[1:]
+            verdicts = {slots[i]: self._verdict(slots[i + 1].strip()) for i in range(0, len(slots), 2)}
+            return "judge_batch", json.dumps(verdicts)
+        return "judge", self._verdict(user.split(": ", 1)[-1])
+
+    # ---- 请求处理 ----
+
+    def handle(self, body: dict) -> Tuple[int, Dict[str, str], dict, float]:
+        """返回 (状态码, 额外响应头, 响应体, 需要模拟的延迟)"""
+        self._count("requests")
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages:
+            self._count("bad_request")
+            return 400, {}, {"error": {"message": "messages is required", "type": "invalid_request_error"}}, 0.0
+
+        system = messages[0].get("content", "") if messages[0].get("role") == "system" else ""
+        user = str(messages[-1].get("content", ""))
+        is_judge = user.startswith("The following ") or "Caesar cipher decoder" in system
+        latency = self._draw(self.judge_latency if is_judge else self.model_latency)
+
+        draw = self._draw()
+        if draw < self.behavior.rate_limit_rate:
+            self._count("injected_429")
+            return 429, {"Retry-After": str(self.behavior.retry_after)}, \
+                {"error": {"message": "Rate limit exceeded (injected)", "type": "rate_limit_error"}}, 0.0
+        if draw < self.behavior.rate_limit_rate + self.behavior.error_rate:
+            self._count("injected_500")
+            return 500, {}, {"error": {"message": "Internal server error (injected)", "type": "server_error"}}, latency
+
+        n = max(1, int(body.get("n") or 1))
+        if is_judge:
+            kind, content = self.judge(system, user)
+            contents = [content]
+        else:
+            kind = "model"
+            contents = [self.answer(body.get("model", ""), user, choice) for choice in range(n)]
+        self._count(kind)
+
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        completion_tokens = sum(len(content) for content in contents) // 4
+        return 200, {}, {
+            "id": f"mock-{self.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": index, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                        for index, content in enumerate(contents)],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }, latency
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+def _make_handler(provider: MockProvider):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive，与真实服务商一样复用连接
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            # 任意 GET 返回统计信息
+            self._send(200, provider.snapshot())
+
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                self._send(400, {"error": {"message": "invalid JSON", "type": "invalid_request_error"}})
+                return
+            provider._count("in_flight")
+            try:
+                status, headers, payload, latency = provider.handle(body)
+                if latency > 0:
+                    time.sleep(latency)
+            finally:
+                provider._count("in_flight", -1)
+            self._send(status, payload, headers)
+
+    return Handler
+
+
+def start_server(provider: MockProvider, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程中启动服务，返回 server（server.server_address 为实际端口，用 server.shutdown() 停止）"""
+    server = ThreadingHTTPServer((host, port), _make_handler(provider))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="离线的 OpenAI 兼容模拟服务商（被测模型 + judge）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口，0 表示随机端口（默认 8765）")
+    parser.add_argument("--latency", default=MockBehavior.latency, help="被测模型请求的延迟分布（默认 lognormal:0.2,0.5）")
+    parser.add_argument("--judge-latency", default=MockBehavior.judge_latency, help="judge 请求的延迟分布（默认 fixed:0.05）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="429 响应的 Retry-After 秒数")
+    parser.add_argument("--script", help="回答脚本 JSON 文件（见 MockBehavior.script）")
+    parser.add_argument("--questionnaires", nargs="*", default=["questionnaires_en.json", "generated_questionnaires"],
+                        help="用于识别问卷和量表的问卷文件或目录")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    args = build_parser().parse_args(argv)
+    script = {}
+    if args.script:
+        with open(args.script, "r", encoding="utf-8") as f:
+            script = json.load(f)
+    behavior = MockBehavior(latency=args.latency, judge_latency=args.judge_latency, error_rate=args.error_rate,
+                            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after, seed=args.seed,
+                            script=script)
+    provider = MockProvider(behavior, load_questionnaire_index(args.questionnaires))
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(provider))
+    server.daemon_threads = True
+    host, port = server.server_address[:2]
+    # 第一行输出监听地址，供 bench_throughput.py 读取随机端口
+    print(f"mock provider listening on http://{host}:{port}", flush=True)
+    print(f"识别 {len(provider.questionnaire_index)} 个问卷 prompt, 模型延迟 {args.latency}, judge 延迟 {args.judge_latency}, "
+          f"500 比例 {args.error_rate}, 429 比例 {args.rate_limit_rate}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(provider.snapshot(), ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+
+def _openai_payload(payload: dict) -> dict:
+    """OpenAI 兼容接口：不需要额外字段"""
+    return payload
+
+
+def _qianfan_payload(payload: dict) -> dict:
+    """千帆：关闭默认开启的联网搜索，避免搜索结果混入问卷回答"""
+    payload["web_search"] = {
+        "enable": False,
+        "enable_citation": False,
+        "enable_trace": False
+    }
+    return payload
+
+
+# 请求体适配器：在最小的 OpenAI 兼容请求体上补充服务商特有的字段
+PAYLOAD_ADAPTERS: Dict[str, Callable[[dict], dict]] = {
+    "openai": _openai_payload,
+    "qianfan": _qianfan_payload,
+}
+
+# 未在 api.<服务商>.adapter 中指定时按服务商名选择适配器，其余服务商使用 openai
+DEFAULT_ADAPTERS = {
+    "Qianfan": "qianfan",
+}
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """一个模型的路由：所属服务商、接口地址、密钥和请求体适配器"""
+    model: str                    # 发送给服务商的模型名（别名解析后）
+    provider: str
+    base_url: str
+    api_key: str
+    adapter: str = "openai"
+    rate_limit: Optional[dict] = None
+    supports_n: bool = False
+    headers: Dict[str, str] = field(default_factory=dict, repr=False)
+
+    def payload(self, messages: list, temperature: float, max_tokens: int, n: int = 1) -> dict:
+        """生成请求体；n 为 1 时不发送，由服务商使用默认值"""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if n != 1:
+            payload["n"] = n
+        return PAYLOAD_ADAPTERS[self.adapter](payload)
+
+
+class RoutingTable:
+    """模型名（或别名）→ ModelRoute 的路由表，加载配置时编译一次，请求时只做字典查找"""
+    def __init__(self, source: dict):
+        self.source = source
+        self.routes: Dict[str, ModelRoute] = {}
+        self.unconfigured: Dict[str, str] = {}   # 缺少 base_url 或密钥的模型 → 服务商
+
+        aliases = {}
+        for provider, provider_config in source.items():
+            provider_config = provider_config or {}
+            adapter = provider_config.get("adapter") or DEFAULT_ADAPTERS.get(provider, "openai")
+            if adapter not in PAYLOAD_ADAPTERS:
+                raise ValueError(f"未知的请求体适配器: api.{provider}.adapter = {adapter}，可选: {', '.join(PAYLOAD_ADAPTERS)}")
+            base_url = provider_config.get("base_url")
+            for model, api_key in (provider_config.get("api_key") or {}).items():
+                if model in self.routes or model in self.unconfigured:
+                    print(f"模型 {model} 在多个服务商中配置，使用先出现的 {self.provider_of(model)}，忽略 {provider}")
+                    continue
+                if not base_url or not api_key:
+                    self.unconfigured[model] = provider
+                    continue
+                self.routes[model] = ModelRoute(
+                    model=model,
+                    provider=provider,
+                    base_url=base_url,
+                    api_key=api_key,
+                    adapter=adapter,
+                    rate_limit=provider_config.get("rate_limit"),
+                    supports_n=bool(provider_config.get("supports_n", False)),
+                    headers={
+                        'Accept': 'application/json',
+                        'Authorization': f'Bearer {api_key}',
+                        'Content-Type': 'application/json'
+                    }
+                )
+            for alias, model in (provider_config.get("aliases") or {}).items():
+                if alias in aliases:
+                    raise ValueError(f"模型别名 {alias} 重复定义（{aliases[alias][0]} 和 {provider}）")
+                aliases[alias] = (provider, model)
+
+        # 别名只能指向同一服务商下配置的模型，且不能与模型名冲突，避免模糊匹配把请求发到错误的服务商
+        for alias, (provider, model) in aliases.items():
+            if alias in self.routes or alias in self.unconfigured:
+                raise ValueError(f"模型别名 {alias}（api.{provider}.aliases）与已配置的模型名冲突")
+            if self.provider_of(model) != provider:
+                raise ValueError(f"模型别名 {alias} 指向的模型 {model} 未在 api.{provider}.api_key 中配置")
+            if model in self.routes:
+                self.routes[alias] = self.routes[model]
+            else:
+                self.unconfigured[alias] = provider
+
+    def provider_of(self, model: str) -> Optional[str]:
+        route = self.routes.get(model)
+        return route.provider if route is not None else self.unconfigured.get(model)
+
+    def resolve(self, model: str) -> ModelRoute:
+        """查找模型的路由；未配置或缺少 base_url / 密钥时抛出 ValueError"""
+        route = self.routes.get(model)
+        if route is not None:
+            return route
+        provider = self.unconfigured.get(model)
+        if provider is not None:
+            raise ValueError(f"Missing API configuration for model {model} in {provider}")
+        print(f"Unsupported model: {model}")
+        raise ValueError(f"Unsupported model: {model}")
+
+    def models(self) -> List[str]:
+        return list(self.routes)
+
+    def provider_config(self, provider: str) -> dict:
+        """服务商的原始配置（例如 GLM 使用 SDK 调用，不经过 ModelRoute）"""
+        return self.source.get(provider) or {}
+
+
+def compile_routing_table(api_config: dict) -> RoutingTable:
+    """由 api 配置编译路由表；load_config 中调用一次，结果保存在 testing_config.routing 并传给 chat() 等函数"""
+    return RoutingTable(api_config)
@@ -0,0 +1,240 @@
+import csv
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+REPORT_FILE_NAME = "parse_statistics.md"
+JSON_FILE_NAME = "parse_statistics.json"
+CSV_FILE_NAME = "parse_statistics.csv"
+
+# 汇总维度：名称 -> 取单元键 (setting, language, model, questionnaire) 中的哪些位置
+ROLLUPS = {
+    "model": (2,),
+    "questionnaire": (3,),
+    "setting": (0,),
+    "language": (1,),
+    "setting_language": (0, 1),
+    "model_questionnaire": (2, 3),
+}
+
+CellKey = Tuple[str, str, str, str]
+
+
+def _accuracy(total: int, errors: int) -> float:
+    return ((total - errors) / total * 100) if total > 0 else 0
+
+
+def _new_counter() -> Dict[str, int]:
+    return {"total": 0, "errors": 0}
+
+
+def _atomic_write(path: str, write):
+    """先写临时文件再替换，报告在任何时刻都是完整的"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class ParseStatsAggregator:
+    """解析统计的增量汇总器
+
+    每个测试单元完成后调用 record，只更新该单元和各汇总维度的计数器（O(1)）；
+    报告按 flush_interval 定时写出或在 close 时写出，不再每个单元重写一次。
+    - 每个 (角色, 语言) 目录下的 parse_statistics.md 保持原有格式，只重写有变化的目录
+    - base_dir 下的 parse_statistics.md / .json / .csv 覆盖全部角色和语言
+    """
+    def __init__(self, base_dir: str, flush_interval: float = 30.0):
+        self.base_dir = base_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._cells: Dict[CellKey, Dict[str, int]] = {}
+        self._rollups: Dict[str, Dict[tuple, Dict[str, int]]] = {name: {} for name in ROLLUPS}
+        # 按 (角色, 语言) 保存 {total: {模型: 计数}, by_questionnaire: {模型: {问卷: 计数}}}，用于生成各目录的报告
+        self._groups: Dict[Tuple[str, str], dict] = {}
+        self._dirty_groups = set()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+
+    def record(self, setting: str, language: str, model: str, questionnaire: str, total: int, errors: int):
+        """累加一个测试单元的题数和错误数"""
+        key = (setting, language, model, questionnaire)
+        with self._lock:
+            counters = [self._cells.setdefault(key, _new_counter())]
+            for name, positions in ROLLUPS.items():
+                counters.append(self._rollups[name].setdefault(tuple(key[i] for i in positions), _new_counter()))
+
+            group = self._groups.setdefault((setting, language), {'total': {}, 'by_questionnaire': {}})
+            counters.append(group['total'].setdefault(model, _new_counter()))
+            counters.append(group['by_questionnaire'].setdefault(model, {}).setdefault(questionnaire, _new_counter()))
+
+            for counter in counters:
+                counter["total"] += total
+                counter["errors"] += errors
+            self._dirty_groups.add((setting, language))
+            self._dirty = True
+
+    def start(self):
+        """启动定时写出线程（flush_interval <= 0 时只在 close 时写出）"""
+        if self._thread is not None or self.flush_interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="parse-stats-flush", daemon=True)
+        self._thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"写出解析统计失败: {str(e)}")
+
+    def close(self):
+        """停止定时线程并写出最终报告"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def snapshot(self) -> dict:
+        """返回当前全部统计（单元明细和各维度汇总）"""
+        with self._lock:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self) -> dict:
+        cells = [
+            {"setting": key[0], "language": key[1], "model": key[2], "questionnaire": key[3],
+             "total": counter["total"], "errors": counter["errors"],
+             "accuracy": round(_accuracy(counter["total"], counter["errors"]), 4)}
+            for key, counter in sorted(self._cells.items())
+        ]
+        rollups = {}
+        for name, positions in ROLLUPS.items():
+            fields = [("setting", "language", "model", "questionnaire")[i] for i in positions]
+            rollups[name] = [
+                dict(zip(fields, key), total=counter["total"], errors=counter["errors"],
+                     accuracy=round(_accuracy(counter["total"], counter["errors"]), 4))
+                for key, counter in sorted(self._rollups[name].items())
+            ]
+        return {"updated_at": time.time(), "cells": cells, "rollups": rollups}
+
+    def flush(self) -> bool:
+        """有新数据时写出报告，返回是否写出"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            snapshot = self._snapshot_locked()
+            groups = {key: self._groups[key] for key in self._dirty_groups}
+            group_reports = {key: render_group_report(stats) for key, stats in groups.items()}
+            self._dirty_groups.clear()
+            self._dirty = False
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        for (setting, language), report in group_reports.items():
+            report_dir = os.path.join(self.base_dir, setting, language)
+            os.makedirs(report_dir, exist_ok=True)
+            _atomic_write(os.path.join(report_dir, REPORT_FILE_NAME), lambda f: f.write(report))
+
+        _atomic_write(os.path.join(self.base_dir, REPORT_FILE_NAME), lambda f: f.write(render_overall_report(snapshot)))
+        _atomic_write(os.path.join(self.base_dir, JSON_FILE_NAME),
+                      lambda f: json.dump(snapshot, f, ensure_ascii=False, indent=2))
+        _atomic_write(os.path.join(self.base_dir, CSV_FILE_NAME), lambda f: _write_csv(f, snapshot["cells"]))
+        self.flushes += 1
+        return True
+
+    def report(self) -> str:
+        with self._lock:
+            total = sum(counter["total"] for counter in self._rollups["model"].values())
+            errors = sum(counter["errors"] for counter in self._rollups["model"].values())
+            cells = len(self._cells)
+        return (f"解析统计: {cells} 个单元, 总题数 {total}, 错误数 {errors}, 正确率 {_accuracy(total, errors):.2f}%, "
+                f"写出 {self.flushes} 次, 报告: {os.path.join(self.base_dir, REPORT_FILE_NAME)}")
+
+
+def _write_csv(f, cells: List[dict]):
+    writer = csv.DictWriter(f, fieldnames=["setting", "language", "model", "questionnaire", "total", "errors", "accuracy"])
+    writer.writeheader()
+    writer.writerows(cells)
+
+
+def _table(headers: List[str], rows: List[list]) -> str:
+    text = "| " + " | ".join(headers) + " |\n"
+    text += "|" + "|".join("------" for _ in headers) + "|\n"
+    for row in rows:
+        text += "| " + " | ".join(str(value) for value in row) + " |\n"
+    return text
+
+
+def render_group_report(group_stats: dict) -> str:
+    """生成单个 (角色, 语言) 目录的报告：模型总体、问卷总体和各模型按问卷的统计"""
+    report = "# 解析统计报告\n\n"
+
+    # 总体统计
+    report += "## 模型总体统计\n\n"
+    report += _table(["模型", "总题数", "错误数", "正确率"], [
+        [model, stats['total'], stats['errors'], f"{_accuracy(stats['total'], stats['errors']):.2f}%"]
+        for model, stats in group_stats['total'].items()
+    ])
+
+    # 问卷总体统计
+    questionnaire_stats = {}
+    for questionnaires in group_stats['by_questionnaire'].values():
+        for questionnaire, stats in questionnaires.items():
+            counter = questionnaire_stats.setdefault(questionnaire, _new_counter())
+            counter['total'] += stats['total']
+            counter['errors'] += stats['errors']
+    report += "\n## 问卷总体统计\n\n"
+    report += _table(["问卷", "总题数", "错误数", "平均正确率"], [
+        [questionnaire, stats['total'], stats['errors'], f"{_accuracy(stats['total'], stats['errors']):.2f}%"]
+        for questionnaire, stats in questionnaire_stats.items()
+    ])
+
+    # 按问卷统计
+    report += "\n## 按问卷统计\n\n"
+    for model, questionnaires in group_stats['by_questionnaire'].items():
+        report += f"\n### {model}\n\n"
+        report += _table(["问卷", "总题数", "错误数", "正确率"], [
+            [questionnaire, stats['total'], stats['errors'], f"{_accuracy(stats['total'], stats['errors']):.2f}%"]
+            for questionnaire, stats in questionnaires.items()
+        ])
+    return report
+
+
+def render_overall_report(snapshot: dict) -> str:
+    """生成覆盖全部角色和语言的总报告"""
+    rollups = snapshot["rollups"]
+
+    def rows(name: str, fields: List[str]) -> List[list]:
+        return [[entry[field] for field in fields] + [entry["total"], entry["errors"], f"{entry['accuracy']:.2f}%"]
+                for entry in rollups[name]]
+
+    report = "# 解析统计总报告\n\n"
+    report += "## 模型总体统计\n\n"
+    report += _table(["模型", "总题数", "错误数", "正确率"], rows("model", ["model"]))
+    report += "\n## 问卷总体统计\n\n"
+    report += _table(["问卷", "总题数", "错误数", "正确率"], rows("questionnaire", ["questionnaire"]))
+    report += "\n## 按角色统计\n\n"
+    report += _table(["角色", "总题数", "错误数", "正确率"], rows("setting", ["setting"]))
+    report += "\n## 按语言统计\n\n"
+    report += _table(["语言", "总题数", "错误数", "正确率"], rows("language", ["language"]))
+
+    # 角色 × 语言 正确率矩阵
+    settings = [entry["setting"] for entry in rollups["setting"]]
+    languages = [entry["language"] for entry in rollups["language"]]
+    accuracy = {(entry["setting"], entry["language"]): entry["accuracy"] for entry in rollups["setting_language"]}
+    report += "\n## 角色 × 语言 正确率\n\n"
+    report += _table(["角色"] + languages, [
+        [setting] + [f"{accuracy[(setting, language)]:.2f}%" if (setting, language) in accuracy else "-"
+                     for language in languages]
+        for setting in settings
+    ])
+
+    report += "\n## 按模型和问卷统计\n\n"
+    report += _table(["模型", "问卷", "总题数", "错误数", "正确率"], rows("model_questionnaire", ["model", "questionnaire"]))
+    return report
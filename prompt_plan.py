@@ -0,0 +1,156 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from cipher import base64_encode, rot3_encode
+
+
+# 计划内容变化（提示词模板、分批方式）时修改版本号，使旧的计划ID和恢复日志失效
+PROMPT_PLAN_VERSION = "plan-v1"
+
+# 语言提示词映射字典
+LANGUAGE_PROMPTS = {
+    "en": "\n\nPlease provide your response to the above statement in English.",
+    "zh": "\n\n请用中文回答上述问题。",
+    "es": "\n\nPor favor, proporcione su respuesta a la declaración anterior en español.",
+    "fr": "\n\nVeuillez fournir votre réponse à la déclaration ci-dessus en français.",
+    "de": "\n\nBitte geben Sie Ihre Antwort auf die obige Aussage auf Deutsch.",
+    "ru": "\n\nПожалуйста, предоставьте ваш ответ на вышеуказанное утверждение на русском языке.",
+    "ja": "\n\n上記の質問に対して日本語で回答してください。",
+    "ar": "يرجى تقديم إجابتك على البيان أعلاه باللغة العربية.\n\n"
+}
+
+# 编码类角色要求模型以相同编码回答，不使用语言提示词
+ENCODED_RESPONSE_PROMPTS = {
+    "base64": "Please provide your response to the above statement in Base64.",
+    "Caesar": "Please provide your response to the above statement in Caesar cipher."
+}
+
+# 部分模型的系统提示词需要特殊处理：{模型: {inner_setting_type: 替换后的系统提示词}}
+SYSTEM_PROMPT_OVERRIDES = {
+    "gemini-2.0-flash-exp": {"default": "  "}
+}
+
+
+@lru_cache(maxsize=None)
+def _base64_encode_cached(text: str) -> str:
+    """同一批题目在不同模型、重复运行间只编码一次"""
+    return base64_encode(text)
+
+
+def encode_questions(text: str, inner_setting_type: str) -> str:
+    """按角色类型对题目文本编码"""
+    if inner_setting_type == "base64":
+        return _base64_encode_cached(text)
+    if inner_setting_type == "Caesar":
+        return rot3_encode(text)
+    return text
+
+
+@dataclass(frozen=True)
+class PromptBatch:
+    """一个批次的提示词：包含的题号和 system/user 消息内容"""
+    batch_index: int
+    question_ids: Tuple[str, ...]
+    system: str
+    user: str
+
+    def messages(self, system: Optional[str] = None) -> List[dict]:
+        """生成发送给模型的消息列表（每次返回新列表，调用方修改不会影响计划）"""
+        return [
+            {"role": "system", "content": self.system if system is None else system},
+            {"role": "user", "content": self.user}
+        ]
+
+
+@dataclass(frozen=True)
+class PromptPlan:
+    """(问卷, 语言, 角色类型, batch_size) 编译后的不可变提示词计划，所有模型共用"""
+    plan_id: str
+    questionnaire: str
+    language: str
+    inner_setting_type: str
+    batch_size: int
+    batches: Tuple[PromptBatch, ...]
+
+    @property
+    def batch_question_ids(self) -> List[List[str]]:
+        return [list(batch.question_ids) for batch in self.batches]
+
+    def inputs_for(self, model: str) -> List[List[dict]]:
+        """按模型生成每个批次的消息列表，在这里应用模型相关的系统提示词替换"""
+        system = SYSTEM_PROMPT_OVERRIDES.get(model, {}).get(self.inner_setting_type)
+        return [batch.messages(system) for batch in self.batches]
+
+
+def compile_prompt_plan(questionnaire: dict, language: str, inner_setting_type: str, batch_size: int) -> PromptPlan:
+    """把问卷编译为按批次划分的提示词计划；计划ID由全部消息内容计算"""
+    batch_size = max(1, int(batch_size))
+    items = list(questionnaire["questions"].items())
+    system = questionnaire.get("inner_setting", "")
+    adjusted_prompt = questionnaire.get("prompt", "")
+    response_prompt = ENCODED_RESPONSE_PROMPTS.get(inner_setting_type) or LANGUAGE_PROMPTS.get(language, LANGUAGE_PROMPTS["en"])
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([PROMPT_PLAN_VERSION, questionnaire["name"], language, inner_setting_type, batch_size],
+                             ensure_ascii=False).encode("utf-8"))
+    batches = []
+    for batch_index, start in enumerate(range(0, len(items), batch_size)):
+        chunk = items[start:start + batch_size]
+        questions_string = '\n'.join(f"{q_num}.{q_text}" for q_num, q_text in chunk)
+        user = adjusted_prompt + ' \n ' + encode_questions(questions_string, inner_setting_type) + ' \n ' + response_prompt
+        batch = PromptBatch(
+            batch_index=batch_index,
+            question_ids=tuple(q_num for q_num, _ in chunk),
+            system=system,
+            user=user
+        )
+        batches.append(batch)
+
+    # 系统提示词对所有批次相同，只计入一次；各字段以不可见分隔符拼接后整体计算哈希
+    digest.update(system.encode("utf-8"))
+    digest.update("\x1e".join("\x1f".join(batch.question_ids) + "\x1d" + batch.user for batch in batches).encode("utf-8"))
+
+    return PromptPlan(
+        plan_id=digest.hexdigest()[:16],
+        questionnaire=questionnaire["name"],
+        language=language,
+        inner_setting_type=inner_setting_type,
+        batch_size=batch_size,
+        batches=tuple(batches)
+    )
+
+
+class PromptPlanStore:
+    """一次运行内的提示词计划表，按 (问卷, 语言, 角色类型, batch_size) 索引"""
+    def __init__(self):
+        self._plans: Dict[Tuple[str, str, str, int], PromptPlan] = {}
+        self._lock = threading.Lock()
+        self.compile_seconds = 0.0
+
+    def compile(self, questionnaire: dict, language: str, inner_setting_type: str, batch_size: int) -> PromptPlan:
+        """编译并登记计划，已存在时直接返回"""
+        key = (questionnaire["name"], language, inner_setting_type, int(batch_size))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is None:
+                started = time.perf_counter()
+                plan = compile_prompt_plan(questionnaire, language, inner_setting_type, batch_size)
+                self.compile_seconds += time.perf_counter() - started
+                self._plans[key] = plan
+            return plan
+
+    def get(self, questionnaire_name: str, language: str, inner_setting_type: str, batch_size: int) -> Optional[PromptPlan]:
+        with self._lock:
+            return self._plans.get((questionnaire_name, language, inner_setting_type, int(batch_size)))
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def report(self) -> str:
+        batches = sum(len(plan.batches) for plan in self._plans.values())
+        return f"提示词计划: {len(self._plans)} 个, 共 {batches} 个批次, 编译耗时 {self.compile_seconds * 1000:.2f} ms"
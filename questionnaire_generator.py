@@ -1,6 +1,6 @@
 from typing import List
 from dataclasses import dataclass
-from translate import translate_questionnaire
+from generation_manifest import GenerationManifest, atomic_write_json, content_hash
 import json
 import os
 
@@ -29,7 +29,11 @@ class QuestionnaireGeneratorConfig:
     translation: TranslationConfig
 
 class QuestionnaireGenerator:
-    """问卷生成器"""
+    """问卷生成器
+
+    可以一次生成多个 inner_setting 类型：题目和 prompt 每种语言只翻译一次，
+    每个不同的 inner_setting 文本也只翻译一次，再组合写入各类型的目录。
+    """
     def __init__(self, config: QuestionnaireGeneratorConfig):
         self.config = config
         self.questionnaires = {}
@@ -39,30 +43,43 @@ class QuestionnaireGenerator:
         # 直接访问 BaseConfig 的属性
         self.inner_settings = config.base.inner_settings
         self.inner_setting_type = config.base.inner_setting_type
+        # 本次要生成的 inner_setting 类型：配置了 inner_setting_types 时生成所有启用的类型，否则只生成 inner_setting_type
+        enabled_types = [name for name, enabled in (config.base.inner_setting_types or {}).items() if enabled]
+        self.inner_setting_types = enabled_types or [self.inner_setting_type]
+        # {inner_setting 类型: {语言: 该语言的 inner_setting 文本}}
+        self.translated_inner_settings = {}
+        # 持久化的翻译记忆：重新生成时只翻译新增或修改过的文本（需要翻译时才打开）
+        self.translation_memory = None
+        # 生成清单：输入未变化的 (问卷, 语言, 类型) 直接跳过
+        self.manifest = GenerationManifest(config.base.output_dir) if config.base.incremental else None
+        # {输出文件相对路径: {问卷名: 输入哈希}}，以及其中需要重新生成的问卷名
+        self.planned_outputs = {}
+        self.stale_outputs = {}
+        # 本次翻译失败（使用了英文原文）的问卷 {语言: {问卷名}} 和 inner_setting {(类型, 语言)}，
+        # 对应条目不记入清单，下次运行重新生成
+        self.failed_translations = {}
+        self.failed_inner_settings = set()
+
+    def _inner_setting_text(self, inner_setting_type: str) -> str:
+        return self.inner_settings.get(inner_setting_type, self.inner_settings.get("default", ""))
     
     def load_source_questionnaires(self):
         """加载源问卷"""
         print("\n开始加载源问卷...")
         with open("./questionnaires_en.json", "r", encoding="utf-8") as f:
             all_questionnaires = json.load(f)
+
+        print(f"\n使用 inner_setting 类型: {', '.join(self.inner_setting_types)}")
+        for inner_setting_type in self.inner_setting_types:
+            print(f"{inner_setting_type} inner_setting: {self._inner_setting_text(inner_setting_type)}")
             
-        # 获取选定的 inner_setting
-        selected_setting = self.inner_settings.get(
-            self.inner_setting_type, 
-            self.inner_settings.get("default", "")
-        )
-        print(f"\n使用 inner_setting 类型: {self.inner_setting_type}")
-        print(f"inner_setting: {selected_setting}")
-            
-        # 只保留配置中指定的问卷，并统一修改 inner_setting
+        # 只保留配置中指定的问卷；inner_setting 在保存时按类型填入，翻译题目时先置空
         self.original_questionnaires = {
             q["name"]: q for q in all_questionnaires 
             if q["name"] in self.config.base.questionnaires  # 直接访问 questionnaires 属性
         }
-        
-        # 为所有问卷统一设置 inner_setting
         for questionnaire in self.original_questionnaires.values():
-            questionnaire["inner_setting"] = selected_setting
+            questionnaire["inner_setting"] = ""
             
         # 复制一份用于后续同义词替换
         self.questionnaires = json.loads(json.dumps(self.original_questionnaires))
@@ -70,55 +87,187 @@ class QuestionnaireGenerator:
         # 这里遍历下questionnaires的key，放在一个list里输出
         print(list(self.questionnaires.keys()))
     
+    def _output_languages(self) -> list:
+        languages = ["en"]
+        if self.config.translation.enabled:
+            languages += [lang for lang in self.config.translation.target_languages if lang != "en"]
+        return languages
+
+    def _translator_settings(self) -> dict:
+        """影响译文的翻译器设置（不含密钥）"""
+        translation = self.config.translation
+        return {
+            "endpoint": translation.azure_translator.get("endpoint"),
+            "api_version": str(translation.azure_translator.get("api_version", "3.0")),
+            "translator_version": (translation.memory or {}).get("translator_version")
+        }
+
+    @staticmethod
+    def _output_path(inner_setting_type: str, lang: str) -> str:
+        return os.path.join(inner_setting_type, lang, f"questionnaires_{lang}.json")
+
+    def plan_outputs(self):
+        """计算每个输出文件中各问卷条目的输入哈希，并与清单比较找出需要重新生成的条目"""
+        translator_settings = self._translator_settings()
+        self.planned_outputs = {}
+        self.stale_outputs = {}
+        for inner_setting_type in self.inner_setting_types:
+            inner_setting = self._inner_setting_text(inner_setting_type)
+            for lang in self._output_languages():
+                relative_path = self._output_path(inner_setting_type, lang)
+                planned = {
+                    name: content_hash(questionnaire, inner_setting, lang, translator_settings if lang != "en" else None)
+                    for name, questionnaire in self.original_questionnaires.items()
+                }
+                self.planned_outputs[relative_path] = planned
+                if self.manifest is None:
+                    self.stale_outputs[relative_path] = list(planned)
+                elif not self.manifest.is_current(relative_path, planned):
+                    stale = self.manifest.stale_entries(relative_path, planned)
+                    # 清单中记录了但文件里缺失的条目也需要重新生成
+                    existing = self._load_existing(relative_path)
+                    stale += [name for name in planned if name not in existing and name not in stale]
+                    self.stale_outputs[relative_path] = stale
+
+        total = len(self.planned_outputs)
+        entries = sum(len(names) for names in self.stale_outputs.values())
+        print(f"\n生成清单: {total} 个输出文件中 {total - len(self.stale_outputs)} 个未变化, "
+              f"{len(self.stale_outputs)} 个需要更新（共 {entries} 个问卷条目）")
+
+    def _load_existing(self, relative_path: str) -> dict:
+        path = os.path.join(self.config.base.output_dir, relative_path)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return {questionnaire["name"]: questionnaire for questionnaire in json.load(f)}
+        except (OSError, json.JSONDecodeError, KeyError, TypeError) as e:
+            print(f"读取已有问卷文件失败，整个文件重新生成: {path}: {str(e)}")
+            return {}
+
+    def _stale_work(self):
+        """根据需要更新的条目，返回需要翻译的 (问卷名, 语言, inner_setting 类型)"""
+        names, langs, types = set(), set(), set()
+        for relative_path, stale in self.stale_outputs.items():
+            inner_setting_type, lang, _ = relative_path.split(os.sep)
+            if stale:
+                names.update(stale)
+                langs.add(lang)
+                types.add(inner_setting_type)
+        return names, langs, types
+
     def translate_questionnaires(self):
-        """翻译问卷"""
+        """翻译问卷：题目和 prompt 各语言只翻译一次，各 inner_setting 文本去重后单独翻译
+
+        只翻译需要更新的问卷、语言和 inner_setting 类型（见 plan_outputs）。
+        """
+        self.translated_inner_settings = {
+            inner_setting_type: {"en": self._inner_setting_text(inner_setting_type)}
+            for inner_setting_type in self.inner_setting_types
+        }
         if not self.config.translation.enabled:
             print("翻译功能未启用，跳过翻译步骤")
             return
+
+        names, langs, types = self._stale_work()
+        target_languages = [lang for lang in self.config.translation.target_languages if lang in langs]
+        if not target_languages:
+            print("翻译结果均未变化，跳过翻译步骤")
+            return
             
         print("\n开始翻译问卷...")
-        for lang in self.config.translation.target_languages:
-            print(f"\n翻译至 {lang}...")
-            translated = translate_questionnaire(
-                source_questionnaires=self.original_questionnaires,  # 使用原始问卷进行翻译
-                target_lang=lang,
-                translator_config=self.config.translation.azure_translator
-            )
+        # 翻译模块（以及 httpx、限流重试依赖）只在确实需要翻译时导入
+        from translate import translate_questionnaires, translate_texts
+        from translation_memory import init_translation_memory
+        translation = self.config.translation
+        self.translation_memory = init_translation_memory(translation.memory)
+        source_questionnaires = {name: q for name, q in self.original_questionnaires.items() if name in names}
+        options = dict(
+            translator_config=translation.azure_translator,
+            retry_count=translation.retry_count,
+            delay=translation.delay,
+            memory=self.translation_memory,
+            concurrency=translation.concurrency,
+            rate_limit=translation.rate_limit
+        )
+        # 所有目标语言合并在同一批请求中翻译
+        translated_by_lang = translate_questionnaires(
+            source_questionnaires=source_questionnaires,  # 使用原始问卷进行翻译
+            target_langs=target_languages,
+            failures=self.failed_translations,
+            **options
+        )
+        for lang, translated in translated_by_lang.items():
             # 保存替换前的翻译版本
             self.original_translated_questionnaires[lang] = json.loads(json.dumps(translated))
             # 保存用于替换的版本
             self.translated_questionnaires[lang] = translated
+
+        # 各类型的 inner_setting 文本（相同文本只翻译一次，空文本不翻译）
+        setting_texts = list(dict.fromkeys(
+            text for text in (self._inner_setting_text(t) for t in self.inner_setting_types if t in types) if text
+        ))
+        setting_translations = translate_texts(setting_texts, target_languages, **options)
+        for inner_setting_type in self.inner_setting_types:
+            if inner_setting_type not in types:
+                continue
+            text = self._inner_setting_text(inner_setting_type)
+            for lang in target_languages:
+                value = setting_translations[lang][setting_texts.index(text)] if text and lang in setting_translations else None
+                if text and lang != "en" and value is None:
+                    print(f"[{lang}] {inner_setting_type} inner_setting 翻译失败，使用原文")
+                    self.failed_inner_settings.add((inner_setting_type, lang))
+                self.translated_inner_settings[inner_setting_type][lang] = value or text
+        if self.translation_memory is not None:
+            print(self.translation_memory.report())
+
+    def _build_entry(self, name: str, inner_setting_type: str, lang: str) -> dict:
+        """生成一个问卷条目：源问卷或译文，填入该类型、该语言的 inner_setting"""
+        inner_settings = self.translated_inner_settings[inner_setting_type]
+        if lang == "en":
+            return dict(self.questionnaires[name], inner_setting=inner_settings["en"])
+        return dict(self.translated_questionnaires[lang][name], inner_setting=inner_settings.get(lang, inner_settings["en"]))
     
+    def _failed_entries(self, inner_setting_type: str, lang: str) -> set:
+        """该类型、该语言的输出文件中使用了英文原文的问卷名；inner_setting 翻译失败时整个文件的条目都算"""
+        if (inner_setting_type, lang) in self.failed_inner_settings:
+            return set(self.planned_outputs[self._output_path(inner_setting_type, lang)])
+        return self.failed_translations.get(lang, set())
+
     def save_questionnaires(self):
-        """保存生成的问卷"""
+        """保存生成的问卷：每个 inner_setting 类型一个目录，目录下每种语言一个文件
+
+        只重写需要更新的文件，文件中未变化的问卷条目沿用已有内容；写入先写临时文件再替换。
+        """
         print("\n保存问卷...")
-        base_dir = os.path.join(self.config.base.output_dir, self.inner_setting_type)
-        os.makedirs(base_dir, exist_ok=True)
-        
-        # 保存源语言问卷（只保存替换后）
-        source_lang_dir = os.path.join(base_dir, "en")
-        os.makedirs(source_lang_dir, exist_ok=True)
-        
-        # 只保存替换后的源问卷
-        replaced_path = os.path.join(source_lang_dir, "questionnaires_en.json")
-        with open(replaced_path, "w", encoding="utf-8") as f:
-            replaced_list = [questionnaire for questionnaire in self.questionnaires.values()]
-            json.dump(replaced_list, f, ensure_ascii=False, indent=2)
-        
-        # 保存翻译后的问卷（只保存替换后）
-        for lang, questionnaires in self.translated_questionnaires.items():
-            lang_dir = os.path.join(base_dir, lang)
-            os.makedirs(lang_dir, exist_ok=True)
-            
-            # 只保存替换后的翻译问卷
-            replaced_path = os.path.join(lang_dir, f"questionnaires_{lang}.json")
-            with open(replaced_path, "w", encoding="utf-8") as f:
-                replaced_translated_list = [questionnaire for questionnaire in questionnaires.values()]
-                json.dump(replaced_translated_list, f, ensure_ascii=False, indent=2)
+        output_dir = self.config.base.output_dir
+        for relative_path, stale in self.stale_outputs.items():
+            inner_setting_type, lang, _ = relative_path.split(os.sep)
+            stale = set(stale)
+            existing = self._load_existing(relative_path) if len(stale) < len(self.planned_outputs[relative_path]) else {}
+            questionnaires = [
+                self._build_entry(name, inner_setting_type, lang) if name in stale else existing[name]
+                for name in self.planned_outputs[relative_path]
+            ]
+            atomic_write_json(os.path.join(output_dir, relative_path), questionnaires)
+            failed = self._failed_entries(inner_setting_type, lang) & stale
+            if self.manifest is not None:
+                # 翻译失败的条目不记入清单，下次增量运行时重新翻译
+                self.manifest.record(relative_path, {
+                    name: digest for name, digest in self.planned_outputs[relative_path].items() if name not in failed
+                })
+            print(f"已保存 {relative_path}: 更新 {len(stale)} 个问卷"
+                  + (f"，其中 {len(failed)} 个翻译失败，下次运行重新生成" if failed else ""))
+        if self.manifest is not None:
+            self.manifest.save()
     
     def generate(self):
-        """执行完整的问卷生成流程"""
+        """执行完整的问卷生成流程；输入都未变化时直接返回"""
         self.load_source_questionnaires()
+        self.plan_outputs()
+        if not self.stale_outputs:
+            print("\n问卷均为最新，跳过生成")
+            return
         self.translate_questionnaires()
         self.save_questionnaires()
         print("\n问卷生成完成！") 
\ No newline at end of file
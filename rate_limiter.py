@@ -0,0 +1,220 @@
+import math
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+from tenacity.wait import wait_base
+
+
+# 可重试的HTTP状态码：超时、冲突、限流以及服务端临时错误
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+# 认证/权限错误：重试或换一种请求方式都不会成功
+AUTH_STATUS_CODES = {401, 403}
+
+# 退避参数：短随机指数退避，Retry-After 最长等待时间
+RETRY_ATTEMPTS = 6
+BACKOFF_MIN = 1
+BACKOFF_MAX = 20
+RETRY_AFTER_MAX = 120
+
+
+class TokenBucket:
+    """令牌桶：按每分钟配额匀速补充，允许透支并返回需要等待的秒数"""
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """预留 amount 个令牌，返回可以发送请求前需要等待的秒数"""
+        with self.lock:
+            self._refill()
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        """归还（amount 为负时补扣）令牌"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderRateLimiter:
+    """单个服务商的限流器：同时限制每分钟请求数(rpm)和每分钟token数(tpm)"""
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """为一次请求预留配额，返回需要等待的秒数"""
+        waits = [0.0]
+        if self.requests:
+            waits.append(self.requests.reserve(1))
+        if self.tokens and tokens:
+            waits.append(self.tokens.reserve(tokens))
+        with self.lock:
+            waits.append(self.blocked_until - time.monotonic())
+            wait = max(waits)
+            self.waited_seconds += wait
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        """阻塞直到可以发送请求"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0):
+        """acquire() 的异步版本"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            import asyncio
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """根据响应中的实际用量修正预留的token数"""
+        if self.tokens and actual is not None:
+            self.tokens.refund(estimated - actual)
+
+    def observe_error(self, exc: BaseException):
+        """遇到带 Retry-After 的错误时，暂停该服务商的所有请求"""
+        retry_after = retry_after_seconds(exc)
+        if retry_after is None:
+            return
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + min(retry_after, RETRY_AFTER_MAX))
+
+
+def estimate_tokens(messages, max_tokens: int = 0) -> int:
+    """粗略估算一次请求消耗的token数（约4个字符1个token，加上最大输出长度）"""
+    chars = sum(len(str(message.get("content", ""))) for message in messages)
+    return math.ceil(chars / 4) + (max_tokens or 0)
+
+
+def _error_response(exc: BaseException):
+    return getattr(exc, "response", None)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(_error_response(exc), "status_code", None)
+    return status
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """从错误响应的 Retry-After 头中解析等待秒数（支持秒数和HTTP日期两种格式）"""
+    response = _error_response(exc)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# 网络连接/超时错误：(模块, 异常类名)。只检查已导入的模块——错误来自某个库时该库必然已经加载，
+# 因此不需要为了判断错误类型而提前导入服务商 SDK
+_TRANSIENT_EXCEPTIONS = [
+    ("requests.exceptions", "ConnectionError"),
+    ("requests.exceptions", "Timeout"),
+    ("httpx", "TransportError"),
+    ("openai", "APIConnectionError"),
+]
+
+
+def _transient_exception_types() -> tuple:
+    types = []
+    for module_name, class_name in _TRANSIENT_EXCEPTIONS:
+        module = sys.modules.get(module_name)
+        if module is not None and hasattr(module, class_name):
+            types.append(getattr(module, class_name))
+    return tuple(types)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """判断错误是否值得重试：限流、服务端错误以及网络连接/超时错误"""
+    status = _status_code(exc)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    return isinstance(exc, _transient_exception_types())
+
+
+def is_auth_error(exc: BaseException) -> bool:
+    """密钥无效或没有权限（401 / 403），后续请求应直接放弃"""
+    return _status_code(exc) in AUTH_STATUS_CODES
+
+
+class wait_retry_after(wait_base):
+    """优先遵循 Retry-After，否则退回到短随机指数退避"""
+    def __init__(self, fallback: wait_base, max_wait: float = RETRY_AFTER_MAX):
+        self.fallback = fallback
+        self.max_wait = max_wait
+
+    def __call__(self, retry_state) -> float:
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        retry_after = retry_after_seconds(exc) if exc is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_wait)
+        return self.fallback(retry_state)
+
+
+# 服务商调用统一使用的重试策略：只重试临时错误
+provider_retry = retry(
+    retry=retry_if_exception(is_transient_error),
+    wait=wait_retry_after(wait_random_exponential(min=BACKOFF_MIN, max=BACKOFF_MAX)),
+    stop=stop_after_attempt(RETRY_ATTEMPTS),
+    reraise=True,
+)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rate_limit_config: Optional[dict] = None) -> ProviderRateLimiter:
+    """按服务商名称获取限流器，首次获取时根据 rate_limit 配置 (rpm/tpm) 创建"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rate_limit_config = rate_limit_config or {}
+            limiter = ProviderRateLimiter(
+                rpm=rate_limit_config.get("rpm"),
+                tpm=rate_limit_config.get("tpm")
+            )
+            _limiters[name] = limiter
+        return limiter
+
+
+def reset_rate_limiters():
+    """清空所有限流器（每次运行开始时调用）"""
+    with _limiters_lock:
+        _limiters.clear()
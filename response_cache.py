@@ -0,0 +1,190 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+
+# 参与缓存键计算的采样参数（batch_size、delay 等不影响模型输出；replicate 区分重复施测的各次独立请求）
+SAMPLING_PARAM_KEYS = ("temperature", "max_tokens", "n", "top_p", "replicate")
+
+
+class ResponseCache:
+    """基于SQLite的LLM响应缓存：按 (model, messages, 采样参数) 的哈希寻址，超出容量时按LRU淘汰"""
+    def __init__(self, path: str, max_size_mb: float = 512, bypass: bool = False, only_deterministic: bool = True):
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.bypass = bypass
+        self.only_deterministic = only_deterministic
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, value TEXT, size INTEGER, "
+            "created REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, messages, params: dict) -> str:
+        """内容寻址：对模型、消息和采样参数做规范化JSON后取sha256"""
+        sampling = {k: params[k] for k in SAMPLING_PARAM_KEYS if k in params}
+        content = json.dumps(
+            {"model": model, "messages": messages, "params": sampling},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def cacheable(self, params: dict) -> bool:
+        """默认只缓存确定性采样（temperature == 0）的请求"""
+        return not self.only_deterministic or params.get("temperature", 0) == 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，bypass 时总是未命中"""
+        with self._lock:
+            if self.bypass:
+                self.misses += 1
+                return None
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, model: str, value: Any):
+        """写入缓存（bypass 时仍然写入，相当于刷新缓存）"""
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._total_bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, data, size, now, now)
+            )
+            self._total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """超出容量时按最近访问时间淘汰，直到占用降到上限的90%"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "entries": entries,
+                "size_mb": self._total_bytes / 1024 / 1024,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total > 0 else 0.0
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"响应缓存统计: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, "
+                f"命中率 {stats['hit_rate'] * 100:.2f}%, 条目 {stats['entries']} 个, "
+                f"占用 {stats['size_mb']:.2f} MB, 淘汰 {stats['evictions']} 个")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+
+
+def init_response_cache(cache_config: dict = None) -> Optional[ResponseCache]:
+    """按配置创建本次运行使用的响应缓存，未启用时返回 None"""
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    cache_config = dict(cache_config or {})
+    if not cache_config.pop("enabled", False):
+        return None
+    _cache = ResponseCache(**cache_config)
+    return _cache
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    return _cache
+
+
+def cached_response(func):
+    """放在 chat()/completion() 之前的缓存层：命中时不再请求服务商
+
+    被装饰函数的前两个参数依次为模型名和消息列表，并带有 params 参数。
+    """
+    signature = inspect.signature(func)
+
+    def lookup(args, kwargs):
+        cache = get_response_cache()
+        bound = signature.bind(*args, **kwargs)
+        model, messages = list(bound.arguments.values())[:2]
+        params = bound.arguments["params"]
+        if cache is None or not cache.cacheable(params):
+            return None, None, model
+        key = cache.make_key(model, messages, params)
+        return cache, key, model
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            cache, key, model = lookup(args, kwargs)
+            if cache is not None:
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached
+            result = await func(*args, **kwargs)
+            if cache is not None:
+                cache.put(key, model, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache, key, model = lookup(args, kwargs)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        result = func(*args, **kwargs)
+        if cache is not None:
+            cache.put(key, model, result)
+        return result
+    return wrapper
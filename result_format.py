@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# v1：ResultManager 写出的格式，每道题都带完整的 prompt 和 response
+# v2：每个批次的 prompt / response / judge 只存一次，题目按列存储并通过 batch 序号引用；
+#     各批次 prompt 的公共前缀/后缀（问卷说明、语言提示词）提取到 prompt_template 中
+RESULT_FORMAT_VERSION = 2
+RESULT_FILE_NAME = "results.json"
+
+# 按批次存储的字段；其余逐题字段按列存储
+BATCH_FIELDS = ("prompt", "response", "judge")
+
+
+def _common_prefix(texts: List[str]) -> str:
+    return os.path.commonprefix(texts) if texts else ""
+
+
+def _prompt_template(prompts: List[Any]) -> Optional[Dict[str, List[str]]]:
+    """计算各角色消息内容的公共前缀和后缀（问卷说明、语言提示词等），只存一次
+
+    只处理仅含 role / content 字符串的消息列表，其他结构返回 None（prompt 原样保存）。
+    """
+    contents: Dict[str, List[str]] = {}
+    for prompt in prompts:
+        if not isinstance(prompt, list):
+            return None
+        for message in prompt:
+            if not isinstance(message, dict) or set(message) != {"role", "content"} or not isinstance(message["content"], str):
+                return None
+            contents.setdefault(message["role"], []).append(message["content"])
+    if not contents:
+        return None
+
+    template = {}
+    for role, texts in contents.items():
+        prefix = _common_prefix(texts)
+        remainders = [text[len(prefix):] for text in texts]
+        suffix = _common_prefix([text[::-1] for text in remainders])[::-1]
+        template[role] = [prefix, suffix]
+    return template
+
+
+def _strip_template(prompt: List[dict], template: Dict[str, List[str]]) -> List[List[str]]:
+    """消息列表 -> [[role, 去掉公共前后缀的内容], ...]"""
+    stripped = []
+    for message in prompt:
+        prefix, suffix = template[message["role"]]
+        content = message["content"][len(prefix):]
+        stripped.append([message["role"], content[:len(content) - len(suffix)]])
+    return stripped
+
+
+def _apply_template(prompt: List[List[str]], template: Dict[str, List[str]]) -> List[dict]:
+    return [{"role": role, "content": template[role][0] + content + template[role][1]} for role, content in prompt]
+
+
+def is_compact(result_data: dict) -> bool:
+    return result_data.get("version") == RESULT_FORMAT_VERSION
+
+
+def to_compact(result_data: dict) -> dict:
+    """把 v1 结果（metadata / questions / statistics）转换为 v2 结构"""
+    if is_compact(result_data):
+        return result_data
+
+    batches = []
+    batch_lookup = {}
+    question_contents = {}
+    columns: Dict[str, List[Any]] = {"question_id": [], "batch": []}
+
+    for index, question in enumerate(result_data.get("questions", [])):
+        batch = {field: question.get(field) for field in BATCH_FIELDS}
+        # 同一批次的题目共享完全相同的 prompt、response 和 judge
+        batch_key = json.dumps(batch, ensure_ascii=False, sort_keys=True)
+        batch_index = batch_lookup.get(batch_key)
+        if batch_index is None:
+            batch_index = len(batches)
+            batch_lookup[batch_key] = batch_index
+            batches.append(batch)
+
+        question_id = question.get("question_id")
+        question_contents.setdefault(question_id, question.get("question_content"))
+        columns["question_id"].append(question_id)
+        columns["batch"].append(batch_index)
+        for key, value in question.items():
+            if key in BATCH_FIELDS or key in ("question_id", "question_content"):
+                continue
+            # 个别题目缺少的字段用 None 补齐，保证各列等长
+            columns.setdefault(key, [None] * index).append(value)
+        for column in columns.values():
+            if len(column) < index + 1:
+                column.append(None)
+
+    template = _prompt_template([batch["prompt"] for batch in batches])
+    if template is not None:
+        for batch in batches:
+            batch["prompt"] = _strip_template(batch["prompt"], template)
+
+    return {
+        "version": RESULT_FORMAT_VERSION,
+        "metadata": result_data.get("metadata", {}),
+        "prompt_template": template,
+        "batches": batches,
+        "question_contents": question_contents,
+        "columns": columns,
+        "statistics": result_data.get("statistics", {})
+    }
+
+
+def iter_questions(result_data: dict) -> Iterator[dict]:
+    """逐题返回 v1 视图；v2 中同一批次的 prompt 对象在各题间共享，不做复制"""
+    if not is_compact(result_data):
+        yield from result_data.get("questions", [])
+        return
+
+    template = result_data.get("prompt_template")
+    # 每个批次的 prompt 只还原一次，该批次的所有题目共享
+    prompts = [_apply_template(batch.get("prompt"), template) if template is not None else batch.get("prompt")
+               for batch in result_data["batches"]]
+    batches = result_data["batches"]
+    question_contents = result_data.get("question_contents", {})
+    columns = result_data["columns"]
+    other_columns = [key for key in columns if key not in ("question_id", "batch")]
+    for index, (question_id, batch_index) in enumerate(zip(columns["question_id"], columns["batch"])):
+        batch = batches[batch_index]
+        question = {
+            "question_id": question_id,
+            "question_content": question_contents.get(question_id),
+            "prompt": prompts[batch_index],
+            "response": batch.get("response"),
+        }
+        for key in other_columns:
+            question[key] = columns[key][index]
+        question["judge"] = batch.get("judge")
+        yield question
+
+
+def to_expanded(result_data: dict) -> dict:
+    """把 v2 结果展开为 v1 结构（questions 为逐题列表）"""
+    if not is_compact(result_data):
+        return result_data
+    return {
+        "metadata": result_data.get("metadata", {}),
+        "questions": list(iter_questions(result_data)),
+        "statistics": result_data.get("statistics", {})
+    }
+
+
+def load_results(path: str) -> dict:
+    """读取结果文件（v1 或 v2），统一返回 v1 的逐题视图"""
+    with open(path, "r", encoding="utf-8") as f:
+        return to_expanded(json.load(f))
+
+
+def load_columns(path: str) -> Dict[str, "np.ndarray"]:
+    """读取结果文件中的逐题列，分数等数值列以 numpy 数组返回（不展开 prompt / response）"""
+    # 只有分析时才需要 numpy，测试流程写结果时不加载
+    import numpy as np
+
+    with open(path, "r", encoding="utf-8") as f:
+        result_data = json.load(f)
+    if is_compact(result_data):
+        columns = result_data["columns"]
+    else:
+        columns = to_compact(result_data)["columns"]
+
+    arrays = {}
+    for key, values in columns.items():
+        if key in ("score", "batch", "replicate"):
+            arrays[key] = np.array([-1 if value is None else value for value in values], dtype=np.int64)
+        elif key == "parse_success":
+            arrays[key] = np.array([bool(value) for value in values], dtype=bool)
+        else:
+            arrays[key] = np.array(values, dtype=object)
+    return arrays
+
+
+def write_results(result_data: dict, path: str, result_format: str = "v1") -> str:
+    """按指定格式写入结果文件（先写临时文件再替换，避免中断时留下半个文件）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if result_format == "v2":
+            json.dump(to_compact(result_data), f, ensure_ascii=False, separators=(",", ":"))
+        else:
+            json.dump(to_expanded(result_data), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def migrate_tree(root: str, dry_run: bool = False) -> dict:
+    """把 root 下所有 v1 的 results.json 转换为 v2，返回转换前后的文件大小统计"""
+    summary = {"files": 0, "migrated": 0, "skipped": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    for dirpath, _, filenames in os.walk(root):
+        if RESULT_FILE_NAME not in filenames:
+            continue
+        path = os.path.join(dirpath, RESULT_FILE_NAME)
+        summary["files"] += 1
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result_data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"读取失败，跳过: {path}: {str(e)}")
+            summary["failed"] += 1
+            continue
+        if is_compact(result_data):
+            summary["skipped"] += 1
+            continue
+
+        before = os.path.getsize(path)
+        compact = to_compact(result_data)
+        after = len(json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        summary["bytes_before"] += before
+        summary["bytes_after"] += after
+        summary["migrated"] += 1
+        if not dry_run:
+            write_results(compact, path, "v2")
+        print(f"{'[dry-run] ' if dry_run else ''}{path}: {before} -> {after} 字节")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="结果文件格式工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="把目录下的 v1 结果文件转换为 v2")
+    migrate_parser.add_argument("root", nargs="?", default="results", help="结果根目录（默认 results）")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="只统计，不写入")
+
+    expand_parser = subparsers.add_parser("expand", help="把单个结果文件展开为 v1 格式输出")
+    expand_parser.add_argument("path", help="结果文件路径")
+    expand_parser.add_argument("-o", "--output", help="输出路径（默认覆盖原文件）")
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        summary = migrate_tree(args.root, dry_run=args.dry_run)
+        ratio = (summary["bytes_before"] / summary["bytes_after"]) if summary["bytes_after"] else 0
+        print(f"共 {summary['files']} 个结果文件: 转换 {summary['migrated']} 个, 已是v2 {summary['skipped']} 个, "
+              f"失败 {summary['failed']} 个; {summary['bytes_before']} -> {summary['bytes_after']} 字节 ({ratio:.1f}x)")
+    elif args.command == "expand":
+        with open(args.path, "r", encoding="utf-8") as f:
+            result_data = json.load(f)
+        write_results(result_data, args.output or args.path, "v1")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from result_format import RESULT_FILE_NAME, to_compact
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    setting TEXT,
+    language TEXT,
+    model TEXT,
+    questionnaire TEXT,
+    timestamp TEXT,
+    total_questions INTEGER,
+    valid_responses INTEGER,
+    prompt_template TEXT,
+    mtime REAL,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS batches (
+    run_id INTEGER NOT NULL,
+    batch_index INTEGER NOT NULL,
+    prompt TEXT,
+    response TEXT,
+    judge TEXT,
+    PRIMARY KEY (run_id, batch_index)
+);
+CREATE TABLE IF NOT EXISTS item_scores (
+    run_id INTEGER NOT NULL,
+    question_id TEXT,
+    replicate INTEGER,
+    batch_index INTEGER,
+    category TEXT,
+    score INTEGER,
+    parse_success INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_runs_model ON runs(model);
+CREATE INDEX IF NOT EXISTS idx_runs_language ON runs(language);
+CREATE INDEX IF NOT EXISTS idx_runs_setting ON runs(setting);
+CREATE INDEX IF NOT EXISTS idx_runs_questionnaire ON runs(questionnaire);
+CREATE INDEX IF NOT EXISTS idx_runs_timestamp ON runs(timestamp);
+CREATE INDEX IF NOT EXISTS idx_runs_cell ON runs(questionnaire, model, setting, language);
+CREATE INDEX IF NOT EXISTS idx_item_scores_run ON item_scores(run_id, category);
+"""
+
+# 查询条件可用的字段（对应 runs 表的列）
+RUN_FILTERS = ("setting", "language", "model", "questionnaire")
+
+
+def _as_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class ResultsCatalog:
+    """results/ 目录的 SQLite 索引：每个 results.json 对应 runs 中的一行，保存后增量更新"""
+    def __init__(self, path: str = "results/catalog.sqlite"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def index_result(self, path: str, result_data: Optional[dict] = None) -> int:
+        """写入（或替换）一个结果文件的索引，返回 run_id；result_data 为空时从文件读取"""
+        path = os.path.abspath(path)
+        if result_data is None:
+            with open(path, "r", encoding="utf-8") as f:
+                result_data = json.load(f)
+        compact = to_compact(result_data)
+        metadata = compact.get("metadata", {})
+        statistics = compact.get("statistics", {})
+        columns = compact["columns"]
+        count = len(columns["question_id"])
+
+        def column(name, default=None):
+            return columns.get(name) or [default] * count
+
+        items = list(zip(
+            columns["question_id"], column("replicate", 0), columns["batch"],
+            column("category"), column("score", -1), column("parse_success", False)
+        ))
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+
+        with self._lock:
+            self._delete_run(path)
+            cursor = self._conn.execute(
+                "INSERT INTO runs (path, setting, language, model, questionnaire, timestamp, total_questions, "
+                "valid_responses, prompt_template, mtime, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    metadata.get("inner_setting_type"),
+                    metadata.get("language"),
+                    metadata.get("model"),
+                    metadata.get("questionnaire_name"),
+                    metadata.get("timestamp"),
+                    statistics.get("total_questions", count),
+                    statistics.get("valid_responses", sum(1 for item in items if item[5])),
+                    json.dumps(compact.get("prompt_template"), ensure_ascii=False),
+                    mtime,
+                    time.time()
+                )
+            )
+            run_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO batches (run_id, batch_index, prompt, response, judge) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (run_id, batch_index, json.dumps(batch.get("prompt"), ensure_ascii=False),
+                     json.dumps(batch.get("response"), ensure_ascii=False), batch.get("judge"))
+                    for batch_index, batch in enumerate(compact["batches"])
+                ]
+            )
+            self._conn.executemany(
+                "INSERT INTO item_scores (run_id, question_id, replicate, batch_index, category, score, parse_success) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (run_id, question_id, replicate or 0, batch_index, category,
+                     -1 if score is None else int(score), int(bool(parse_success)))
+                    for question_id, replicate, batch_index, category, score, parse_success in items
+                ]
+            )
+            self._conn.commit()
+        return run_id
+
+    def _delete_run(self, path: str):
+        row = self._conn.execute("SELECT run_id FROM runs WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return
+        for table in ("item_scores", "batches", "runs"):
+            self._conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (row[0],))
+
+    def index_tree(self, root: str, force: bool = False) -> Dict[str, int]:
+        """扫描 root 下的所有 results.json；文件未修改（mtime 相同）时跳过，已删除的文件从索引中移除"""
+        summary = {"indexed": 0, "unchanged": 0, "failed": 0, "removed": 0}
+        with self._lock:
+            known = dict(self._conn.execute("SELECT path, mtime FROM runs").fetchall())
+
+        seen = set()
+        for dirpath, _, filenames in os.walk(root):
+            if RESULT_FILE_NAME not in filenames:
+                continue
+            path = os.path.abspath(os.path.join(dirpath, RESULT_FILE_NAME))
+            seen.add(path)
+            if not force and known.get(path) == os.path.getmtime(path):
+                summary["unchanged"] += 1
+                continue
+            try:
+                self.index_result(path)
+                summary["indexed"] += 1
+            except (OSError, ValueError, KeyError) as e:
+                print(f"索引失败，跳过: {path}: {str(e)}")
+                summary["failed"] += 1
+
+        root_prefix = os.path.abspath(root) + os.sep
+        with self._lock:
+            for path in known:
+                if path.startswith(root_prefix) and path not in seen:
+                    self._delete_run(path)
+                    summary["removed"] += 1
+            self._conn.commit()
+        return summary
+
+    @staticmethod
+    def _where(filters: Dict[str, Any]):
+        clauses = []
+        params = []
+        for key in RUN_FILTERS:
+            values = _as_list(filters.get(key))
+            if values:
+                clauses.append(f"r.{key} IN ({', '.join('?' for _ in values)})")
+                params.extend(values)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def runs(self, **filters) -> List[dict]:
+        """列出符合条件的运行（setting / language / model / questionnaire 可以是单个值或列表）"""
+        where, params = self._where(filters)
+        sql = ("SELECT r.run_id, r.setting, r.language, r.model, r.questionnaire, r.timestamp, "
+               "r.total_questions, r.valid_responses, r.path FROM runs r" + where +
+               " ORDER BY r.questionnaire, r.model, r.setting, r.language")
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def category_scores(self, category: Optional[Iterable[str]] = None,
+                        questionnaires_path: str = "questionnaires_en.json", **filters) -> List[dict]:
+        """按 (setting, language, model, questionnaire, category) 汇总维度分数
+
+        计分规则与 scoring.py 相同：反向计分题按 scale - score 计，按问卷的 compute_mode 求均值或求和；
+        每次施测先算维度分，再对各次施测取均值（runs 为施测次数，valid_items / total_items 为累计题数）。
+        """
+        # 计分依赖 numpy / pandas，只在查询维度分数时导入
+        from scoring import RUN_KEYS, items_from_catalog, load_questionnaire_definitions, score_items
+
+        table = score_items(items_from_catalog(self, **filters), load_questionnaire_definitions(questionnaires_path))
+        categories = _as_list(category)
+        if categories:
+            table = table[table["category"].isin(categories)]
+        keys = [key for key in RUN_KEYS if key != "replicate"] + ["category"]
+        summary = (table.groupby(keys + ["compute_mode"], sort=True)
+                   .agg(score=("score", "mean"), runs=("score", "count"),
+                        valid_items=("valid_items", "sum"), total_items=("total_items", "sum"))
+                   .reset_index())
+        return [
+            {key: (None if value != value else value.item() if hasattr(value, "item") else value)
+             for key, value in row.items()}
+            for row in summary.to_dict("records")
+        ]
+
+    def item_scores(self, **filters) -> List[dict]:
+        """返回符合条件的逐题分数"""
+        where, params = self._where(filters)
+        sql = ("SELECT r.setting, r.language, r.model, r.questionnaire, s.question_id, s.replicate, "
+               "s.category, s.score, s.parse_success FROM item_scores s JOIN runs r ON r.run_id = s.run_id" + where +
+               " ORDER BY r.run_id, s.replicate, CAST(s.question_id AS INTEGER)")
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_catalog = None
+
+
+def init_results_catalog(catalog_config: dict = None) -> Optional[ResultsCatalog]:
+    """按 output.catalog 配置创建本次运行使用的结果索引，未启用时返回 None"""
+    global _catalog
+    if _catalog is not None:
+        _catalog.close()
+        _catalog = None
+    catalog_config = dict(catalog_config or {})
+    if not catalog_config.pop("enabled", False):
+        return None
+    _catalog = ResultsCatalog(**catalog_config)
+    return _catalog
+
+
+def get_results_catalog() -> Optional[ResultsCatalog]:
+    return _catalog
+
+
+def _print_table(rows: List[dict]):
+    if not rows:
+        print("没有符合条件的记录")
+        return
+    headers = list(rows[0].keys())
+    print("| " + " | ".join(headers) + " |")
+    print("|" + "|".join("------" for _ in headers) + "|")
+    for row in rows:
+        cells = [f"{value:.3f}" if isinstance(value, float) else str(value) for value in row.values()]
+        print("| " + " | ".join(cells) + " |")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="结果索引工具")
+    parser.add_argument("--db", default="results/catalog.sqlite", help="索引数据库路径（默认 results/catalog.sqlite）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_parser = subparsers.add_parser("index", help="扫描结果目录并更新索引")
+    index_parser.add_argument("root", nargs="?", default="results", help="结果根目录（默认 results）")
+    index_parser.add_argument("--force", action="store_true", help="忽略文件修改时间，全部重新索引")
+
+    for name, help_text in (("runs", "列出运行"), ("scores", "按维度汇总分数"), ("items", "列出逐题分数")):
+        sub = subparsers.add_parser(name, help=help_text)
+        for key in RUN_FILTERS:
+            sub.add_argument(f"--{key}", action="append", help=f"按 {key} 过滤，可重复指定")
+        if name == "scores":
+            sub.add_argument("--category", action="append", help="按维度过滤，可重复指定")
+            sub.add_argument("--questionnaires", default="questionnaires_en.json", help="问卷定义文件（反向题和计分方式）")
+
+    args = parser.parse_args(argv)
+    catalog = ResultsCatalog(args.db)
+    filters = {key: getattr(args, key, None) for key in RUN_FILTERS}
+
+    started = time.perf_counter()
+    if args.command == "index":
+        summary = catalog.index_tree(args.root, force=args.force)
+        print(f"索引完成: 新增/更新 {summary['indexed']} 个, 未变化 {summary['unchanged']} 个, "
+              f"移除 {summary['removed']} 个, 失败 {summary['failed']} 个")
+    elif args.command == "runs":
+        _print_table(catalog.runs(**filters))
+    elif args.command == "scores":
+        _print_table(catalog.category_scores(category=args.category, questionnaires_path=args.questionnaires, **filters))
+    elif args.command == "items":
+        _print_table(catalog.item_scores(**filters))
+    print(f"\n耗时 {(time.perf_counter() - started) * 1000:.2f} ms")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
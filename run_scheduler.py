@@ -0,0 +1,182 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+@dataclass
+class MatrixCell:
+    """测试矩阵中的一个单元：(inner_setting_type, 语言, 问卷, 模型)"""
+    inner_setting_type: str
+    language: str
+    questionnaire: Dict[str, Any]
+    model: str
+    provider: str
+    status: str = "pending"      # pending / running / done / failed
+    error: Optional[str] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Any = field(default=None, repr=False)
+
+    @property
+    def name(self) -> str:
+        return f"{self.inner_setting_type}/{self.language}/{self.questionnaire['name']}/{self.model}"
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def to_dict(self) -> dict:
+        return {
+            "inner_setting_type": self.inner_setting_type,
+            "language": self.language,
+            "questionnaire": self.questionnaire["name"],
+            "model": self.model,
+            "provider": self.provider,
+            "status": self.status,
+            "error": self.error,
+            "elapsed": round(self.elapsed, 3)
+        }
+
+
+class RunScheduler:
+    """把测试矩阵展开为任务队列，由线程池执行
+
+    - 每个模型、每个服务商同时运行的单元数分别受 per_model / per_provider 限制
+    - 按服务商轮流派发，慢的服务商不会挡住其他服务商的单元
+    """
+    def __init__(self, run_cell: Callable[[MatrixCell], Any], max_workers: int = 4,
+                 max_per_model: int = 1, max_per_provider: int = 2,
+                 per_model: Optional[Dict[str, int]] = None, per_provider: Optional[Dict[str, int]] = None,
+                 status_path: Optional[str] = None):
+        self.run_cell = run_cell
+        self.max_workers = max(1, max_workers)
+        self.max_per_model = max(1, max_per_model)
+        self.max_per_provider = max(1, max_per_provider)
+        self.per_model = per_model or {}
+        self.per_provider = per_provider or {}
+        # 上限小于 1 的模型或服务商永远不会被派发，run() 会一直等待
+        for option, limits in (("per_model", self.per_model), ("per_provider", self.per_provider)):
+            for name, limit in limits.items():
+                if not isinstance(limit, int) or limit < 1:
+                    raise ValueError(f"scheduler.{option}.{name} 必须是不小于 1 的整数，当前为 {limit}")
+        self.status_path = status_path
+        self._cond = threading.Condition()
+        self._status_lock = threading.Lock()   # 各工作线程共用同一个临时文件，写入和替换需串行
+        self._running_models = Counter()
+        self._running_providers = Counter()
+        self._cells: List[MatrixCell] = []
+
+    def _model_limit(self, model: str) -> int:
+        return self.per_model.get(model, self.max_per_model)
+
+    def _provider_limit(self, provider: str) -> int:
+        return self.per_provider.get(provider, self.max_per_provider)
+
+    def _next_cell(self, queues: "OrderedDict[str, deque]") -> Optional[MatrixCell]:
+        """按服务商轮询，取第一个模型和服务商都还有空闲名额的单元"""
+        for provider in list(queues.keys()):
+            queue = queues[provider]
+            if self._running_providers[provider] >= self._provider_limit(provider):
+                continue
+            for index, cell in enumerate(queue):
+                if self._running_models[cell.model] < self._model_limit(cell.model):
+                    del queue[index]
+                    if not queue:
+                        del queues[provider]
+                    else:
+                        # 派发后把该服务商移到队尾，实现公平轮转
+                        queues.move_to_end(provider)
+                    return cell
+        return None
+
+    def _execute(self, cell: MatrixCell):
+        cell.status = "running"
+        cell.started = time.time()
+        try:
+            cell.result = self.run_cell(cell)
+            cell.status = "done"
+        except Exception as e:
+            cell.status = "failed"
+            cell.error = str(e)
+            print(f"测试单元失败 {cell.name}: {str(e)}")
+        finally:
+            cell.finished = time.time()
+            with self._cond:
+                self._running_models[cell.model] -= 1
+                self._running_providers[cell.provider] -= 1
+                self._cond.notify_all()
+            self._report_progress(cell)
+
+    def _report_progress(self, cell: MatrixCell):
+        finished = sum(1 for c in self._cells if c.status in ("done", "failed"))
+        print(f"[{finished}/{len(self._cells)}] {cell.name}: {cell.status} ({cell.elapsed:.1f}s)")
+        try:
+            self.write_status()
+        except OSError as e:
+            # 状态文件只用于观察进度，写入失败不能中断测试
+            print(f"写入运行状态失败 {self.status_path}: {str(e)}")
+
+    def write_status(self):
+        """把每个单元的状态写入 status_path（JSON）"""
+        if not self.status_path:
+            return
+        directory = os.path.dirname(self.status_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.status_path + ".tmp"
+        with self._status_lock:
+            # 在锁内取快照，保证后写入的文件不会比先写入的旧
+            with self._cond:
+                data = [cell.to_dict() for cell in self._cells]
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.status_path)
+
+    def run(self, cells: List[MatrixCell]) -> List[MatrixCell]:
+        """执行所有单元，返回带状态的单元列表（顺序与输入一致）"""
+        self._cells = cells
+        queues: "OrderedDict[str, deque]" = OrderedDict()
+        for cell in cells:
+            queues.setdefault(cell.provider, deque()).append(cell)
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                with self._cond:
+                    cell = None
+                    while queues:
+                        in_flight = sum(self._running_providers.values())
+                        if in_flight < self.max_workers:
+                            cell = self._next_cell(queues)
+                            if cell is not None:
+                                break
+                        self._cond.wait()
+                    if cell is None:
+                        break
+                    self._running_models[cell.model] += 1
+                    self._running_providers[cell.provider] += 1
+                futures.append(executor.submit(self._execute, cell))
+            for future in futures:
+                future.result()
+
+        self.write_status()
+        return cells
+
+    def summary(self) -> str:
+        """按状态汇总各单元"""
+        lines = ["\n测试单元状态:"]
+        for cell in self._cells:
+            line = f"  {cell.name}: {cell.status} ({cell.elapsed:.1f}s)"
+            if cell.error:
+                line += f" - {cell.error}"
+            lines.append(line)
+        counts = Counter(cell.status for cell in self._cells)
+        lines.append("  " + ", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+        return "\n".join(lines)
@@ -0,0 +1,142 @@
+import re
+import threading
+from typing import List, Optional
+
+
+# 出现这些措辞时说明回答可能是举例、假设或拒答，需要交给judge模型判断
+HYPOTHETICAL_KEYWORDS = {
+    "en": ["for example", "for instance", "e.g.", "example", "hypothetical", "suppose", "assuming", "imagine",
+           "if i were", "would", "as an ai", "language model", "i don't have", "i do not have", "cannot", "can't"],
+    "de": ["zum beispiel", "z. b.", "z.b.", "beispiel", "hypothetisch", "angenommen", "wenn ich", "würde",
+           "als ki", "künstliche intelligenz", "sprachmodell", "keine persönlichen", "kann nicht", "nicht möglich"],
+    "fr": ["par exemple", "exemple", "hypoth", "supposons", "si j'étais", "je serais", "en tant qu'ia",
+           "intelligence artificielle", "modèle de langage", "je n'ai pas", "je ne peux pas"],
+    "es": ["por ejemplo", "ejemplo", "hipot", "supongamos", "suponiendo", "si yo fuera", "como ia",
+           "inteligencia artificial", "modelo de lenguaje", "no tengo", "no puedo"],
+    "ru": ["например", "пример", "гипотетич", "предполож", "если бы", "как ии", "искусственный интеллект",
+           "языковая модель", "у меня нет", "не могу"],
+    "ja": ["例えば", "たとえば", "例", "仮に", "仮定", "もし", "aiとして", "人工知能", "言語モデル", "ありません", "できません"],
+    "zh": ["例如", "比如", "举例", "假设", "假如", "如果我", "作为ai", "人工智能", "语言模型", "我没有", "无法", "不能"],
+    "ar": ["على سبيل المثال", "مثال", "مثلا", "افتراض", "لو كنت", "إذا كنت", "ذكاء اصطناعي", "نموذج لغوي",
+           "ليس لدي", "لا أستطيع", "لا يمكنني"],
+}
+
+# 行首允许出现的列表/强调符号，例如 "- 3"、"**4** - Stimme eher zu"
+_LEADING_MARKS = re.compile(r'^[\s*#>\-•]*')
+_INTEGER = re.compile(r'\d+')
+_DECIMAL = re.compile(r'\d+[.,]\d+')
+_WORD = re.compile(r'\w')
+_STATEMENT_PREFIX = re.compile(r'^(?:statement|aussage|question|frage)\s*', re.IGNORECASE)
+# 带明确分隔符的 "题号 分隔符 分数"，例如 "1: 4"、"2. 5"、"3) 2 - agree"；"4/5"、"3 out of 5" 不算
+_NUMBERED_LINE = re.compile(r'^(\d+)\s*[:：.)\-]\s*(\d+)(?:[\s,;:：.)\-].*)?$')
+
+
+def _has_hypothetical_phrasing(text: str, language: str) -> bool:
+    lowered = text.lower()
+    keywords = HYPOTHETICAL_KEYWORDS.get(language, []) + HYPOTHETICAL_KEYWORDS["en"]
+    return any(keyword in lowered for keyword in keywords)
+
+
+def extract_scores(text: str, question_ids: List[str], scale: int, language: str = "en") -> Optional[List[int]]:
+    """不调用judge模型，直接从回答中提取分数
+
+    只处理明确无歧义的回答：每个题目恰好一个分数、分数在量表范围内 (0 <= score < scale)、
+    且不包含举例或假设性措辞。无法确定时返回 None，由调用方交给judge模型判断。
+
+    >>> extract_scores('1: 4\\n2: 2', ['1', '2'], 6)
+    [4, 2]
+    >>> extract_scores('3 - Stimme weder zu noch stimme nicht zu.', ['5'], 6, 'de')
+    [3]
+    >>> extract_scores('3. Agree', ['3'], 6) is None
+    True
+    >>> extract_scores('4/5', ['4'], 6) is None
+    True
+    >>> extract_scores('3 out of 5 - neutral', ['3'], 6) is None
+    True
+    >>> extract_scores('4 - 5', ['4'], 6) is None
+    True
+    """
+    if not text or not question_ids:
+        return None
+    if _has_hypothetical_phrasing(text, language) or _DECIMAL.search(text):
+        return None
+
+    expected = [int(q_id) for q_id in question_ids]
+    numbered = {}
+    bare_scores = []
+
+    for line in text.split('\n'):
+        line = _STATEMENT_PREFIX.sub('', _LEADING_MARKS.sub('', line.strip()))
+        if not line:
+            continue
+        integers = _INTEGER.findall(line)
+        if not integers:
+            # 不含数字的说明文字（例如 "Stimme eher zu."）
+            continue
+        if not line[0].isdigit():
+            return None
+        if len(integers) == 1:
+            # "3 - Stimme weder zu noch stimme nicht zu."
+            score = int(integers[0])
+            # 只有一道题时，"3. Agree" 中与题号相同的数字很可能是复述的题号而不是分数
+            if len(expected) == 1 and score == expected[0] and _WORD.search(line[len(integers[0]):]):
+                return None
+            bare_scores.append(score)
+        elif len(integers) == 2:
+            # "1: 4"、"2. 5"；"4/5"、"3 out of 5" 这类写法可能是 "分数/量表上限"，交给judge
+            match = _NUMBERED_LINE.match(line)
+            if not match:
+                return None
+            q_num, score = int(match.group(1)), int(match.group(2))
+            if q_num not in expected or q_num in numbered:
+                return None
+            # 只有一道题时，"4 - 5" 中的 5 恰好是量表上限，也可能是 "4 分（满分 5）"
+            if len(expected) == 1 and score == int(scale) - 1:
+                return None
+            numbered[q_num] = score
+        else:
+            return None
+
+    if numbered and bare_scores:
+        return None
+    if bare_scores:
+        if len(expected) != 1 or len(bare_scores) != 1:
+            return None
+        scores = bare_scores
+    else:
+        if set(numbered) != set(expected):
+            return None
+        scores = [numbered[q_num] for q_num in expected]
+
+    if any(score < 0 or score >= int(scale) for score in scores):
+        return None
+    return scores
+
+
+class FastPathStats:
+    """统计快速通道命中情况：avoided 为免去的judge调用数，escalated 为仍需judge的回答数"""
+    def __init__(self):
+        self.avoided = 0
+        self.escalated = 0
+        self._lock = threading.Lock()
+
+    def record(self, avoided: bool):
+        with self._lock:
+            if avoided:
+                self.avoided += 1
+            else:
+                self.escalated += 1
+
+    def reset(self):
+        with self._lock:
+            self.avoided = 0
+            self.escalated = 0
+
+    def report(self) -> str:
+        with self._lock:
+            total = self.avoided + self.escalated
+            rate = (self.avoided / total * 100) if total > 0 else 0
+            return f"快速解析统计: 免去judge调用 {self.avoided} 次, 交给judge {self.escalated} 次, 免调用比例 {rate:.2f}%"
+
+
+fast_path_stats = FastPathStats()
@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from result_format import RESULT_FILE_NAME, load_columns
+
+
+# 计分结果表的标识列（每行对应一次施测的一个维度）
+RUN_KEYS = ("setting", "language", "model", "questionnaire", "replicate")
+
+
+@dataclass(frozen=True)
+class CompiledQuestionnaire:
+    """编译后的问卷计分规则：题目顺序、维度归属矩阵和反向计分掩码"""
+    name: str
+    question_ids: Tuple[str, ...]
+    categories: Tuple[str, ...]
+    membership: np.ndarray      # (维度数, 题目数)，题目属于该维度时为 1
+    reverse_mask: np.ndarray    # (题目数,)，反向计分题为 True
+    scale: int
+    compute_mode: str           # AVG 或 SUM
+
+    @property
+    def column_index(self) -> Dict[str, int]:
+        return {question_id: index for index, question_id in enumerate(self.question_ids)}
+
+
+def compile_questionnaire(questionnaire: dict) -> CompiledQuestionnaire:
+    """把问卷的 categories / reverse / scale / compute_mode 编译为索引数组"""
+    question_ids = tuple(questionnaire["questions"].keys())
+    column_index = {question_id: index for index, question_id in enumerate(question_ids)}
+    categories = tuple(category["cat_name"] for category in questionnaire["categories"])
+
+    membership = np.zeros((len(categories), len(question_ids)), dtype=np.float64)
+    for row, category in enumerate(questionnaire["categories"]):
+        columns = [column_index[str(q_num)] for q_num in category["cat_questions"] if str(q_num) in column_index]
+        membership[row, columns] = 1.0
+
+    reverse_mask = np.zeros(len(question_ids), dtype=bool)
+    reverse_columns = [column_index[str(q_num)] for q_num in questionnaire.get("reverse", []) if str(q_num) in column_index]
+    reverse_mask[reverse_columns] = True
+
+    compute_mode = str(questionnaire.get("compute_mode", "AVG")).upper()
+    if compute_mode not in ("AVG", "SUM"):
+        raise ValueError(f"不支持的计分方式: {compute_mode} ({questionnaire['name']})")
+
+    return CompiledQuestionnaire(
+        name=questionnaire["name"],
+        question_ids=question_ids,
+        categories=categories,
+        membership=membership,
+        reverse_mask=reverse_mask,
+        scale=int(questionnaire["scale"]),
+        compute_mode=compute_mode
+    )
+
+
+def load_questionnaire_definitions(path: str = "questionnaires_en.json") -> Dict[str, CompiledQuestionnaire]:
+    """读取问卷定义并编译（维度、反向题和量表与语言无关，默认使用英文原始问卷）"""
+    with open(path, "r", encoding="utf-8") as f:
+        questionnaires = json.load(f)
+    return {
+        questionnaire["name"]: compile_questionnaire(questionnaire)
+        for questionnaire in questionnaires
+        if isinstance(questionnaire, dict) and "name" in questionnaire
+    }
+
+
+def score_matrix(compiled: CompiledQuestionnaire, responses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """对 (施测次数 × 题目数) 的分数矩阵一次性计分
+
+    分数为负（-1 表示缺失或解析失败）的题目不参与计算；反向计分题按 scale - score 计。
+    返回 (维度分数, 有效题数)，形状均为 (施测次数, 维度数)；某维度没有有效题目时分数为 NaN。
+    """
+    responses = np.asarray(responses, dtype=np.float64)
+    if responses.ndim == 1:
+        responses = responses[np.newaxis, :]
+    valid = responses >= 0
+    keyed = np.where(compiled.reverse_mask, compiled.scale - responses, responses)
+    keyed = np.where(valid, keyed, 0.0)
+
+    sums = keyed @ compiled.membership.T
+    counts = valid.astype(np.float64) @ compiled.membership.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = sums / counts if compiled.compute_mode == "AVG" else sums
+    scores = np.where(counts > 0, scores, np.nan)
+    return scores, counts.astype(np.int64)
+
+
+def build_response_matrix(compiled: CompiledQuestionnaire, row_codes: np.ndarray, question_ids: Iterable[str],
+                          scores: np.ndarray, n_rows: int) -> np.ndarray:
+    """把逐题记录 (行号, 题号, 分数) 填入 (n_rows × 题目数) 的矩阵，未出现的题目记为 -1"""
+    column_index = compiled.column_index
+    columns = np.fromiter((column_index.get(str(question_id), -1) for question_id in question_ids),
+                          dtype=np.int64, count=len(row_codes))
+    known = columns >= 0
+    matrix = np.full((n_rows, len(compiled.question_ids)), -1.0)
+    matrix[row_codes[known], columns[known]] = scores[known]
+    return matrix
+
+
+def score_items(items: pd.DataFrame, questionnaires: Dict[str, CompiledQuestionnaire]) -> pd.DataFrame:
+    """对逐题分数表计分，返回整洁表：每行一个 (setting, language, model, questionnaire, replicate, category)
+
+    items 需要包含 RUN_KEYS 各列以及 question_id、score 列。
+    """
+    frames = []
+    for questionnaire_name, group in items.groupby("questionnaire", sort=False):
+        compiled = questionnaires.get(questionnaire_name)
+        if compiled is None:
+            print(f"找不到问卷定义，跳过计分: {questionnaire_name}")
+            continue
+        run_keys = group[list(RUN_KEYS)]
+        row_codes, unique_runs = pd.MultiIndex.from_frame(run_keys).factorize()
+        matrix = build_response_matrix(
+            compiled, row_codes, group["question_id"].to_numpy(),
+            group["score"].to_numpy(dtype=np.float64), len(unique_runs)
+        )
+        scores, counts = score_matrix(compiled, matrix)
+        totals = np.broadcast_to(compiled.membership.sum(axis=1).astype(np.int64), scores.shape)
+
+        n_runs, n_categories = scores.shape
+        frame = pd.DataFrame(
+            np.repeat(unique_runs.to_frame(index=False).to_numpy(dtype=object), n_categories, axis=0),
+            columns=list(RUN_KEYS)
+        )
+        frame["category"] = np.tile(np.array(compiled.categories, dtype=object), n_runs)
+        frame["score"] = scores.reshape(-1)
+        frame["valid_items"] = counts.reshape(-1)
+        frame["total_items"] = totals.reshape(-1)
+        frame["compute_mode"] = compiled.compute_mode
+        frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=list(RUN_KEYS) + ["category", "score", "valid_items", "total_items", "compute_mode"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def items_from_catalog(catalog, **filters) -> pd.DataFrame:
+    """从结果索引读取逐题分数"""
+    rows = catalog.item_scores(**filters)
+    return pd.DataFrame.from_records(rows, columns=list(RUN_KEYS) + ["question_id", "score"])
+
+
+def items_from_tree(root: str) -> pd.DataFrame:
+    """扫描结果目录读取逐题分数（v1/v2 均可，只读取分数列）"""
+    frames = []
+    for dirpath, _, filenames in os.walk(root):
+        if RESULT_FILE_NAME not in filenames:
+            continue
+        path = os.path.join(dirpath, RESULT_FILE_NAME)
+        with open(path, "r", encoding="utf-8") as f:
+            metadata = json.load(f).get("metadata", {})
+        columns = load_columns(path)
+        count = len(columns["question_id"])
+        frames.append(pd.DataFrame({
+            "setting": metadata.get("inner_setting_type"),
+            "language": metadata.get("language"),
+            "model": metadata.get("model"),
+            "questionnaire": metadata.get("questionnaire_name"),
+            "replicate": columns["replicate"] if "replicate" in columns else np.zeros(count, dtype=np.int64),
+            "question_id": columns["question_id"],
+            "score": columns["score"]
+        }))
+    if not frames:
+        return pd.DataFrame(columns=list(RUN_KEYS) + ["question_id", "score"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize_replicates(table: pd.DataFrame) -> pd.DataFrame:
+    """把多次重复施测汇总为均值、标准差和施测次数"""
+    keys = [key for key in RUN_KEYS if key != "replicate"] + ["category"]
+    return table.groupby(keys, sort=True)["score"].agg(mean="mean", std="std", runs="count").reset_index()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="问卷维度计分")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--db", help="从结果索引读取（例如 results/catalog.sqlite）")
+    source.add_argument("--root", default="results", help="扫描结果目录读取（默认 results）")
+    parser.add_argument("--questionnaires", default="questionnaires_en.json", help="问卷定义文件")
+    parser.add_argument("--summary", action="store_true", help="按重复施测汇总")
+    parser.add_argument("-o", "--output", help="输出 CSV 路径（默认打印）")
+    for key in ("setting", "language", "model", "questionnaire"):
+        parser.add_argument(f"--{key}", action="append", help=f"按 {key} 过滤（仅 --db），可重复指定")
+    args = parser.parse_args(argv)
+
+    questionnaires = load_questionnaire_definitions(args.questionnaires)
+    started = time.perf_counter()
+    if args.db:
+        from results_catalog import ResultsCatalog
+        catalog = ResultsCatalog(args.db)
+        items = items_from_catalog(catalog, setting=args.setting, language=args.language,
+                                   model=args.model, questionnaire=args.questionnaire)
+        catalog.close()
+    else:
+        items = items_from_tree(args.root)
+    loaded = time.perf_counter()
+    table = score_items(items, questionnaires)
+    if args.summary:
+        table = summarize_replicates(table)
+    scored = time.perf_counter()
+
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"计分结果已保存至: {args.output}")
+    else:
+        print(table.to_string(index=False))
+    print(f"\n读取 {len(items)} 条逐题记录 {(loaded - started) * 1000:.2f} ms, 计分 {(scored - loaded) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
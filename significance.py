@@ -0,0 +1,234 @@
+import argparse
+import os
+import time
+from itertools import combinations
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from scoring import RUN_KEYS, CompiledQuestionnaire, load_questionnaire_definitions
+
+
+# 可比较的因素及比较时保持不变的另一个因素
+FACTORS = {"language": "setting", "setting": "language"}
+CORRECTIONS = ("holm", "bh", "none")
+
+# 每个计算块中 (对比数 × 重抽样次数) 的元素上限，控制内存占用
+_CHUNK_ELEMENTS = 4_000_000
+
+
+def keyed_items(items: pd.DataFrame, questionnaires: Dict[str, CompiledQuestionnaire]) -> pd.DataFrame:
+    """把逐题分数转换为按维度展开的计分值（反向题已转换，缺失值已去除），保留题号用于配对"""
+    frames = []
+    for questionnaire_name, group in items.groupby("questionnaire", sort=False):
+        compiled = questionnaires.get(questionnaire_name)
+        if compiled is None:
+            continue
+        column_index = compiled.column_index
+        columns = np.fromiter((column_index.get(str(question_id), -1) for question_id in group["question_id"]),
+                              dtype=np.int64, count=len(group))
+        scores = group["score"].to_numpy(dtype=np.float64)
+        keep = (columns >= 0) & (scores >= 0)
+        columns, scores = columns[keep], scores[keep]
+        values = np.where(compiled.reverse_mask[columns], compiled.scale - scores, scores)
+        run_keys = group.loc[keep, list(RUN_KEYS) + ["question_id"]].reset_index(drop=True)
+        run_keys["question_id"] = run_keys["question_id"].astype(str)
+
+        # 一道题可能属于多个维度：按 (维度, 题目) 归属关系展开
+        category_rows, item_columns = np.nonzero(compiled.membership)
+        for category_row in np.unique(category_rows):
+            in_category = np.isin(columns, item_columns[category_rows == category_row])
+            frame = run_keys[in_category].copy()
+            frame["category"] = compiled.categories[category_row]
+            frame["value"] = values[in_category]
+            # 维度分数的换算：AVG 维度为题目均值，SUM 维度为题目均值 × 该维度的题目数
+            frame["category_scale"] = (float(compiled.membership[category_row].sum())
+                                       if compiled.compute_mode == "SUM" else 1.0)
+            frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=list(RUN_KEYS) + ["question_id", "category", "value", "category_scale"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def adjust_pvalues(p_values: np.ndarray, method: str = "holm") -> np.ndarray:
+    """多重比较校正：holm（控制 FWER）或 bh（Benjamini-Hochberg，控制 FDR）"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    m = len(p_values)
+    if method == "none" or m == 0:
+        return p_values.copy()
+    order = np.argsort(p_values)
+    ranked = p_values[order]
+    if method == "holm":
+        adjusted = np.maximum.accumulate((m - np.arange(m)) * ranked)
+    elif method == "bh":
+        adjusted = np.minimum.accumulate((m / np.arange(m, 0, -1) * ranked[::-1]))[::-1]
+    else:
+        raise ValueError(f"未知的校正方法: {method}，可选值: {', '.join(CORRECTIONS)}")
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+def _resample_bucket(d: np.ndarray, n_resamples: int, alpha: float, rng: np.random.Generator):
+    """对题目数相同的一组对比同时做配对置换检验和bootstrap，返回 (置换p值, 置信区间下限, 置信区间上限)
+
+    d 的形状为 (对比数, 题目数)，每个元素是同一道题在两个水平下的分差。同组对比共用同一套
+    重抽样方案，重抽样统计量通过矩阵乘法一次算出，不需要逐个对比索引取值。
+    """
+    n = d.shape[1]
+    observed = d.mean(axis=1)
+
+    # 配对置换检验：原假设下每道题两个水平的标签可以互换，等价于随机翻转分差的符号
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(n, n_resamples))
+    permuted = d @ signs / n
+    extreme = np.abs(permuted) >= np.abs(observed)[:, None] - 1e-12
+    p_permutation = (extreme.sum(axis=1) + 1) / (n_resamples + 1)
+
+    # bootstrap：按题目有放回抽样（多项分布计数加权），取平均分差的百分位区间
+    weights = rng.multinomial(n, np.full(n, 1.0 / n), size=n_resamples).T / n
+    boot_diff = d @ weights
+    ci_low, ci_high = np.percentile(boot_diff, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=1)
+    return p_permutation, ci_low, ci_high
+
+
+def compare_levels(keyed: pd.DataFrame, factor: str = "language", alpha: float = 0.05, n_resamples: int = 2000,
+                   correction: str = "holm", seed: Optional[int] = 0) -> pd.DataFrame:
+    """对每个 (模型, 问卷, 维度, 另一因素) 内 factor 的所有水平两两做配对比较
+
+    同一道题在不同水平下的回答并不独立（题目本身的难度、措辞影响所有水平），因此按题号配对：
+    每道题先对所有重复施测取均值，只使用两个水平都有有效回答的题目，观测单位为逐题分差。
+    mean_a / mean_b / diff 及置信区间换算到维度分数的尺度（SUM 维度乘以该维度的题目数），
+    每个对比给出题目数、均值差、bootstrap 置信区间（置信度 1 - alpha，按题目重抽样）、
+    配对效应量 Cohen's d_z、配对置换检验 p 值和配对 t 检验 p 值；同一组内的所有对比按 correction 做多重比较校正。
+    结论只能推广到本问卷的这些题目，不能推广到更大的题库。
+    """
+    if factor not in FACTORS:
+        raise ValueError(f"未知的比较因素: {factor}，可选值: {', '.join(FACTORS)}")
+    if correction not in CORRECTIONS:
+        raise ValueError(f"未知的校正方法: {correction}，可选值: {', '.join(CORRECTIONS)}")
+    fixed = FACTORS[factor]
+    family_keys = ["model", "questionnaire", "category", fixed]
+    columns = family_keys + ["factor", "level_a", "level_b", "n_items", "category_scale", "mean_a", "mean_b", "diff",
+                             "ci_low", "ci_high", "cohen_dz", "p_permutation", "p_paired_t", "p_adjusted", "significant"]
+
+    # (维度分组, 题号) × 水平 的宽表，每格为该题在该水平下各次施测的均值
+    wide = keyed.pivot_table(index=family_keys + ["question_id"], columns=factor, values="value", aggfunc="mean")
+    scales = keyed.groupby(family_keys, sort=False)["category_scale"].first()
+    records = []
+    differences = []
+    for family, table in wide.groupby(level=family_keys, sort=True):
+        levels = [level for level in table.columns if table[level].notna().any()]
+        scale = scales[family]
+        for level_a, level_b in combinations(levels, 2):
+            pair = table[[level_a, level_b]].dropna().to_numpy(dtype=np.float64)
+            if len(pair) == 0:
+                continue
+            # 乘以换算系数后，均值和分差都在维度分数的尺度上；p 值和 d_z 不受影响
+            pair = pair * scale
+            records.append(dict(zip(family_keys, family), factor=factor, level_a=level_a, level_b=level_b,
+                                n_items=len(pair), category_scale=scale,
+                                mean_a=pair[:, 0].mean(), mean_b=pair[:, 1].mean()))
+            differences.append(pair[:, 0] - pair[:, 1])
+    if not records:
+        return pd.DataFrame(columns=columns)
+
+    n_items = np.array([len(d) for d in differences], dtype=np.int64)
+    diff = np.array([d.mean() for d in differences])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sd = np.array([d.std(ddof=1) if len(d) > 1 else np.nan for d in differences])
+        cohen_dz = diff / sd
+        # 配对 t 检验（自由度为题目数 - 1）
+        t_stat = diff / (sd / np.sqrt(n_items))
+        p_paired_t = 2 * stats.t.sf(np.abs(t_stat), n_items - 1)
+
+    # 同一维度各对比的题目数通常相同：按题目数分组后整组一次重抽样
+    rng = np.random.default_rng(seed)
+    p_permutation = np.full(len(records), np.nan)
+    ci_low = np.full(len(records), np.nan)
+    ci_high = np.full(len(records), np.nan)
+    for size in np.unique(n_items):
+        members = np.flatnonzero(n_items == size)
+        chunk = max(1, _CHUNK_ELEMENTS // n_resamples)
+        for start in range(0, len(members), chunk):
+            block = members[start:start + chunk]
+            p_permutation[block], ci_low[block], ci_high[block] = _resample_bucket(
+                np.stack([differences[index] for index in block]), n_resamples, alpha, rng
+            )
+
+    table = pd.DataFrame.from_records(records)
+    table["diff"] = diff
+    table["ci_low"], table["ci_high"] = ci_low, ci_high
+    table["cohen_dz"] = cohen_dz
+    table["p_permutation"] = p_permutation
+    table["p_paired_t"] = p_paired_t
+    table["p_adjusted"] = table.groupby(family_keys, sort=False)["p_permutation"].transform(
+        lambda p: adjust_pvalues(p.to_numpy(), correction)
+    )
+    table["significant"] = table["p_adjusted"] < alpha
+    return table[columns]
+
+
+def _load_alpha(config_path: str) -> float:
+    """从配置文件读取 significance_level，读取失败时使用 0.05"""
+    if not os.path.exists(config_path):
+        return 0.05
+    try:
+        from config_loader import load_config
+        _, testing_config = load_config(config_path)
+        return testing_config.base.significance_level
+    except Exception as e:
+        print(f"读取显著性水平失败，使用 0.05: {str(e)}")
+        return 0.05
+
+
+def main(argv: Optional[List[str]] = None):
+    from scoring import items_from_catalog, items_from_tree
+
+    parser = argparse.ArgumentParser(description="比较不同语言或角色下的维度分数")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--db", help="从结果索引读取（例如 results/catalog.sqlite）")
+    source.add_argument("--root", default="results", help="扫描结果目录读取（默认 results）")
+    parser.add_argument("--factor", choices=list(FACTORS), default="language", help="比较的因素（默认 language）")
+    parser.add_argument("--questionnaires", default="questionnaires_en.json", help="问卷定义文件")
+    parser.add_argument("--config", default="config.yaml", help="读取 significance_level 的配置文件")
+    parser.add_argument("--alpha", type=float, help="显著性水平（默认取配置文件中的 significance_level）")
+    parser.add_argument("--resamples", type=int, default=2000, help="置换/bootstrap 重抽样次数")
+    parser.add_argument("--correction", choices=list(CORRECTIONS), default="holm", help="多重比较校正方法")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--significant-only", action="store_true", help="只输出校正后显著的对比")
+    parser.add_argument("-o", "--output", help="输出 CSV 路径（默认打印）")
+    for key in ("setting", "language", "model", "questionnaire"):
+        parser.add_argument(f"--{key}", action="append", help=f"按 {key} 过滤（仅 --db），可重复指定")
+    args = parser.parse_args(argv)
+
+    alpha = args.alpha if args.alpha is not None else _load_alpha(args.config)
+    questionnaires = load_questionnaire_definitions(args.questionnaires)
+    started = time.perf_counter()
+    if args.db:
+        from results_catalog import ResultsCatalog
+        catalog = ResultsCatalog(args.db)
+        items = items_from_catalog(catalog, setting=args.setting, language=args.language,
+                                   model=args.model, questionnaire=args.questionnaire)
+        catalog.close()
+    else:
+        items = items_from_tree(args.root)
+    table = compare_levels(keyed_items(items, questionnaires), factor=args.factor, alpha=alpha,
+                           n_resamples=args.resamples, correction=args.correction, seed=args.seed)
+    elapsed = time.perf_counter() - started
+    if args.significant_only:
+        table = table[table["significant"]]
+
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"检验结果已保存至: {args.output}")
+    else:
+        print(table.to_string(index=False))
+    print(f"\n共 {len(table)} 个对比 (alpha={alpha}, {args.correction} 校正), 耗时 {elapsed:.2f} s")
+    print("按题号配对检验：观测单位为同一道题在两个水平下的分差（各次施测先取均值），结论仅适用于这些题目；"
+          "均值和分差已换算为维度分数（SUM 维度乘以 category_scale）")
+
+
+if __name__ == "__main__":
+    main()
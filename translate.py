@@ -1,122 +1,287 @@
-import httpx
+import math
 import uuid
 import time
-from typing import Dict, Optional
-from openai import OpenAI
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
 
-def translate_MS(text: str, origin: str = "en", target: str = "zh", 
-             translator_config: dict = None, max_retries: int = 3) -> Optional[str]:
-    """翻译单个文本"""
-    if not translator_config:
-        raise ValueError("未提供翻译器配置")
-    
-    endpoint = "https://api.cognitive.microsofttranslator.com"
-    path = '/translate'
-    constructed_url = endpoint + path
-    
-    params = {
-        'api-version': '3.0',  # 使用固定的 API 版本
-        'from': origin,
-        'to': target  # 只翻译成一种目标语言
-    }
-    
+from client_registry import load_backend
+from rate_limiter import (RETRY_AFTER_MAX, ProviderRateLimiter, get_rate_limiter, is_auth_error, is_transient_error,
+                          retry_after_seconds)
+
+if TYPE_CHECKING:
+    import httpx
+
+# Translator v3 单次请求的限制：数组最多 1000 个元素，全部文本（乘以目标语言数计算）不超过 50000 字符
+DEFAULT_ENDPOINT = "https://api.cognitive.microsofttranslator.com"
+MAX_ELEMENTS_PER_REQUEST = 1000
+MAX_CHARS_PER_REQUEST = 50000
+# 为了并发而拆分批次时，每个请求至少包含的元素数
+MIN_ELEMENTS_PER_REQUEST = 50
+# 请求内容有误（单条文本有问题、请求过大）的状态码：拆分批次后重发可以定位出错的元素
+CONTENT_ERROR_STATUS_CODES = {400, 413}
+
+
+def _is_content_error(exc: BaseException) -> bool:
+    """请求内容导致的错误（400 / 413，或返回的结果数与请求不一致），只有这类错误值得拆分批次"""
+    if isinstance(exc, ValueError):
+        return True
+    return getattr(getattr(exc, "response", None), "status_code", None) in CONTENT_ERROR_STATUS_CODES
+
+
+def _translator_request(translator_config: dict, origin: str, targets: List[str]):
+    """返回 (url, params, headers)"""
+    url = translator_config.get("endpoint", DEFAULT_ENDPOINT).rstrip("/") + "/translate"
+    # 多个目标语言以重复的 to 参数传入，一次请求返回所有语言的译文
+    params = [("api-version", str(translator_config.get("api_version", "3.0"))), ("from", origin)]
+    params += [("to", target) for target in targets]
     headers = {
         'Ocp-Apim-Subscription-Key': translator_config["key"],
         'Ocp-Apim-Subscription-Region': translator_config["region"],
         'Content-type': 'application/json',
         'X-ClientTraceId': str(uuid.uuid4())
     }
-    
-    body = [{
-        'text': text
-    }]
-    
+    return url, params, headers
+
+
+def pack_batches(texts: List[str], target_count: int = 1,
+                 max_elements: int = MAX_ELEMENTS_PER_REQUEST, max_chars: int = MAX_CHARS_PER_REQUEST) -> List[List[int]]:
+    """按元素数和字符数限制把文本下标依次装入请求；单条超长的文本单独成一个请求"""
+    batches = []
+    current = []
+    current_chars = 0
+    for index, text in enumerate(texts):
+        chars = len(text) * max(1, target_count)
+        if current and (len(current) >= max_elements or current_chars + chars > max_chars):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(index)
+        current_chars += chars
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _post_batch(client: "httpx.Client", texts: List[str], origin: str, targets: List[str],
+                translator_config: dict, max_retries: int, delay: float,
+                limiter: Optional[ProviderRateLimiter] = None) -> list:
+    """发送一个批次，临时错误按 delay（或 Retry-After）重试；重试用尽或遇到非临时错误时抛出最后一次的异常"""
+    chars = sum(len(text) for text in texts) * len(targets)
     for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.acquire(chars)
+        url, params, headers = _translator_request(translator_config, origin, targets)
         try:
-            response = httpx.post(constructed_url, params=params, headers=headers, json=body)
+            response = client.post(url, params=params, headers=headers, json=[{'text': text} for text in texts])
             response.raise_for_status()
-            # 由于只翻译一种语言，直接返回第一个翻译结果
-            return response.json()[0]["translations"][0]["text"]
+            results = response.json()
+            if not isinstance(results, list) or len(results) != len(texts):
+                raise ValueError(f"返回的结果数 {len(results) if isinstance(results, list) else '?'} 与请求的文本数 {len(texts)} 不一致")
+            return results
         except Exception as e:
-            print(f"翻译失败，尝试第 {attempt + 1} 次: {str(e)}")
-            if attempt == max_retries - 1:
-                print(f"翻译失败: {str(e)}")
-                return None
-            time.sleep(1)
+            print(f"批量翻译失败（{len(texts)} 条），尝试第 {attempt + 1} 次: {str(e)}")
+            # 非临时错误（400、401 等）重试无用，交给调用方决定拆分批次还是放弃
+            if attempt == max_retries - 1 or not is_transient_error(e):
+                raise
+            if limiter is not None:
+                # 429 时暂停所有并发请求，而不只是当前这一个
+                limiter.observe_error(e)
+            retry_after = retry_after_seconds(e)
+            time.sleep(min(retry_after, RETRY_AFTER_MAX) if retry_after is not None else delay)
+
+
+def translate_batch_MS(texts: List[str], origin: str = "en", targets: List[str] = ("zh",),
+                       translator_config: dict = None, max_retries: int = 3, delay: float = 1.0,
+                       client: Optional["httpx.Client"] = None, concurrency: int = 1,
+                       limiter: Optional[ProviderRateLimiter] = None) -> Dict[str, List[Optional[str]]]:
+    """批量翻译：多条文本、多个目标语言合并为尽量少的请求，最多 concurrency 个请求同时进行
+
+    返回 {目标语言: 与 texts 顺序一致的译文列表}，翻译失败的元素为 None；结果按下标写回，与完成顺序无关。
+    批次因请求内容出错（400 / 413 / 结果数不一致）时拆成两半分别重发，只有真正出错的元素记为失败；
+    遇到认证/权限错误（401 / 403，例如密钥或区域错误）时不再发送其余批次。
+    """
+    if not translator_config:
+        raise ValueError("未提供翻译器配置")
+    targets = list(targets)
+    translations = {target: [None] * len(texts) for target in targets}
+    if not texts or not targets:
+        return translations
+
+    concurrency = max(1, concurrency)
+    owns_client = client is None
+    if owns_client:
+        httpx = load_backend("httpx")
+        client = httpx.Client(timeout=translator_config.get("timeout", 30),
+                              limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+    # 文本较少时也拆成至少 concurrency 个批次，让并发生效
+    max_elements = min(MAX_ELEMENTS_PER_REQUEST, max(MIN_ELEMENTS_PER_REQUEST, math.ceil(len(texts) / concurrency)))
+    auth_error = None
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            def submit(batch):
+                return executor.submit(_post_batch, client, [texts[i] for i in batch], origin, targets,
+                                       translator_config, max_retries, delay, limiter)
+
+            running = {submit(batch): batch for batch in pack_batches(texts, len(targets), max_elements)}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = running.pop(future)
+                    if future.cancelled():
+                        continue
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        if is_auth_error(e):
+                            if auth_error is None:
+                                auth_error = e
+                                # 还没开始的批次直接取消，已在发送的批次照常收尾
+                                for pending in running:
+                                    pending.cancel()
+                        elif auth_error is None and len(batch) > 1 and _is_content_error(e):
+                            middle = len(batch) // 2
+                            for half in (batch[:middle], batch[middle:]):
+                                running[submit(half)] = half
+                        else:
+                            print(f"翻译失败（{len(batch)} 条）: {texts[batch[0]][:50]}")
+                        continue
+                    for index, result in zip(batch, results):
+                        # 逐元素检查：个别元素缺少某个语言的译文时只影响该元素
+                        for translation in (result or {}).get("translations", []):
+                            if translation.get("to") in translations and translation.get("text"):
+                                translations[translation["to"]][index] = translation["text"]
+    finally:
+        if owns_client:
+            client.close()
+    if auth_error is not None:
+        print(f"翻译服务认证失败，已停止其余翻译请求（请检查 azure_translator 的 key / region）: {str(auth_error)}")
+    return translations
+
+
+def translate_MS(text: str, origin: str = "en", target: str = "zh",
+             translator_config: dict = None, max_retries: int = 3) -> Optional[str]:
+    """翻译单个文本"""
+    return translate_batch_MS([text], origin, [target], translator_config, max_retries)[target][0]
+
+
+def _translate_with_memory(texts: List[str], targets: List[str], translate, memory) -> Dict[str, List[Optional[str]]]:
+    """先查翻译记忆，只把缺失的 (文本, 目标语言) 发给翻译服务，新译文写回记忆"""
+    translations = memory.lookup(texts, "en", targets)
+    # 按缺失的目标语言组合分组，同组文本仍在同一批请求中翻译成多种语言
+    groups: Dict[tuple, List[int]] = {}
+    for index in range(len(texts)):
+        missing = tuple(target for target in targets if translations[target][index] is None)
+        if missing:
+            groups.setdefault(missing, []).append(index)
+
+    for missing, indexes in groups.items():
+        group_texts = [texts[index] for index in indexes]
+        fresh = translate(group_texts, list(missing))
+        for target in missing:
+            memory.store(group_texts, "en", target, fresh[target])
+            for index, translation in zip(indexes, fresh[target]):
+                translations[target][index] = translation
+    requested = sum(len(indexes) for indexes in groups.values())
+    print(f"翻译记忆: {len(texts) - requested} 条文本全部命中，{requested} 条需要请求翻译服务")
+    return translations
+
+
+def translate_texts(texts: List[str], target_langs: List[str], translator_config: dict, retry_count: int = 3,
+                    delay: float = 1.0, memory=None, concurrency: int = 1,
+                    rate_limit: Optional[dict] = None) -> Dict[str, List[Optional[str]]]:
+    """把一组（已去重的）英文文本翻译成多种语言，返回 {语言: 与 texts 顺序一致的译文}，en 不请求翻译服务
+
+    各批次共用一个 httpx.Client 并发发送（最多 concurrency 个），按 rate_limit 的
+    rpm / chars_per_minute 限流；提供 memory（TranslationMemory）时已有译文直接复用。
+    """
+    remote_langs = [lang for lang in target_langs if lang != 'en']
+    if not remote_langs or not texts:
+        return {lang: [None] * len(texts) for lang in remote_langs}
+
+    rate_limit = rate_limit or {}
+    limiter = get_rate_limiter("AzureTranslator", {"rpm": rate_limit.get("rpm"), "tpm": rate_limit.get("chars_per_minute")})
+    concurrency = max(1, concurrency)
+    httpx = load_backend("httpx")
+    with httpx.Client(timeout=translator_config.get("timeout", 30),
+                      limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)) as client:
+        def translate(batch_texts, targets):
+            return translate_batch_MS(batch_texts, "en", targets, translator_config, max_retries=retry_count,
+                                      delay=delay, client=client, concurrency=concurrency, limiter=limiter)
+
+        if memory is not None:
+            return _translate_with_memory(texts, remote_langs, translate, memory)
+        return translate(texts, remote_langs)
+
+
+def translate_questionnaires(source_questionnaires: Dict, target_langs: List[str], translator_config: dict,
+                             retry_count: int = 3, delay: float = 1.0, memory=None, concurrency: int = 1,
+                             rate_limit: Optional[dict] = None,
+                             failures: Optional[Dict[str, Set[str]]] = None) -> Dict[str, Dict]:
+    """把所有问卷一次翻译成全部目标语言，返回 {语言: {问卷名: 翻译后的问卷}}
+
+    所有问卷的 inner_setting、prompt 和题目合并去重后批量请求，各目标语言在同一请求中翻译（见 translate_texts）。
+    翻译失败的文本使用原文；结果的顺序与问卷、题目的原始顺序一致。
+    提供 failures 时，把含有翻译失败文本的问卷名按语言记入其中（{语言: {问卷名}}）。
+    """
+    remote_langs = [lang for lang in target_langs if lang != 'en']
+    print(f"开始翻译至 {', '.join(target_langs)}...")
+
+    # 收集需要翻译的文本（相同文本只翻译一次，例如各问卷共用的 inner_setting）
+    texts = []
+    text_index = {}
+    occurrences = 0
+    for questionnaire in source_questionnaires.values():
+        for text in [questionnaire['inner_setting'], questionnaire['prompt']] + list(questionnaire["questions"].values()):
+            if not text:
+                continue
+            occurrences += 1
+            if text not in text_index:
+                text_index[text] = len(texts)
+                texts.append(text)
+
+    started = time.perf_counter()
+    translations = {}
+    if remote_langs:
+        if memory is not None:
+            memory.count_duplicates((occurrences - len(texts)) * len(remote_langs))
+        translations = translate_texts(texts, remote_langs, translator_config, retry_count, delay, memory,
+                                       concurrency, rate_limit)
+        print(f"翻译 {len(texts)} 条文本（去重前 {occurrences} 条）至 {len(remote_langs)} 种语言，"
+              f"耗时 {time.perf_counter() - started:.2f}s")
+
+    result = {}
+    for lang in target_langs:
+        lang_translations = translations.get(lang)
+
+        def translated(text, label):
+            if not text or lang_translations is None:
+                return text
+            value = lang_translations[text_index[text]]
+            if value is None:
+                print(f"{label}翻译失败，使用原文")
+                if failures is not None:
+                    failures.setdefault(lang, set()).add(name)
+                return text
+            return value
+
+        translated_questionnaires = {}
+        for name, questionnaire in source_questionnaires.items():
+            translated_questionnaire = questionnaire.copy()
+            translated_questionnaire['inner_setting'] = translated(questionnaire['inner_setting'], f"[{lang}] {name} inner_setting ")
+            translated_questionnaire['prompt'] = translated(questionnaire['prompt'], f"[{lang}] {name} prompt ")
+            translated_questionnaire["questions"] = {
+                q_id: translated(question, f"[{lang}] {name} 问题 {q_id} ")
+                for q_id, question in questionnaire["questions"].items()
+            }
+            translated_questionnaires[name] = translated_questionnaire
+        result[lang] = translated_questionnaires
+    return result
 
 
-def translate_questionnaire(source_questionnaires: Dict, target_lang: str, 
+def translate_questionnaire(source_questionnaires: Dict, target_lang: str,
                           translator_config: dict) -> Dict:
     """翻译整个问卷"""
-    print(f"开始翻译至 {target_lang}...")
-    translated_questionnaires = {}
-    
-    for name, questionnaire in source_questionnaires.items():
-        print(f"翻译模块处理问卷: {name}")
-        translated_questionnaire = questionnaire.copy()
-        #time.sleep(10)
-        
-
-        #在这里添加翻译translated_questionnaire['inner_setting']和translated_questionnaire['prompt']
-        inner_setting = translated_questionnaire['inner_setting']
-
-        if(target_lang != 'en'):
-            translated_inner_setting = translate_MS(
-                    text=inner_setting,
-                    target=target_lang,
-                    translator_config=translator_config
-                )
-        else:
-            translated_inner_setting = inner_setting
-                #time.sleep(10)
-        if translated_inner_setting:
-            translated_questionnaire['inner_setting'] = translated_inner_setting
-            print("翻译后的inner_type为",translated_inner_setting)
-        else:
-            print(f"inner_setting为default")
-            translated_questionnaire['inner_setting'] = inner_setting
-
-
-        prompt = translated_questionnaire['prompt']
-        if(target_lang != 'en'):
-            translated_prompt = translate_MS(
-                    text=prompt,
-                    target=target_lang,
-                    translator_config=translator_config
-                )
-        else:
-            translated_prompt = prompt
-                #time.sleep(10)
-        if translated_prompt:
-            translated_questionnaire['prompt'] = translated_prompt
-            print("翻译后的prompt为",translated_prompt)
-        else:
-            print(f"prompt翻译失败，使用原文")
-            translated_questionnaire['prompt'] = prompt
-
-
-        # 翻译问题
-        translated_questions = {}
-        for q_id, question in questionnaire["questions"].items():
-            if(target_lang != 'en'):
-                translated_text = translate_MS(
-                    text=question,
-                    target=target_lang,
-                    translator_config=translator_config
-                )
-            else:
-                translated_text = question
-            #time.sleep(10)
-            if translated_text:
-                translated_questions[q_id] = translated_text
-            else:
-                print(f"问题 {q_id} 翻译失败，使用原文")
-                translated_questions[q_id] = question
-        
-        translated_questionnaire["questions"] = translated_questions
-        translated_questionnaires[name] = translated_questionnaire
-    
-    return translated_questionnaires
+    return translate_questionnaires(source_questionnaires, [target_lang], translator_config)[target_lang]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class TranslationMemory:
+    """翻译记忆：按 (原文哈希, 源语言, 目标语言, 翻译器版本) 持久化译文
+
+    重新生成问卷时只有新增或修改过的文本需要请求翻译服务；更换翻译器或 API 版本时
+    修改 translator_version 即可让旧译文失效。
+    """
+    def __init__(self, path: str = ".cache/translation_memory.sqlite", translator_version: str = "azure-3.0"):
+        self.path = path
+        self.translator_version = translator_version
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, text_hash TEXT, source_lang TEXT, target_lang TEXT, translator_version TEXT, "
+            "source_text TEXT, translation TEXT, created REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(text_hash: str, source_lang: str, target_lang: str, translator_version: str) -> str:
+        return "\x1f".join([text_hash, source_lang, target_lang, translator_version])
+
+    def count_duplicates(self, count: int):
+        """记录本次运行中在请求前就被合并掉的重复文本数"""
+        with self._lock:
+            self.deduplicated += count
+
+    def lookup(self, texts: List[str], source_lang: str, target_langs: Iterable[str]) -> Dict[str, List[Optional[str]]]:
+        """批量查询，返回 {目标语言: 与 texts 顺序一致的译文}，未命中为 None"""
+        hashes = [self.text_hash(text) for text in texts]
+        results = {}
+        with self._lock:
+            for target_lang in target_langs:
+                keys = [self.make_key(text_hash, source_lang, target_lang, self.translator_version) for text_hash in hashes]
+                found = {}
+                # SQLite 单条语句的参数个数有限，分块查询
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows = self._conn.execute(
+                        f"SELECT key, translation FROM translations WHERE key IN ({', '.join('?' for _ in chunk)})", chunk
+                    ).fetchall()
+                    found.update(rows)
+                translations = [found.get(key) for key in keys]
+                hit_count = sum(1 for translation in translations if translation is not None)
+                self.hits += hit_count
+                self.misses += len(keys) - hit_count
+                results[target_lang] = translations
+        return results
+
+    def store(self, texts: List[str], source_lang: str, target_lang: str, translations: List[Optional[str]]):
+        """写入一批译文，None（翻译失败）不写入"""
+        now = time.time()
+        rows = []
+        for text, translation in zip(texts, translations):
+            if translation is None:
+                continue
+            text_hash = self.text_hash(text)
+            rows.append((self.make_key(text_hash, source_lang, target_lang, self.translator_version), text_hash,
+                         source_lang, target_lang, self.translator_version, text, translation, now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (key, text_hash, source_lang, target_lang, translator_version, "
+                "source_text, translation, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def export_jsonl(self, path: str, translator_version: Optional[str] = None) -> int:
+        """导出为 JSONL（每行一条：source_lang / target_lang / translator_version / source / translation），返回条数"""
+        sql = "SELECT source_lang, target_lang, translator_version, source_text, translation FROM translations"
+        params = []
+        if translator_version:
+            sql += " WHERE translator_version = ?"
+            params.append(translator_version)
+        sql += " ORDER BY target_lang, source_text"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        with open(path, "w", encoding="utf-8") as f:
+            for source_lang, target_lang, version, source_text, translation in rows:
+                f.write(json.dumps({"source_lang": source_lang, "target_lang": target_lang, "translator_version": version,
+                                    "source": source_text, "translation": translation}, ensure_ascii=False) + "\n")
+        return len(rows)
+
+    def import_jsonl(self, path: str) -> int:
+        """导入 export_jsonl 导出的文件（人工校对过的译文也可以用这种格式导入），返回条数"""
+        rows = []
+        now = time.time()
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    text_hash = self.text_hash(record["source"])
+                    version = record.get("translator_version") or self.translator_version
+                    rows.append((self.make_key(text_hash, record["source_lang"], record["target_lang"], version), text_hash,
+                                 record["source_lang"], record["target_lang"], version, record["source"],
+                                 record["translation"], now))
+                except (json.JSONDecodeError, KeyError) as e:
+                    print(f"跳过无效的记录: {path} 第 {line_number + 1} 行: {str(e)}")
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (key, text_hash, source_lang, target_lang, translator_version, "
+                "source_text, translation, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "hit_rate": (self.hits / total) if total > 0 else 0.0
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (f"翻译记忆统计: 命中 {stats['hits']} 条, 未命中 {stats['misses']} 条, 运行内去重 {stats['deduplicated']} 条, "
+                f"命中率 {stats['hit_rate'] * 100:.2f}%, 共 {stats['entries']} 条记录")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_memory = None
+
+
+def init_translation_memory(memory_config: dict = None) -> Optional[TranslationMemory]:
+    """按 translation.memory 配置创建本次运行使用的翻译记忆，未启用时返回 None"""
+    global _memory
+    if _memory is not None:
+        _memory.close()
+        _memory = None
+    memory_config = dict(memory_config or {})
+    if not memory_config.pop("enabled", False):
+        return None
+    _memory = TranslationMemory(**memory_config)
+    return _memory
+
+
+def get_translation_memory() -> Optional[TranslationMemory]:
+    return _memory
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="翻译记忆工具")
+    parser.add_argument("--db", default=".cache/translation_memory.sqlite", help="翻译记忆数据库路径")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="导出为 JSONL")
+    export_parser.add_argument("path", help="输出文件")
+    export_parser.add_argument("--translator-version", help="只导出指定翻译器版本的记录")
+    import_parser = subparsers.add_parser("import", help="从 JSONL 导入")
+    import_parser.add_argument("path", help="输入文件")
+    subparsers.add_parser("stats", help="显示记录数")
+    args = parser.parse_args(argv)
+
+    memory = TranslationMemory(args.db)
+    if args.command == "export":
+        print(f"已导出 {memory.export_jsonl(args.path, args.translator_version)} 条记录至: {args.path}")
+    elif args.command == "import":
+        print(f"已导入 {memory.import_jsonl(args.path)} 条记录")
+    elif args.command == "stats":
+        print(f"共 {memory.stats()['entries']} 条记录: {args.db}")
+    memory.close()
+
+
+if __name__ == "__main__":
+    main()